@@ -0,0 +1,286 @@
+"""Asyncio version of the Controller.
+
+The backends are blocking (sqlite3, SQLAlchemy), so AsyncModel runs every Model
+call in a thread pool and exposes it as a coroutine. AsyncController awaits
+those coroutines, renders the View off the event loop and caps the number of
+requests that are in flight at the same time, so one slow read_items doesn't
+block every other request served by the same loop.
+"""
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import mvc_exceptions as mvc_exc
+import mvc_mock_objects as mock
+from model_view_controller import ModelBasic, View
+
+
+class ThreadLocalModel(object):
+    """A Model for each thread, e.g. a sqlite3 connection for each thread.
+
+    A sqlite3 connection must not be used by two threads at the same time, so
+    the calls to a single ModelSQLite run one after the other, and a slow
+    read_items holds up every request behind it. A ThreadLocalModel creates a
+    Model (and so a connection) in each thread that uses it, the first time
+    it does, so the worker threads of an AsyncModel run their calls in
+    parallel.
+
+    Parameters
+    ----------
+    factory : callable
+        returns a new Model, e.g. lambda: ModelSQLite([], connection=
+        sqlite_backend.connect_to_db(db)). The Models must share their data,
+        so db can't be an in-memory database.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._item_type = None
+
+    @property
+    def model(self):
+        """The Model of the calling thread."""
+        model = getattr(self._local, "model", None)
+        if model is None:
+            model = self._local.model = self._factory()
+        if self._item_type is not None and model.item_type != self._item_type:
+            model.item_type = self._item_type
+        return model
+
+    @property
+    def item_type(self):
+        if self._item_type is None:
+            return self.model.item_type
+        return self._item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        # the Model of each thread switches on its next call
+        self._item_type = new_item_type
+
+    def __getattr__(self, name):
+        # a method of the Model, looked up when it's called and not now: an
+        # AsyncModel gets it in the loop thread and calls it in a worker
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return getattr(self.model, name)(*args, **kwargs)
+
+        return call
+
+
+class AsyncModel(object):
+    """Coroutine interface on top of a (blocking) Model.
+
+    Parameters
+    ----------
+    model : Model or ThreadLocalModel
+    executor : concurrent.futures.Executor or None
+        where the blocking Model calls run. If None, use a pool of max_workers
+        threads.
+    max_workers : int or None
+        threads of the default executor. If None, 1 for a Model, since most
+        backends (e.g. a sqlite3 connection) must not be used by two threads
+        at the same time, and 8 for a ThreadLocalModel, whose threads have a
+        Model each. A ModelSQLite used by a single thread here needs a
+        connection opened with check_same_thread=False.
+    """
+
+    def __init__(self, model, executor=None, max_workers=None):
+        self._model = model
+        if executor is None:
+            if max_workers is None:
+                max_workers = 8 if isinstance(model, ThreadLocalModel) else 1
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._executor = executor
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def item_type(self):
+        return self._model.item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        self._model.item_type = new_item_type
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args)
+        )
+
+    async def create_item(self, name, price, quantity):
+        await self._run(self._model.create_item, name, price, quantity)
+
+    async def create_items(self, items):
+        await self._run(self._model.create_items, items)
+
+    async def read_item(self, name):
+        return await self._run(self._model.read_item, name)
+
+    async def read_items(self):
+        return await self._run(self._model.read_items)
+
+    async def read_many(self, names):
+        return await self._run(self._model.read_many, names)
+
+    async def search(self, query, limit=10):
+        return await self._run(self._model.search, query, limit)
+
+    async def update_item(self, name, price, quantity):
+        await self._run(self._model.update_item, name, price, quantity)
+
+    async def delete_item(self, name):
+        await self._run(self._model.delete_item, name)
+
+    async def update_items(self, items):
+        await self._run(self._model.update_items, items)
+
+    async def delete_items(self, names):
+        await self._run(self._model.delete_items, names)
+
+    async def aggregate(self, low_stock=None):
+        return await self._run(self._model.aggregate, low_stock)
+
+    async def count(self, low_stock=None):
+        return await self._run(self._model.count, low_stock)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncController(object):
+    """Coroutine counterpart of model_view_controller.Controller.
+
+    Parameters
+    ----------
+    model : AsyncModel
+    view : View
+    max_concurrency : int
+        maximum number of requests handled at the same time. Further requests
+        wait for a slot.
+    render_executor : concurrent.futures.Executor or None
+        where the View renders. If None, use a pool with a single thread, so
+        messages reach the View's sink in the order they were rendered.
+    """
+
+    def __init__(self, model, view, max_concurrency=100, render_executor=None):
+        self.model = model
+        self.view = view
+        self._max_concurrency = max_concurrency
+        # event loop -> Semaphore, since a Semaphore is bound to the first loop
+        # that waits on it (e.g. each asyncio.run starts a new one)
+        self._semaphores = weakref.WeakKeyDictionary()
+        if render_executor is None:
+            render_executor = ThreadPoolExecutor(max_workers=1)
+        self._render_executor = render_executor
+
+    @property
+    def slots(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _render(self, func, *args):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._render_executor, functools.partial(func, *args)
+        )
+
+    async def show_items(self, bullet_points=False):
+        async with self.slots:
+            items = await self.model.read_items()
+            item_type = self.model.item_type
+            if bullet_points:
+                await self._render(self.view.show_bullet_point_list, item_type, items)
+            else:
+                await self._render(self.view.show_number_point_list, item_type, items)
+
+    async def show_item(self, item_name):
+        async with self.slots:
+            try:
+                item = await self.model.read_item(item_name)
+                item_type = self.model.item_type
+                await self._render(self.view.show_item, item_type, item_name, item)
+            except mvc_exc.ItemNotStored as e:
+                await self._render(self.view.display_missing_item_error, item_name, e)
+
+    async def insert_item(self, name, price, quantity):
+        assert price > 0, "price must be greater than 0"
+        assert quantity >= 0, "quantity must be greater than or equal to 0"
+        async with self.slots:
+            item_type = self.model.item_type
+            try:
+                await self.model.create_item(name, price, quantity)
+                await self._render(self.view.display_item_stored, name, item_type)
+            except mvc_exc.ItemAlreadyStored as e:
+                await self._render(
+                    self.view.display_item_already_stored_error, name, item_type, e
+                )
+
+    async def update_item(self, name, price, quantity):
+        assert price > 0, "price must be greater than 0"
+        assert quantity >= 0, "quantity must be greater than or equal to 0"
+        async with self.slots:
+            item_type = self.model.item_type
+            try:
+                older = await self.model.read_item(name)
+                await self.model.update_item(name, price, quantity)
+                await self._render(
+                    self.view.display_item_updated,
+                    name,
+                    older["price"],
+                    older["quantity"],
+                    price,
+                    quantity,
+                )
+            except mvc_exc.ItemNotStored as e:
+                await self._render(
+                    self.view.display_item_not_yet_stored_error, name, item_type, e
+                )
+
+    async def delete_item(self, name):
+        async with self.slots:
+            item_type = self.model.item_type
+            try:
+                await self.model.delete_item(name)
+                await self._render(self.view.display_item_deletion, name)
+            except mvc_exc.ItemNotStored as e:
+                await self._render(
+                    self.view.display_item_not_yet_stored_error, name, item_type, e
+                )
+
+    def close(self):
+        self._render_executor.shutdown(wait=True)
+
+
+async def main():
+
+    model = AsyncModel(ModelBasic(mock.items()))
+    c = AsyncController(model, View(), max_concurrency=2)
+
+    # these requests run concurrently, at most 2 at a time
+    await asyncio.gather(
+        c.show_item("bread"),
+        c.show_item("chocolate"),
+        c.insert_item("chocolate", price=2.0, quantity=10),
+        c.update_item("milk", price=1.2, quantity=20),
+        c.delete_item("fish"),
+    )
+    await c.show_items()
+
+    c.close()
+    model.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,64 @@
+import re
+from bisect import bisect_left, insort
 import mvc_exceptions as mvc_exc
 import mvc_mock_objects as mock
 
 items = list()
 
+# prefix index for search(): sorted (token, name, words, item) tuples, one for
+# each distinct word of each name. words is " word1 word2 ", so that a term is
+# a word of the name if " term " is in words, and the prefix of a word if
+# " term" is. Names are unique, so two tuples never compare equal on
+# (token, name) and the rest of the tuple is never compared.
+index = list()
+# greater than any character, so (prefix + PREFIX_END,) sorts after every word
+# that starts with prefix, and (word, PREFIX_END) after every entry of word
+PREFIX_END = "\U0010ffff"
+
+
+def tokenize(text):
+    """Lowercase words of a name or of a search query.
+
+    Underscores separate words, as in the unicode61 tokenizer of SQLite FTS5.
+    """
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+def _index_entries(item):
+    tokens = tokenize(item["name"])
+    words = " {} ".format(" ".join(tokens))
+    return [(token, item["name"], words, item) for token in set(tokens)]
+
+
+def _index_add(item):
+    global index
+    for entry in _index_entries(item):
+        insort(index, entry)
+
+
+def _index_remove(name):
+    global index
+    for token in set(tokenize(name)):
+        i = bisect_left(index, (token, name))
+        if i < len(index) and index[i][:2] == (token, name):
+            del index[i]
+
+
+def _index_replace(item):
+    # same name, so the entries keep their place: only their item changes
+    global index
+    for token in set(tokenize(item["name"])):
+        i = bisect_left(index, (token, item["name"]))
+        index[i] = index[i][:3] + (item,)
+
+
+def _index_rebuild():
+    global index
+    index = sorted(
+        (entry for x in items for entry in _index_entries(x)),
+        key=lambda entry: entry[:2],
+    )
+
 
 def create_item(name, price, quantity):
     global items
@@ -11,12 +67,15 @@ def create_item(name, price, quantity):
         raise mvc_exc.ItemAlreadyStored('"{}" already stored!'.format(name))
 
     else:
-        items.append({"name": name, "price": price, "quantity": quantity})
+        item = {"name": name, "price": price, "quantity": quantity}
+        items.append(item)
+        _index_add(item)
 
 
 def create_items(app_items):
     global items
     items = app_items
+    _index_rebuild()
 
 
 def read_item(name):
@@ -44,6 +103,8 @@ def update_item(name, price, quantity):
     if idxs_items:
         i, item_to_update = idxs_items[0][0], idxs_items[0][1]
         items[i] = {"name": name, "price": price, "quantity": quantity}
+        _index_remove(name)
+        _index_add(items[i])
     else:
         raise mvc_exc.ItemNotStored(
             "Can't update \"{}\" because it's not stored".format(name)
@@ -58,12 +119,163 @@ def delete_item(name):
     if idxs_items:
         i, item_to_delete = idxs_items[0][0], idxs_items[0][1]
         del items[i]
+        _index_remove(name)
     else:
         raise mvc_exc.ItemNotStored(
             "Can't delete \"{}\" because it's not stored".format(name)
         )
 
 
+def insert_items(app_items):
+    """Append all items, or none of them if at least one is already stored.
+
+    An item that is twice in app_items counts as already stored, as with the
+    UNIQUE constraint of the sqlite backend.
+    """
+    global items
+    stored = set(x["name"] for x in items)
+    duplicates = list()
+    for x in app_items:
+        if x["name"] in stored:
+            duplicates.append(x["name"])
+        stored.add(x["name"])
+    if duplicates:
+        raise mvc_exc.ItemAlreadyStored("{} already stored!".format(duplicates))
+
+    else:
+        for x in app_items:
+            item = {"name": x["name"], "price": x["price"], "quantity": x["quantity"]}
+            items.append(item)
+            _index_add(item)
+
+
+def update_items(app_items):
+    """Update all items in a single pass, or none of them if one is missing."""
+    global items
+    idxs = {x["name"]: i for i, x in enumerate(items)}
+    missing = [x["name"] for x in app_items if x["name"] not in idxs]
+    if missing:
+        raise mvc_exc.ItemNotStored(
+            "Can't update {} because they are not stored".format(missing)
+        )
+
+    else:
+        for x in app_items:
+            item = {"name": x["name"], "price": x["price"], "quantity": x["quantity"]}
+            items[idxs[x["name"]]] = item
+            _index_replace(item)
+
+
+def delete_items(names):
+    """Delete all items in a single pass, or none of them if one is missing."""
+    global items
+    to_delete = set(names)
+    missing = to_delete.difference(x["name"] for x in items)
+    if missing:
+        raise mvc_exc.ItemNotStored(
+            "Can't delete {} because they are not stored".format(sorted(missing))
+        )
+
+    else:
+        items = [x for x in items if x["name"] not in to_delete]
+        for name in to_delete:
+            _index_remove(name)
+
+
+def read_many(names):
+    """Read all items with the given names in a single pass.
+
+    Returns
+    -------
+    tuple
+        (list of the items found, in the order of names; list of the names
+        that are not stored)
+    """
+    global items
+    wanted = set(names)
+    found = {x["name"]: x for x in items if x["name"] in wanted}
+    names = list(dict.fromkeys(names))  # drop duplicates, keep the order
+    return (
+        [found[name] for name in names if name in found],
+        [name for name in names if name not in found],
+    )
+
+
+def search(query, limit=10):
+    """Items that match the words of the query, as typed in an autocomplete.
+
+    Every word of the query but the last one must be a word of the item name.
+    The last word can be the beginning of a word of the name. The words of the
+    query are looked up in the prefix index with a binary search, so the cost
+    depends on the number of matches, not on the number of items.
+
+    Parameters
+    ----------
+    query : str
+        one or more words, e.g. "choc" or "dark choc"
+    limit : int
+
+    Returns
+    -------
+    list
+        items, ordered by the word that matched one of the words of the query
+    """
+    global index
+    terms = tokenize(query)
+    if not terms:
+        return list()
+    # the words equal to a term, or starting with the last term, are a
+    # contiguous slice of the index. We scan the shortest slice and check the
+    # other terms on the words of its names.
+    slices = list()
+    for i, term in enumerate(terms):
+        is_prefix = i == len(terms) - 1
+        start = bisect_left(index, (term,))
+        end = (term + PREFIX_END,) if is_prefix else (term, PREFIX_END)
+        stop = bisect_left(index, end, lo=start)
+        slices.append((stop - start, start, stop, i))
+    _, start, stop, first = min(slices)
+    rest = [
+        " {}".format(term) if i == len(terms) - 1 else " {} ".format(term)
+        for i, term in enumerate(terms)
+        if i != first
+    ]
+    results, seen = list(), set()
+    for i in range(start, stop):
+        _, name, words, item = index[i]
+        if name in seen:
+            continue
+        seen.add(name)
+        if all(term in words for term in rest):
+            results.append(item)
+            if len(results) == limit:
+                break
+    return results
+
+
+def aggregate(low_stock=None):
+    """Count the items and sum their quantity and value in a single pass."""
+    global items
+    n_items, quantity, stock_value, below = 0, 0, 0.0, 0
+    for x in items:
+        n_items += 1
+        quantity += x["quantity"]
+        stock_value += x["price"] * x["quantity"]
+        if low_stock is not None and x["quantity"] < low_stock:
+            below += 1
+    result = {"count": n_items, "quantity": quantity, "stock_value": stock_value}
+    if low_stock is not None:
+        result["low_stock"] = below
+    return result
+
+
+def count(low_stock=None):
+    global items
+    if low_stock is None:
+        return len(items)
+    return sum(1 for x in items if x["quantity"] < low_stock)
+
+
 def main():
 
     # CREATE
@@ -80,6 +292,10 @@ def main():
     # print(read_item('chocolate'))
     print("READ bread")
     print(read_item("bread"))
+    print("READ bread, wine and chocolate")
+    print(read_many(["bread", "wine", "chocolate"]))
+    print("SEARCH names starting with b")
+    print(search("b"))
 
     # UPDATE
     print("UPDATE bread")
@@ -99,6 +315,22 @@ def main():
     print("READ items")
     print(read_items())
 
+    # BATCH
+    print("INSERT, UPDATE and DELETE in batch")
+    insert_items([{"name": "beer", "price": 3.0, "quantity": 15}])
+    update_items(
+        [
+            {"name": "beer", "price": 2.5, "quantity": 10},
+            {"name": "milk", "price": 1.5, "quantity": 5},
+        ]
+    )
+    delete_items(["beer", "wine"])
+    print(read_items())
+
+    # AGGREGATE
+    print("AGGREGATE with low stock below 10")
+    print(aggregate(low_stock=10))
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,536 @@
+"""Benchmarks for the MVC example.
+
+Usage:
+    python benchmarks.py <benchmark> [<benchmark> ...]
+
+Run without arguments to list the available benchmarks.
+"""
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import mvc_mock_objects as mock
+import sqlite_backend
+from async_controller import AsyncController, AsyncModel, ThreadLocalModel
+from checkpointer import Checkpointer
+from coalescing_model import AsyncCoalescingModel, CoalescingModel
+from model_stats import LatencyHistogram
+from model_view_controller import Controller, ModelBasic, ModelSQLite, View
+from sharded_model import ShardedModelSQLite
+from single_writer import SingleWriter
+
+
+def _request(c, i):
+    """Pick the i-th request of a mixed read/write workload."""
+    kind = i % 4
+    if kind == 0:
+        return c.show_item("bread")
+    elif kind == 1:
+        return c.show_item("milk")
+    elif kind == 2:
+        return c.update_item("wine", price=10.0 + i % 3, quantity=5)
+    else:
+        return c.show_items()
+
+
+def _show_item_behind_read_items(ac):
+    """Latency of a show_item that comes right after a (slow) read_items."""
+
+    async def run():
+        slow = asyncio.ensure_future(ac.model.read_items())
+        # let read_items reach the executor first
+        await asyncio.sleep(0.01)
+        t0 = time.perf_counter()
+        await ac.show_item("bread")
+        latency = time.perf_counter() - t0
+        await slow
+        return latency
+
+    return asyncio.run(run())
+
+
+def bench_async_controller(n_requests=4000, concurrency=50, n_items=200000):
+    """Load test: requests per second of Controller vs AsyncController.
+
+    The controllers serve the same mixed workload against a ModelSQLite
+    stored in a temporary file. The View writes to os.devnull.
+    AsyncController runs once with a single connection, used by one thread,
+    and once with a ThreadLocalModel, which gives each of the 8 threads of
+    the executor a connection of its own.
+
+    Then the table grows to n_items, so that read_items is slow, and we
+    measure how long a show_item waits behind it.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "loadtest")
+        connection = sqlite_backend.connect_to_db(path, check_same_thread=False)
+        # readers don't block the writer, nor the writer the readers
+        connection.execute("PRAGMA journal_mode=WAL")
+        model = ModelSQLite(mock.items(), connection=connection)
+
+        def connection_per_thread():
+            return ModelSQLite([], connection=sqlite_backend.connect_to_db(path))
+
+        with open(os.devnull, "w") as devnull:
+            view = View(devnull)
+
+            c = Controller(model, view)
+            t0 = time.perf_counter()
+            for i in range(n_requests):
+                _request(c, i)
+            elapsed = time.perf_counter() - t0
+            print(
+                "Controller:      {:>9.0f} req/s ({} requests)".format(
+                    n_requests / elapsed, n_requests
+                )
+            )
+
+            configurations = [
+                ("one connection", AsyncModel(model)),
+                (
+                    "connection per thread",
+                    AsyncModel(ThreadLocalModel(connection_per_thread)),
+                ),
+            ]
+            controllers = list()
+            for name, async_model in configurations:
+                ac = AsyncController(async_model, view, max_concurrency=concurrency)
+                controllers.append((name, ac))
+
+                async def run():
+                    await asyncio.gather(
+                        *(_request(ac, i) for i in range(n_requests))
+                    )
+
+                t0 = time.perf_counter()
+                asyncio.run(run())
+                elapsed = time.perf_counter() - t0
+                print(
+                    "AsyncController, {}: {:>9.0f} req/s "
+                    "({} requests, concurrency {})".format(
+                        name, n_requests / elapsed, n_requests, concurrency
+                    )
+                )
+
+            model.create_items(
+                {"name": "item{}".format(i), "price": 1.0, "quantity": 1}
+                for i in range(n_items)
+            )
+            for name, ac in controllers:
+                latency = _show_item_behind_read_items(ac)
+                print(
+                    "AsyncController, {}: show_item waited {:.3f} s behind "
+                    "read_items of {} items".format(name, latency, n_items)
+                )
+                ac.close()
+                ac.model.close()
+        connection.close()
+
+
+def bench_sharded_writes(n_items=4000, n_threads=8, shard_counts=(1, 2, 4, 8)):
+    """Write throughput of ShardedModelSQLite with concurrent writers.
+
+    n_threads threads insert n_items in total, one create_item at a time, so
+    every insert is a commit. With more shards, more commits run in parallel.
+    """
+    for n_shards in shard_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            model = ShardedModelSQLite(
+                [], n_shards=n_shards, db=os.path.join(tmp, "sharded")
+            )
+
+            def writer(k):
+                for i in range(k, n_items, n_threads):
+                    model.create_item("item{}".format(i), price=1.0, quantity=i)
+
+            threads = [
+                threading.Thread(target=writer, args=(k,)) for k in range(n_threads)
+            ]
+            t0 = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+            model.close()
+        print(
+            "{} shard(s): {:>9.0f} writes/s ({} threads)".format(
+                n_shards, n_items / elapsed, n_threads
+            )
+        )
+
+
+def bench_snapshot(n_items=200000, pages_per_step=(-1, 1024, 64)):
+    """Snapshot throughput, and latency of the writes made meanwhile.
+
+    A thread keeps updating items through the same connection while
+    ModelSQLite.snapshot copies the database. Copying in a single step
+    (pages_per_step=-1) blocks the writer for the whole copy; smaller steps
+    let it in between steps.
+    """
+    items = [
+        {"name": "item{}".format(i), "price": 1.0, "quantity": i}
+        for i in range(n_items)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        connection = sqlite_backend.connect_to_db(
+            os.path.join(tmp, "snapshot"), check_same_thread=False
+        )
+        model = ModelSQLite(items, connection=connection)
+        for pages in pages_per_step:
+            latency = LatencyHistogram()
+            done = threading.Event()
+
+            def writer():
+                i = 0
+                while not done.is_set():
+                    t0 = time.perf_counter()
+                    model.update_item("item{}".format(i % n_items), 2.0, i)
+                    latency.record(time.perf_counter() - t0)
+                    i += 1
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            info = model.snapshot(os.path.join(tmp, "copy.db"), pages_per_step=pages)
+            done.set()
+            thread.join()
+            print(
+                "pages_per_step={:<5} {:>6.1f} MB/s ({} steps)  "
+                "writes: {:>5}  max write latency: {:>9.0f} us".format(
+                    pages,
+                    info["throughput"] / 1e6,
+                    info["steps"],
+                    latency.count,
+                    latency.max,
+                )
+            )
+        connection.close()
+
+
+def bench_checkpoint(n_writes=2000):
+    """Write throughput of a database file vs an in-memory checkpointed one.
+
+    Every create_item is a commit. On a database file it waits for the disk,
+    with a Checkpointer only the checkpoints do.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        on_disk = ModelSQLite(
+            [], connection=sqlite_backend.connect_to_db(os.path.join(tmp, "disk"))
+        )
+        checkpointer = Checkpointer(
+            os.path.join(tmp, "checkpoint.db"), interval=1.0, max_changes=500
+        )
+        in_memory = ModelSQLite([], connection=checkpointer.connection)
+        for label, model in (("database file", on_disk), ("checkpointed", in_memory)):
+            t0 = time.perf_counter()
+            for i in range(n_writes):
+                model.create_item("item{}".format(i), price=1.0, quantity=i)
+            elapsed = time.perf_counter() - t0
+            print("{:<14} {:>9.0f} writes/s".format(label, n_writes / elapsed))
+        checkpointer.close()
+        on_disk.connection.close()
+        print("checkpoints taken: {}".format(checkpointer.checkpoints))
+
+
+def _direct_writer(db, k, n_writes, results):
+    # every process opens the database file and commits on its own
+    model = ModelSQLite([], connection=sqlite_backend.connect_to_db(db))
+    errors = 0
+    for i in range(n_writes):
+        try:
+            model.create_item("item{}_{}".format(k, i), price=1.0, quantity=i)
+        except sqlite_backend.OperationalError:
+            errors += 1
+    results.put(errors)
+
+
+def _client_writer(model, k, n_writes, results):
+    errors = 0
+    for i in range(n_writes):
+        try:
+            model.create_item("item{}_{}".format(k, i), price=1.0, quantity=i)
+        except sqlite_backend.OperationalError:
+            errors += 1
+    results.put(errors)
+
+
+def bench_single_writer(n_writes=500, process_counts=(1, 2, 4, 8)):
+    """Write throughput of processes that share a database file.
+
+    Each process inserts n_writes items, one create_item at a time. Either
+    every process writes to the database directly, or all of them send their
+    writes to a SingleWriter. The database is in WAL mode in both cases.
+    """
+    for n_processes in process_counts:
+        for label in ("direct", "single writer"):
+            with tempfile.TemporaryDirectory() as tmp:
+                db = os.path.join(tmp, "shared")
+                results = multiprocessing.Queue()
+                writer = None
+                if label == "direct":
+                    connection = sqlite_backend.connect_to_db(db)
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    sqlite_backend.create_table(connection, "product")
+                    connection.close()
+                    targets = [
+                        (_direct_writer, (db, k, n_writes, results))
+                        for k in range(n_processes)
+                    ]
+                else:
+                    writer = SingleWriter(db, n_clients=n_processes)
+                    targets = [
+                        (_client_writer, (writer.client(k), k, n_writes, results))
+                        for k in range(n_processes)
+                    ]
+                processes = [
+                    multiprocessing.Process(target=target, args=args)
+                    for target, args in targets
+                ]
+                t0 = time.perf_counter()
+                for p in processes:
+                    p.start()
+                errors = sum(results.get() for _ in processes)
+                elapsed = time.perf_counter() - t0
+                for p in processes:
+                    p.join()
+                if writer is not None:
+                    writer.close()
+            print(
+                "{} process(es), {:<13} {:>9.0f} writes/s  errors: {}".format(
+                    n_processes, label, n_processes * n_writes / elapsed, errors
+                )
+            )
+
+
+IMPORT_TIME_SCRIPT = """
+import sys, time
+t0 = time.perf_counter()
+import model_view_controller as mvc
+{}
+elapsed = time.perf_counter() - t0
+heavy = [m for m in ("dataset", "sqlalchemy", "sqlite3") if m in sys.modules]
+print(elapsed, ",".join(heavy) or "none")
+"""
+
+
+def bench_import_time(repeat=5):
+    """Import time of model_view_controller in a fresh interpreter.
+
+    Each scenario runs in a new process, so nothing is cached in sys.modules.
+    We report the best of a few runs and which heavy modules got imported.
+    """
+    scenarios = [
+        ("import only", ""),
+        ("ModelBasic", "mvc.ModelBasic(mvc.mock.items())"),
+        ("dataset_backend used", "mvc.dataset_backend.DB_name"),
+    ]
+    here = os.path.dirname(os.path.abspath(__file__))
+    for label, statement in scenarios:
+        timings = list()
+        for _ in range(repeat):
+            out = subprocess.check_output(
+                [sys.executable, "-c", IMPORT_TIME_SCRIPT.format(statement)],
+                cwd=here,
+                universal_newlines=True,
+            )
+            elapsed, heavy = out.splitlines()[-1].split()
+            timings.append(float(elapsed))
+        print(
+            "{:<22} {:>8.1f} ms  heavy modules imported: {}".format(
+                label, min(timings) * 1000, heavy
+            )
+        )
+
+
+def _search_vocabulary(n_words, seed=0):
+    """Made-up words of 2 to 4 syllables, like "bateco"."""
+    rnd = random.Random(seed)
+    syllables = [c + v for c in "bcdfglmnprst" for v in "aeiou"]
+    words = set()
+    while len(words) < n_words:
+        words.add("".join(rnd.sample(syllables, rnd.randint(2, 4))))
+    return sorted(words)
+
+
+def bench_search(n_items=1000000, n_words=5000, n_queries=2000):
+    """Latency of search (autocomplete) with and without an index.
+
+    Item names are two words out of n_words and a number, e.g. "bateco
+    lumi 42". Queries are prefixes of one or two words, as typed in an
+    autocomplete.
+    """
+    rnd = random.Random(0)
+    words = _search_vocabulary(n_words)
+    items = [
+        {
+            "name": "{} {} {}".format(rnd.choice(words), rnd.choice(words), i),
+            "price": 1.0,
+            "quantity": 1,
+        }
+        for i in range(n_items)
+    ]
+    queries = list()
+    for i in range(n_queries):
+        word, other = rnd.choice(words), rnd.choice(words)
+        if i % 2:
+            queries.append(word[: 1 + i % 5])
+        else:
+            queries.append("{} {}".format(word, other[: 1 + i % 3]))
+
+    models = [
+        ("ModelBasic (bisect)", ModelBasic(items), n_queries),
+        (
+            "ModelSQLite (FTS5)",
+            ModelSQLite(
+                items, connection=sqlite_backend.connect_to_db(), search_index=True
+            ),
+            n_queries,
+        ),
+        (
+            "ModelSQLite (scan)",
+            ModelSQLite(items, connection=sqlite_backend.connect_to_db()),
+            # a full scan of the table per query: a few queries are enough
+            10,
+        ),
+    ]
+    for label, model, n in models:
+        latency = LatencyHistogram()
+        for query in queries[:n]:
+            t0 = time.perf_counter()
+            model.search(query, limit=10)
+            latency.record(time.perf_counter() - t0)
+        print(
+            "{:<22} p50 < {:>9} us  p99 < {:>9} us  ({} items)".format(
+                label, latency.percentile(50), latency.percentile(99), n_items
+            )
+        )
+
+
+def bench_coalescing(n_items=200000, n_callers=32, rounds=5):
+    """Backend calls and time of n_callers concurrent aggregate() requests.
+
+    aggregate() scans the whole table, so a herd of callers asking for it at
+    the same time (e.g. a dashboard) multiplies the load, unless the requests
+    are coalesced. Run with threads and with asyncio.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        connection = sqlite_backend.connect_to_db(
+            os.path.join(tmp, "coalescing"), check_same_thread=False
+        )
+        items = [
+            {"name": "item{}".format(i), "price": 1.5, "quantity": i}
+            for i in range(n_items)
+        ]
+        backend = ModelSQLite(items, connection=connection)
+        backend.enable_stats()
+
+        def calls():
+            return backend.stats().get("aggregate", {}).get("calls", 0)
+
+        for label, model in (
+            ("threads", backend),
+            ("threads, coalesced", CoalescingModel(backend)),
+        ):
+            before = calls()
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=n_callers) as executor:
+                for _ in range(rounds):
+                    futures = [
+                        executor.submit(model.aggregate) for _ in range(n_callers)
+                    ]
+                    for f in futures:
+                        f.result()
+            print(
+                "{:<20} {:>6.2f} s  backend calls: {}".format(
+                    label, time.perf_counter() - t0, calls() - before
+                )
+            )
+
+        async def herd(model):
+            for _ in range(rounds):
+                await asyncio.gather(*[model.aggregate() for _ in range(n_callers)])
+
+        async_model = AsyncModel(backend)
+        for label, model in (
+            ("asyncio", async_model),
+            ("asyncio, coalesced", AsyncCoalescingModel(async_model)),
+        ):
+            before = calls()
+            t0 = time.perf_counter()
+            asyncio.run(herd(model))
+            print(
+                "{:<20} {:>6.2f} s  backend calls: {}".format(
+                    label, time.perf_counter() - t0, calls() - before
+                )
+            )
+        async_model.close()
+        connection.close()
+
+
+def bench_export(n_items=1000000):
+    """Time and peak memory of listing n_items, as text vs streamed.
+
+    The text list reads all the items and renders them into one string. The
+    jsonl and csv exports stream them from the database a chunk at a time.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        model = ModelSQLite(
+            [], connection=sqlite_backend.connect_to_db(os.path.join(tmp, "export"))
+        )
+        for i in range(0, n_items, 100000):
+            model.create_items(
+                [
+                    {"name": "item{}".format(j), "price": 1.5, "quantity": j}
+                    for j in range(i, min(i + 100000, n_items))
+                ]
+            )
+        with open(os.devnull, "w") as sink:
+            c = Controller(model, View(sink))
+            for output in ("text", "jsonl", "csv"):
+                t0 = time.perf_counter()
+                c.show_items(output=output)
+                elapsed = time.perf_counter() - t0
+                # tracing slows everything down, so it gets a run of its own
+                tracemalloc.start()
+                c.show_items(output=output)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(
+                    "{:<6} {:>6.2f} s  peak memory: {:>8.1f} MB".format(
+                        output, elapsed, peak / 1e6
+                    )
+                )
+        model.connection.close()
+
+
+BENCHMARKS = {
+    "async_controller": bench_async_controller,
+    "checkpoint": bench_checkpoint,
+    "coalescing": bench_coalescing,
+    "export": bench_export,
+    "import_time": bench_import_time,
+    "search": bench_search,
+    "sharded_writes": bench_sharded_writes,
+    "single_writer": bench_single_writer,
+    "snapshot": bench_snapshot,
+}
+
+
+def main():
+    names = sys.argv[1:]
+    if not names:
+        print("Available benchmarks: {}".format(", ".join(sorted(BENCHMARKS))))
+    for name in names:
+        print("=== {} ===".format(name))
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Read-through cache in front of a Model.
+
+CachingModel wraps any Model subclass and keeps the results of read_item and
+read_items in a bounded LRU cache, optionally with a time-to-live. Every write
+goes straight to the wrapped Model and invalidates the affected entries, so the
+Controller sees the same data as before while hot items stop hitting the
+database.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from model_view_controller import Model, ModelBasic, View, Controller
+import mvc_mock_objects as mock
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class CachingModel(Model):
+    """Model wrapper with a least-recently-used cache for reads.
+
+    Parameters
+    ----------
+    model : Model
+        the Model that actually stores the items
+    maxsize : int
+        maximum number of cached entries. The least recently used entry is
+        evicted when the cache is full.
+    ttl : float or None
+        time-to-live of a cached entry, in seconds. If None, entries never
+        expire and are only evicted or invalidated.
+    """
+
+    def __init__(self, model, maxsize=128, ttl=None):
+        super().__init__()
+        if maxsize < 1:
+            raise ValueError("maxsize must be greater than 0")
+        self._model = model
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._cache = OrderedDict()
+        # key -> number of times it was invalidated, and number of times the
+        # whole cache was: a read stores its value only if neither changed
+        # while it ran, so that it doesn't cache what a write just replaced
+        self._generations = dict()
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __getattr__(self, name):
+        # only called when the attribute is not found on the CachingModel, so
+        # backend-specific attributes (e.g. connection) are still reachable.
+        if name == "_model":
+            raise AttributeError(name)
+        return getattr(self._model, name)
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def item_type(self):
+        return self._model.item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        self._model.item_type = new_item_type
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def cache_info(self):
+        """Report cache statistics, like functools.lru_cache does.
+
+        Returns
+        -------
+        CacheInfo
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._maxsize, len(self._cache))
+
+    def cache_clear(self):
+        """Drop every cached entry and reset the statistics."""
+        with self._lock:
+            self._cache.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            try:
+                expires_at, value = self._cache[key]
+            except KeyError:
+                self._misses += 1
+                raise
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._cache[key]
+                self._misses += 1
+                raise KeyError(key)
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def _generation(self, key):
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def _set(self, key, value, generation):
+        expires_at = None if self._ttl is None else time.monotonic() + self._ttl
+        with self._lock:
+            if generation != (self._epoch, self._generations.get(key, 0)):
+                # a write invalidated the key while value was being read
+                return
+            self._cache[key] = (expires_at, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+
+    def _invalidate(self, *names):
+        item_type = self.item_type
+        keys = [("items", item_type)] + [("item", item_type, x) for x in names]
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _invalidate_all(self):
+        with self._lock:
+            self._cache.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def create_item(self, name, price, quantity):
+        try:
+            self._model.create_item(name, price, quantity)
+        finally:
+            self._invalidate(name)
+
+    def create_items(self, items):
+        try:
+            self._model.create_items(items)
+        finally:
+            self._invalidate_all()
+
+    def read_item(self, name):
+        key = ("item", self.item_type, name)
+        try:
+            return self._get(key)
+        except KeyError:
+            pass
+        generation = self._generation(key)
+        item = self._model.read_item(name)
+        self._set(key, item, generation)
+        return item
+
+    def read_items(self):
+        key = ("items", self.item_type)
+        try:
+            return list(self._get(key))
+        except KeyError:
+            pass
+        generation = self._generation(key)
+        items = self._model.read_items()
+        self._set(key, items, generation)
+        return list(items)
+
+    def iter_items(self, chunk_size=1000):
+        # a full listing streamed from the backend is not worth caching
+        return self._model.iter_items(chunk_size)
+
+    def read_many(self, names):
+        item_type = self.item_type
+        names = list(dict.fromkeys(names))
+        cached = dict()
+        for name in names:
+            try:
+                cached[name] = self._get(("item", item_type, name))
+            except KeyError:
+                pass
+        misses = [name for name in names if name not in cached]
+        if misses:
+            generations = {
+                name: self._generation(("item", item_type, name)) for name in misses
+            }
+            found, _ = self._model.read_many(misses)
+            for item in found:
+                name = item["name"]
+                self._set(("item", item_type, name), item, generations[name])
+                cached[item["name"]] = item
+        return (
+            [cached[name] for name in names if name in cached],
+            [name for name in names if name not in cached],
+        )
+
+    def update_item(self, name, price, quantity):
+        try:
+            self._model.update_item(name, price, quantity)
+        finally:
+            self._invalidate(name)
+
+    def delete_item(self, name):
+        try:
+            self._model.delete_item(name)
+        finally:
+            self._invalidate(name)
+
+    def update_items(self, items):
+        try:
+            self._model.update_items(items)
+        finally:
+            self._invalidate(*[x["name"] for x in items])
+
+    def delete_items(self, names):
+        try:
+            self._model.delete_items(names)
+        finally:
+            self._invalidate(*names)
+
+    def aggregate(self, low_stock=None):
+        return self._model.aggregate(low_stock)
+
+    def count(self, low_stock=None):
+        return self._model.count(low_stock)
+
+    def search(self, query, limit=10):
+        # not cached: every keystroke of an autocomplete is a different query
+        return self._model.search(query, limit)
+
+
+def main():
+
+    model = CachingModel(ModelBasic(mock.items()), maxsize=2, ttl=60.0)
+    c = Controller(model, View())
+
+    # the first read of each item goes to the backend, the others are hits
+    for _ in range(3):
+        c.show_item("bread")
+        c.show_item("milk")
+    print(model.cache_info())
+
+    # a write invalidates the cached item, so the next read is a miss
+    c.update_item("bread", price=0.8, quantity=15)
+    c.show_item("bread")
+    print(model.cache_info())
+
+    # wine evicts the least recently used entry (milk) from the cache
+    c.show_item("wine")
+    c.show_item("milk")
+    print(model.cache_info())
+
+
+if __name__ == "__main__":
+    main()
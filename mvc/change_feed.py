@@ -0,0 +1,243 @@
+"""Change feed from the Model to the View.
+
+ChangeFeedModel wraps any Model and records every successful write as a
+change with a monotonically increasing version. A client that has seen
+version V asks for changes_since(V) and gets only what was created, updated
+or deleted afterwards, instead of fetching the full list again.
+
+IncrementalView keeps the lines it has rendered, one per item, so that
+applying a change re-renders only the affected line.
+"""
+import threading
+import uuid
+from collections import OrderedDict, deque, namedtuple
+import mvc_exceptions as mvc_exc
+import mvc_mock_objects as mock
+from model_view_controller import (
+    Model,
+    ModelBasic,
+    View,
+    Controller,
+    BULLET_POINT,
+    LIST_HEADER,
+)
+
+
+Change = namedtuple("Change", ["version", "kind", "name", "item"])
+
+
+class ChangeFeedModel(Model):
+    """Model wrapper that publishes a feed of the changes to its items.
+
+    Parameters
+    ----------
+    model : Model
+        the Model that actually stores the items
+    max_changes : int
+        number of changes kept in memory. A client that falls further behind
+        gets ChangesNotAvailable and has to read the full list again.
+    """
+
+    def __init__(self, model, max_changes=10000):
+        super().__init__()
+        self._model = model
+        self._changes = deque(maxlen=max_changes)
+        self._version = 0
+        self._epoch = uuid.uuid4().hex
+        # writes and their changes are recorded atomically, so the order of
+        # the versions is the order in which the writes were applied
+        self._lock = threading.RLock()
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def item_type(self):
+        return self._model.item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        self._model.item_type = new_item_type
+
+    @property
+    def version(self):
+        """Version of the last change (0 if nothing changed yet)."""
+        return self._version
+
+    @property
+    def epoch(self):
+        """Identity of this history of versions.
+
+        Versions are kept in memory, so a new ChangeFeedModel (e.g. after a
+        restart) counts from 0 again: its version 5 has nothing to do with the
+        version 5 of the one before. Each has its own epoch.
+        """
+        return self._epoch
+
+    def _publish(self, kind, name, item=None):
+        # call with self._lock held
+        self._version += 1
+        if item is not None:
+            item = {"name": name, "price": item["price"], "quantity": item["quantity"]}
+        self._changes.append(Change(self._version, kind, name, item))
+
+    def changes_since(self, version):
+        """Changes with a version greater than the given one.
+
+        Parameters
+        ----------
+        version : int
+
+        Returns
+        -------
+        tuple
+            (current version, list of Change)
+
+        Raises
+        ------
+        mvc_exc.ChangesNotAvailable: if some of the changes since that version
+        have already been discarded.
+        """
+        with self._lock:
+            if version > self._version:
+                raise mvc_exc.ChangesNotAvailable(
+                    "Version {} is in the future (current version is {})".format(
+                        version, self._version
+                    )
+                )
+            oldest = self._changes[0].version if self._changes else self._version + 1
+            if version + 1 < oldest and version != self._version:
+                raise mvc_exc.ChangesNotAvailable(
+                    "Changes since version {} are no longer available".format(version)
+                )
+            # versions are contiguous, so we can skip straight to the first one
+            start = max(0, version + 1 - oldest)
+            changes = [self._changes[i] for i in range(start, len(self._changes))]
+            return self._version, changes
+
+    def read_items_versioned(self):
+        """All items, and the version they correspond to.
+
+        Returns
+        -------
+        tuple
+            (version, list of items)
+        """
+        with self._lock:
+            return self._version, self._model.read_items()
+
+    def create_item(self, name, price, quantity):
+        with self._lock:
+            self._model.create_item(name, price, quantity)
+            self._publish("created", name, {"price": price, "quantity": quantity})
+
+    def create_items(self, items):
+        with self._lock:
+            self._model.create_items(items)
+            for x in items:
+                self._publish("created", x["name"], x)
+
+    def read_item(self, name):
+        return self._model.read_item(name)
+
+    def read_items(self):
+        return self._model.read_items()
+
+    def iter_items(self, chunk_size=1000):
+        return self._model.iter_items(chunk_size)
+
+    def read_many(self, names):
+        return self._model.read_many(names)
+
+    def search(self, query, limit=10):
+        return self._model.search(query, limit)
+
+    def update_item(self, name, price, quantity):
+        with self._lock:
+            self._model.update_item(name, price, quantity)
+            self._publish("updated", name, {"price": price, "quantity": quantity})
+
+    def delete_item(self, name):
+        with self._lock:
+            self._model.delete_item(name)
+            self._publish("deleted", name)
+
+    def update_items(self, items):
+        with self._lock:
+            self._model.update_items(items)
+            for x in items:
+                self._publish("updated", x["name"], x)
+
+    def delete_items(self, names):
+        with self._lock:
+            self._model.delete_items(names)
+            # a name given twice is deleted once
+            for name in dict.fromkeys(names):
+                self._publish("deleted", name)
+
+    def aggregate(self, low_stock=None):
+        return self._model.aggregate(low_stock)
+
+    def count(self, low_stock=None):
+        return self._model.count(low_stock)
+
+
+class IncrementalView(View):
+    """View that caches the line rendered for each item of the list.
+
+    The full list is rendered once. Afterwards, show_changes re-renders and
+    writes only the lines of the items that changed, and show_cached_list
+    writes the current list without formatting any item again.
+    """
+
+    def __init__(self, sink=None):
+        super().__init__(sink)
+        self._lines = OrderedDict()
+
+    def _cache(self, items):
+        self._lines = OrderedDict((x["name"], BULLET_POINT(x)) for x in items)
+
+    def show_bullet_point_list(self, item_type, items):
+        self._cache(items)
+        self.show_cached_list(item_type)
+
+    def show_number_point_list(self, item_type, items):
+        self._cache(items)
+        super().show_number_point_list(item_type, items)
+
+    def show_changes(self, item_type, changes):
+        for _, kind, name, item in changes:
+            if kind == "deleted":
+                self._lines.pop(name, None)
+            else:
+                self._lines[name] = BULLET_POINT(item)
+        super().show_changes(item_type, changes)
+
+    def show_cached_list(self, item_type):
+        self.write(LIST_HEADER(item_type.upper()) + "".join(self._lines.values()))
+
+
+def main():
+
+    model = ChangeFeedModel(ModelBasic(mock.items()))
+    view = IncrementalView()
+    c = Controller(model, view)
+
+    # the first time, the client gets the full list...
+    version = c.show_changes()
+
+    c.insert_item("beer", price=3.0, quantity=15)
+    c.update_item("milk", price=1.2, quantity=20)
+    c.delete_item("wine")
+
+    # ...afterwards only what changed since the version it has seen
+    version = c.show_changes(version)
+    print("Current version: {}".format(version))
+
+    # the View can show the whole list again without re-rendering it
+    view.show_cached_list(model.item_type)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""In-memory SQLite database checkpointed to disk.
+
+An in-memory database answers every request without touching the disk, but
+it is lost when the process exits. A database file survives, but every commit
+waits for the disk. Checkpointer serves the items from an in-memory database
+and copies it to a file (a checkpoint) with the backup API, every interval
+seconds or as soon as max_changes rows have changed, whichever comes first.
+When the process starts again it loads the last checkpoint.
+
+The price to pay is bounded data loss: if the process crashes, the changes
+made after the last checkpoint are lost, i.e. at most interval seconds or
+max_changes changes.
+"""
+import os
+import threading
+import time
+import mvc_mock_objects as mock
+import sqlite_backend
+from model_view_controller import ModelSQLite, View, Controller
+
+
+class Checkpointer(object):
+    """Owner of an in-memory SQLite database that is checkpointed to a file.
+
+    Use its connection for a ModelSQLite, e.g.
+    ModelSQLite(items, connection=checkpointer.connection).
+
+    Parameters
+    ----------
+    path : str
+        file of the checkpoint. If it exists, the database starts as a copy of
+        it.
+    interval : float
+        maximum time, in seconds, between a change and the checkpoint that
+        saves it.
+    max_changes : int
+        checkpoint as soon as this many rows have changed, without waiting
+        interval seconds.
+    pages_per_step : int
+        see sqlite_backend.backup_to_file
+    poll : float
+        how often, in seconds, the background thread looks at the number of
+        changes.
+    """
+
+    def __init__(
+        self, path, interval=5.0, max_changes=1000, pages_per_step=-1, poll=0.1
+    ):
+        self._path = path
+        self._interval = interval
+        self._max_changes = max_changes
+        self._pages_per_step = pages_per_step
+        self._poll = poll
+        # the checkpoints are taken by the background thread, which reads the
+        # database through the same connection as the Model (SQLite
+        # serializes the calls of the two threads)
+        self._restored = os.path.exists(path)
+        if self._restored:
+            self._connection = sqlite_backend.restore_from_file(
+                path, read_only=False, check_same_thread=False
+            )
+        else:
+            self._connection = sqlite_backend.connect_to_db(check_same_thread=False)
+        self._checkpointed_changes = self._connection.total_changes
+        self._checkpointed_at = time.monotonic()
+        self._checkpoints = 0
+        self._last_checkpoint = None
+        self._errors = list()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wake_up = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def connection(self):
+        return self._connection
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def restored(self):
+        """True if the database was loaded from an existing checkpoint."""
+        return self._restored
+
+    @property
+    def pending(self):
+        """Number of rows changed since the last checkpoint."""
+        return self._connection.total_changes - self._checkpointed_changes
+
+    @property
+    def checkpoints(self):
+        """Number of checkpoints taken so far."""
+        return self._checkpoints
+
+    @property
+    def last_checkpoint(self):
+        """Statistics of the last checkpoint (see backup_to_file), or None."""
+        return self._last_checkpoint
+
+    @property
+    def errors(self):
+        """Checkpoints that failed, as a list of exceptions."""
+        return list(self._errors)
+
+    def checkpoint(self):
+        """Copy the database to the checkpoint file now, if it changed.
+
+        Returns
+        -------
+        bool
+            True if a checkpoint was taken
+        """
+        with self._lock:
+            # changes made during the copy end up in it, but they may also be
+            # counted for the next checkpoint, which is harmless
+            changes = self._connection.total_changes
+            if changes == self._checkpointed_changes and os.path.exists(self._path):
+                return False
+            self._last_checkpoint = sqlite_backend.backup_to_file(
+                self._connection, self._path, pages_per_step=self._pages_per_step
+            )
+            self._checkpointed_changes = changes
+            self._checkpointed_at = time.monotonic()
+            self._checkpoints += 1
+            return True
+
+    def _due(self):
+        pending = self.pending
+        if pending >= self._max_changes:
+            return True
+        return pending > 0 and (
+            time.monotonic() - self._checkpointed_at >= self._interval
+        )
+
+    def _run(self):
+        while True:
+            with self._wake_up:
+                if not self._closed:
+                    self._wake_up.wait(self._poll)
+                if self._closed:
+                    return
+            if self._due():
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    # keep serving from memory, and try again at the next poll
+                    self._errors.append(e)
+
+    def close(self):
+        """Stop the background thread, take a last checkpoint and close."""
+        with self._wake_up:
+            self._closed = True
+            self._wake_up.notify()
+        self._thread.join()
+        self.checkpoint()
+        self._connection.close()
+
+
+def main():
+
+    checkpointer = Checkpointer("myDB_checkpoint.db", interval=0.5, max_changes=100)
+    # the second time we run this, the items come from the checkpoint
+    if checkpointer.restored:
+        print("Loaded checkpoint {}".format(checkpointer.path))
+        model = ModelSQLite([], connection=checkpointer.connection)
+    else:
+        model = ModelSQLite(mock.items(), connection=checkpointer.connection)
+    c = Controller(model, View())
+
+    # writes are served from memory...
+    c.update_item("milk", price=1.2, quantity=20)
+    c.delete_item("beer")
+    c.insert_item("beer", price=3.0, quantity=15)
+    print("Changes not yet checkpointed: {}".format(checkpointer.pending))
+
+    # ...and reach the disk at most interval seconds later
+    time.sleep(1.0)
+    print("Changes not yet checkpointed: {}".format(checkpointer.pending))
+    print("Last checkpoint: {}".format(checkpointer.last_checkpoint))
+    c.show_items()
+
+    checkpointer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""Single-flight request coalescing for the reads of a Model.
+
+When many callers ask for the same hot item at the same time, each of them
+runs its own identical query. CoalescingModel lets only the first caller (the
+leader) run a read; the others that ask for the same read while it is in
+flight wait for it and get its result, or its exception. A hundred concurrent
+show_item("bread") cost one read_item on the backend, not a hundred.
+
+Nothing is cached: once the read completes, the next caller runs a new one. A
+write makes the reads in flight unavailable to later callers, so a caller
+never gets a result read before a write that completed before it asked.
+
+Callers share the result, so they must not modify it.
+
+CoalescingModel coalesces the reads of threads. An AsyncModel runs the calls
+of the event loop one after the other in its executor, so they never overlap
+there; for asyncio wrap the AsyncModel in an AsyncCoalescingModel instead,
+which coalesces the coroutines before they reach the executor.
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mvc_mock_objects as mock
+from async_controller import AsyncModel, AsyncController
+from model_view_controller import Model, ModelBasic, View, Controller
+
+
+class _Call(object):
+    """A read in flight, and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CoalescingModel(Model):
+    """Model wrapper that shares concurrent identical reads among threads.
+
+    Parameters
+    ----------
+    model : Model
+        the Model that actually stores the items. Its reads run in the
+        threads of the callers, so a ModelSQLite needs a connection opened
+        with check_same_thread=False.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self._model = model
+        self._calls = dict()
+        self._lock = threading.Lock()
+        self._coalesced = 0
+
+    def __getattr__(self, name):
+        # backend-specific attributes (e.g. connection) are still reachable
+        if name == "_model":
+            raise AttributeError(name)
+        return getattr(self._model, name)
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def item_type(self):
+        return self._model.item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        with self._lock:
+            self._calls.clear()
+        self._model.item_type = new_item_type
+
+    @property
+    def coalesced(self):
+        """Number of reads served by a read that another caller was running."""
+        return self._coalesced
+
+    @property
+    def in_flight(self):
+        """Number of distinct reads running right now."""
+        return len(self._calls)
+
+    def _single_flight(self, key, func, *args):
+        key = (self.item_type,) + key
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # a write may have dropped the call already
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _forget(self):
+        # the callers already waiting get the result of the reads in flight,
+        # later callers start new reads, which see the write
+        with self._lock:
+            self._calls.clear()
+
+    def create_item(self, name, price, quantity):
+        try:
+            self._model.create_item(name, price, quantity)
+        finally:
+            self._forget()
+
+    def create_items(self, items):
+        try:
+            self._model.create_items(items)
+        finally:
+            self._forget()
+
+    def read_item(self, name):
+        return self._single_flight(("read_item", name), self._model.read_item, name)
+
+    def read_items(self):
+        return self._single_flight(("read_items",), self._model.read_items)
+
+    def iter_items(self, chunk_size=1000):
+        # a stream can't be shared
+        return self._model.iter_items(chunk_size)
+
+    def read_many(self, names):
+        return self._single_flight(
+            ("read_many", tuple(names)), self._model.read_many, names
+        )
+
+    def search(self, query, limit=10):
+        return self._single_flight(
+            ("search", query, limit), self._model.search, query, limit
+        )
+
+    def update_item(self, name, price, quantity):
+        try:
+            self._model.update_item(name, price, quantity)
+        finally:
+            self._forget()
+
+    def delete_item(self, name):
+        try:
+            self._model.delete_item(name)
+        finally:
+            self._forget()
+
+    def update_items(self, items):
+        try:
+            self._model.update_items(items)
+        finally:
+            self._forget()
+
+    def delete_items(self, names):
+        try:
+            self._model.delete_items(names)
+        finally:
+            self._forget()
+
+    def aggregate(self, low_stock=None):
+        return self._single_flight(
+            ("aggregate", low_stock), self._model.aggregate, low_stock
+        )
+
+    def count(self, low_stock=None):
+        return self._single_flight(("count", low_stock), self._model.count, low_stock)
+
+
+class AsyncCoalescingModel(object):
+    """AsyncModel wrapper that shares concurrent identical reads among tasks.
+
+    The first coroutine that asks for a read starts a task for it, the others
+    await the same task. A caller that is cancelled does not cancel the read
+    for the others.
+
+    Parameters
+    ----------
+    model : async_controller.AsyncModel
+    """
+
+    def __init__(self, model):
+        self._model = model
+        self._calls = dict()
+        self._coalesced = 0
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def item_type(self):
+        return self._model.item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        self._calls.clear()
+        self._model.item_type = new_item_type
+
+    @property
+    def coalesced(self):
+        """Number of reads served by a read that another caller was running."""
+        return self._coalesced
+
+    @property
+    def in_flight(self):
+        """Number of distinct reads running right now."""
+        return len(self._calls)
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # retrieve the exception, so that asyncio doesn't log it when all
+            # the callers were cancelled
+            task.exception()
+
+    async def _single_flight(self, key, func, *args):
+        key = (self.item_type,) + key
+        # no lock needed: nothing runs between the lookup and the insertion
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            self._coalesced += 1
+        return await asyncio.shield(task)
+
+    async def create_item(self, name, price, quantity):
+        try:
+            await self._model.create_item(name, price, quantity)
+        finally:
+            self._calls.clear()
+
+    async def create_items(self, items):
+        try:
+            await self._model.create_items(items)
+        finally:
+            self._calls.clear()
+
+    async def read_item(self, name):
+        return await self._single_flight(
+            ("read_item", name), self._model.read_item, name
+        )
+
+    async def read_items(self):
+        return await self._single_flight(("read_items",), self._model.read_items)
+
+    async def read_many(self, names):
+        return await self._single_flight(
+            ("read_many", tuple(names)), self._model.read_many, names
+        )
+
+    async def search(self, query, limit=10):
+        return await self._single_flight(
+            ("search", query, limit), self._model.search, query, limit
+        )
+
+    async def update_item(self, name, price, quantity):
+        try:
+            await self._model.update_item(name, price, quantity)
+        finally:
+            self._calls.clear()
+
+    async def delete_item(self, name):
+        try:
+            await self._model.delete_item(name)
+        finally:
+            self._calls.clear()
+
+    async def update_items(self, items):
+        try:
+            await self._model.update_items(items)
+        finally:
+            self._calls.clear()
+
+    async def delete_items(self, names):
+        try:
+            await self._model.delete_items(names)
+        finally:
+            self._calls.clear()
+
+    async def aggregate(self, low_stock=None):
+        return await self._single_flight(
+            ("aggregate", low_stock), self._model.aggregate, low_stock
+        )
+
+    async def count(self, low_stock=None):
+        return await self._single_flight(
+            ("count", low_stock), self._model.count, low_stock
+        )
+
+    def close(self):
+        self._model.close()
+
+
+class SlowModel(Model):
+    """Model wrapper that reads items slowly, like a remote database."""
+
+    def __init__(self, model, delay=0.05):
+        super().__init__()
+        self._model = model
+        self._delay = delay
+
+    @property
+    def item_type(self):
+        return self._model.item_type
+
+    def read_item(self, name):
+        time.sleep(self._delay)
+        return self._model.read_item(name)
+
+
+def main():
+
+    backend = ModelBasic(mock.items())
+    backend.enable_stats()
+    model = CoalescingModel(SlowModel(backend))
+    c = Controller(model, View())
+
+    # ten threads ask for bread at the same time...
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        for _ in range(10):
+            executor.submit(c.show_item, "bread")
+    # ...and the backend reads it once (or a few times, if some are late)
+    print("read_item calls: {}".format(backend.stats()["read_item"]["calls"]))
+    print("coalesced: {}".format(model.coalesced))
+
+    # the same with ten coroutines
+    async def show_bread():
+        async_model = AsyncCoalescingModel(AsyncModel(SlowModel(backend)))
+        ac = AsyncController(async_model, View())
+        await asyncio.gather(*[ac.show_item("bread") for _ in range(10)])
+        print("coalesced: {}".format(async_model.coalesced))
+        ac.close()
+        async_model.close()
+
+    asyncio.run(show_bread())
+    print("read_item calls: {}".format(backend.stats()["read_item"]["calls"]))
+
+
+if __name__ == "__main__":
+    main()
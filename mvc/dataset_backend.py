@@ -112,7 +112,7 @@ def insert_one(conn, name, price, quantity, table_name):
 
 
 def insert_many(conn, items, table_name):
-    """Insert all items in a table.
+    """Insert all items in a single transaction.
 
     Parameters
     ----------
@@ -120,18 +120,23 @@ def insert_many(conn, items, table_name):
         list of dictionaries
     table_name : str
     conn : dataset.persistence.database.Database
+
+    Raises
+    ------
+    mvc_exc.ItemAlreadyStored: if at least one item is already stored in the
+    table, or is twice in items. In this case no item is inserted.
     """
-    # TODO: check what happens if 1+ records can be inserted but 1 fails
-    table = conn.load_table(table_name)
+    rows = [
+        dict(name=x["name"], price=x["price"], quantity=x["quantity"]) for x in items
+    ]
     try:
-        for x in items:
-            table.insert(dict(name=x["name"], price=x["price"], quantity=x["quantity"]))
+        with conn:
+            table = conn.load_table(table_name)
+            table.insert_many(rows)
     except IntegrityError as e:
-        print(
+        raise mvc_exc.ItemAlreadyStored(
             'At least one in {} was already stored in table "{}".\nOriginal '
-            "Exception raised: {}".format(
-                [x["name"] for x in items], table.table.name, e
-            )
+            "Exception raised: {}".format([x["name"] for x in items], table_name, e)
         )
 
 
@@ -164,6 +169,38 @@ def select_one(conn, name, table_name):
         )
 
 
+# keep the IN (...) clauses short enough for every database engine
+MAX_VARIABLES = 500
+
+
+def select_many(conn, names, table_name):
+    """Select all items with the given names, with as few queries as possible.
+
+    Parameters
+    ----------
+    conn : dataset.persistence.database.Database
+    names : list
+    table_name : str
+
+    Returns
+    -------
+    tuple
+        (list of the items found, in the order of names; list of the names
+        that are not stored)
+    """
+    table = conn.load_table(table_name)
+    names = list(dict.fromkeys(names))  # drop duplicates, keep the order
+    found = dict()
+    for i in range(0, len(names), MAX_VARIABLES):
+        # dataset turns a list of values into a name IN (...) clause
+        for row in table.find(name=names[i : i + MAX_VARIABLES]):
+            found[row["name"]] = dict(row)
+    return (
+        [found[name] for name in names if name in found],
+        [name for name in names if name not in found],
+    )
+
+
 def select_all(conn, table_name):
     """Select all items in a table.
 
@@ -184,6 +221,26 @@ def select_all(conn, table_name):
     return list(map(lambda x: dict(x), rows))
 
 
+def iter_all(conn, table_name, chunk_size=1000):
+    """Iterate over all items in a table, chunk_size rows at a time.
+
+    Parameters
+    ----------
+    conn : dataset.persistence.database.Database
+    table_name : str
+    chunk_size : int
+        number of rows fetched from the database at a time
+
+    Returns
+    -------
+    generator
+        of dictionaries. Each dict is a record.
+    """
+    table = conn.load_table(table_name)
+    # dataset fetches the rows of find() _step at a time
+    return map(dict, table.find(_step=chunk_size))
+
+
 def update_one(conn, name, price, quantity, table_name):
     """Update a single item in the table.
 
@@ -242,6 +299,99 @@ def delete_one(conn, item_name, table_name):
         )
 
 
+def update_many(conn, items, table_name):
+    """Update all items in a single transaction.
+
+    Parameters
+    ----------
+    items : list
+        list of dictionaries
+    table_name : str
+    conn : dataset.persistence.database.Database
+
+    Raises
+    ------
+    mvc_exc.ItemNotStored: if at least one item is not stored in the table. In
+    this case no item is updated.
+    """
+    names = [x["name"] for x in items]
+    rows = [
+        dict(name=x["name"], price=x["price"], quantity=x["quantity"]) for x in items
+    ]
+    with conn:
+        table = conn.load_table(table_name)
+        if table.count(name=names) != len(set(names)):
+            raise mvc_exc.ItemNotStored(
+                'Can\'t update: at least one in {} is not stored in table "{}"'.format(
+                    names, table.table.name
+                )
+            )
+        table.update_many(rows, ["name"])
+
+
+def delete_many(conn, names, table_name):
+    """Delete all items in a single transaction.
+
+    Parameters
+    ----------
+    names : list
+    table_name : str
+    conn : dataset.persistence.database.Database
+
+    Raises
+    ------
+    mvc_exc.ItemNotStored: if at least one item is not stored in the table. In
+    this case no item is deleted.
+    """
+    names = list(names)
+    with conn:
+        table = conn.load_table(table_name)
+        if table.count(name=names) != len(set(names)):
+            raise mvc_exc.ItemNotStored(
+                'Can\'t delete: at least one in {} is not stored in table "{}"'.format(
+                    names, table.table.name
+                )
+            )
+        table.delete(name=names)
+
+
+def aggregate(conn, table_name, low_stock=None):
+    """Count the items and sum their quantity and value, in the database.
+
+    Parameters
+    ----------
+    conn : dataset.persistence.database.Database
+    table_name : str
+    low_stock : int or None
+        if not None, also count the items with a quantity below this value
+
+    Returns
+    -------
+    dict
+        count, quantity, stock_value (and low_stock) of the items
+    """
+    table = conn.load_table(table_name)
+    sql = (
+        "SELECT COUNT(*) AS count, COALESCE(SUM(quantity), 0) AS quantity, "
+        "COALESCE(SUM(price * quantity), 0) AS stock_value"
+    )
+    if low_stock is not None:
+        sql += (
+            ", COALESCE(SUM(CASE WHEN quantity < :low_stock THEN 1 ELSE 0 END), 0) "
+            "AS low_stock"
+        )
+    sql += ' FROM "{}"'.format(table.table.name)
+    row = next(iter(conn.query(sql, low_stock=low_stock)))
+    return dict(row)
+
+
+def count(conn, table_name, low_stock=None):
+    table = conn.load_table(table_name)
+    if low_stock is None:
+        return table.count()
+    return table.count(quantity={"lt": low_stock})
+
+
 def main():
 
     conn = connect_to_db()
@@ -261,6 +411,8 @@ def main():
     print(select_one(conn, "milk", table_name=table_name))
     print("SELECT all")
     print(select_all(conn, table_name=table_name))
+    print("SELECT bread, wine and chocolate")
+    print(select_many(conn, ["bread", "wine", "chocolate"], table_name=table_name))
     # if we try to select an object not stored we get an ItemNotStored exception
     # print(select_one(conn, 'pizza', table_name=table_name))
 
@@ -277,6 +429,23 @@ def main():
     delete_one(conn, "beer", table_name=table_name)
     print(select_all(conn, table_name=table_name))
 
+    # BATCH
+    print("UPDATE and DELETE in batch, SELECT all")
+    update_many(
+        conn,
+        [
+            {"name": "bread", "price": 1.0, "quantity": 10},
+            {"name": "milk", "price": 1.5, "quantity": 5},
+        ],
+        table_name=table_name,
+    )
+    delete_many(conn, ["wine"], table_name=table_name)
+    print(select_all(conn, table_name=table_name))
+
+    # AGGREGATE
+    print("AGGREGATE with low stock below 10")
+    print(aggregate(conn, table_name=table_name, low_stock=10))
+
 
 # if we try to delete an object not stored we get an ItemNotStored exception
 # print('DELETE fish')
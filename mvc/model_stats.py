@@ -0,0 +1,154 @@
+"""Call counters, error counters and latency histograms for Model methods.
+
+A Model starts collecting statistics when enable_stats() is called on it. This
+module has the data structures that hold them. Latencies go in log-scale
+buckets: bucket i counts the calls that took less than 2**i microseconds (and
+at least 2**(i-1)), so a few dozen integers cover everything from 1 us to
+hours, and recording a call is O(1).
+"""
+import json
+import threading
+import time
+
+
+class LatencyHistogram(object):
+    """Histogram of latencies with power-of-two buckets, in microseconds."""
+
+    def __init__(self):
+        self.buckets = list()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        us = seconds * 1e6
+        i = int(us).bit_length()
+        if i >= len(self.buckets):
+            self.buckets.extend([0] * (i + 1 - len(self.buckets)))
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        """Upper bound, in microseconds, of the bucket with the p-th percentile.
+
+        Parameters
+        ----------
+        p : float
+            percentile, between 0 and 100
+
+        Returns
+        -------
+        int or None
+            None if there are no samples
+        """
+        if self.count == 0:
+            return None
+        threshold = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= threshold and n:
+                return 2 ** i
+        return 2 ** (len(self.buckets) - 1)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count if self.count else None,
+            "max_us": self.max,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+            # upper bound of the bucket (in us) -> number of calls
+            "buckets": {str(2 ** i): n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class MethodStats(object):
+    """Statistics of a single Model method."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = dict()
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=None):
+        with self._lock:
+            self.calls += 1
+            self.latency.record(seconds)
+            if error is not None:
+                name = type(error).__name__
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": dict(self.errors),
+                "latency": self.latency.as_dict(),
+            }
+
+
+class ModelStats(object):
+    """Statistics of all the instrumented methods of a Model."""
+
+    def __init__(self):
+        self.methods = dict()
+
+    def instrument(self, name, method):
+        """Wrap a bound method so that every call is recorded.
+
+        Parameters
+        ----------
+        name : str
+        method : bound method
+
+        Returns
+        -------
+        function
+        """
+        stats = self.methods.setdefault(name, MethodStats())
+        perf_counter = time.perf_counter
+
+        def instrumented(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                stats.record(perf_counter() - t0, e)
+                raise
+            stats.record(perf_counter() - t0)
+            return result
+
+        instrumented.__name__ = name
+        instrumented.__doc__ = method.__doc__
+        return instrumented
+
+    def as_dict(self):
+        return {name: s.as_dict() for name, s in self.methods.items() if s.calls}
+
+    def to_json(self, **kwargs):
+        """Export the statistics as a JSON string (kwargs go to json.dumps)."""
+        return json.dumps(self.as_dict(), **kwargs)
+
+
+def main():
+    # imported here because model_view_controller itself imports this module
+    import mvc_mock_objects as mock
+    from model_view_controller import ModelBasic, View, Controller
+
+    model = ModelBasic(mock.items())
+    model.enable_stats()
+    c = Controller(model, View())
+    c.show_item("bread")
+    c.show_item("chocolate")
+    c.update_item("milk", price=1.2, quantity=20)
+    c.show_items()
+    print(model.stats_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,50 @@ MVC divides a given software application into three interconnected parts, so as
 to separate internal representations of information (Model) from the ways that
 information is presented to (View) or accepted from (Controller) the user.
 """
+
+import csv
+import importlib.util
+import io
+import itertools
+import json
+import sys
 import basic_backend
-import sqlite_backend
-import dataset_backend
 import mvc_exceptions as mvc_exc
 import mvc_mock_objects as mock
+from model_stats import ModelStats
+
+
+def lazy_import(name):
+    """Import a module the first time one of its attributes is accessed.
+
+    The database backends pull in heavy dependencies (e.g. dataset imports
+    SQLAlchemy), so we import them only when a Model that needs them is used.
+    A process that only uses ModelBasic never pays for them.
+
+    Parameters
+    ----------
+    name : str
+        name of the module
+
+    Returns
+    -------
+    module
+    """
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+sqlite_backend = lazy_import("sqlite_backend")
+dataset_backend = lazy_import("dataset_backend")
 
 
 class Model(object):
@@ -17,10 +56,30 @@ class Model(object):
     performs CRUD operations. The data can be stored in the Model itself or in
     a database. Only the Model can access the database. A Model never calls
     View's methods.
+
+    Call enable_stats() to record call counts, error counts and latencies of
+    the CRUD methods. Instrumentation shadows the methods on the instance, so
+    a Model that is not instrumented pays nothing for it.
     """
 
+    instrumented_methods = (
+        "create_item",
+        "create_items",
+        "read_item",
+        "read_items",
+        "read_many",
+        "search",
+        "update_item",
+        "delete_item",
+        "update_items",
+        "delete_items",
+        "aggregate",
+        "count",
+    )
+
     def __init__(self):
         self._item_type = "product"
+        self._stats = None
 
     @property
     def item_type(self):
@@ -48,18 +107,168 @@ class Model(object):
     def delete_item(self, name):
         raise NotImplementedError("Implement in subclass")
 
+    def update_items(self, items):
+        raise NotImplementedError("Implement in subclass")
+
+    def delete_items(self, names):
+        raise NotImplementedError("Implement in subclass")
+
+    def read_many(self, names):
+        """Read all items with the given names.
+
+        This default implementation calls read_item once per name. Models
+        backed by a database override it to read all the items with one
+        query (or a few, for very long lists).
+
+        Parameters
+        ----------
+        names : list
+
+        Returns
+        -------
+        tuple
+            (list of the items found, in the order of names; list of the names
+            that are not stored)
+        """
+        found, missing = list(), list()
+        for name in dict.fromkeys(names):
+            try:
+                found.append(self.read_item(name))
+            except mvc_exc.ItemNotStored:
+                missing.append(name)
+        return found, missing
+
+    def iter_items(self, chunk_size=1000):
+        """Iterate over all items, without holding all of them in memory.
+
+        This default implementation iterates over read_items. Models backed by
+        a database override it to fetch chunk_size items at a time.
+
+        Parameters
+        ----------
+        chunk_size : int
+            number of items fetched at a time
+
+        Returns
+        -------
+        iterator
+        """
+        return iter(self.read_items())
+
+    def search(self, query, limit=10):
+        """Items that match the words of the query, as typed in an autocomplete.
+
+        Every word of the query but the last one must be a word of the item
+        name. The last word can be the beginning of a word of the name.
+
+        This default implementation scans all the items. ModelBasic and
+        ModelSQLite (with search_index=True) look the words up in an index.
+
+        Parameters
+        ----------
+        query : str
+            one or more words, e.g. "choc" or "dark choc"
+        limit : int
+            maximum number of items to return
+
+        Returns
+        -------
+        list
+        """
+        terms = basic_backend.tokenize(query)
+        if not terms:
+            return list()
+        words, prefix = terms[:-1], terms[-1]
+        results = list()
+        for x in self.read_items():
+            name_words = basic_backend.tokenize(x["name"])
+            if all(w in name_words for w in words) and any(
+                w.startswith(prefix) for w in name_words
+            ):
+                results.append(x)
+                if len(results) == limit:
+                    break
+        return results
+
+    def aggregate(self, low_stock=None):
+        """Count the items and sum their quantity and value.
+
+        This default implementation makes a single pass over read_items().
+        Models backed by a database override it to push the work down to the
+        database, so that only the result is transferred.
+
+        Parameters
+        ----------
+        low_stock : int or None
+            if not None, also count the items with a quantity below this value
+
+        Returns
+        -------
+        dict
+            count, quantity and stock_value (i.e. sum of price * quantity) of
+            all items, plus low_stock if requested
+        """
+        count, quantity, stock_value, below = 0, 0, 0.0, 0
+        for x in self.read_items():
+            count += 1
+            quantity += x["quantity"]
+            stock_value += x["price"] * x["quantity"]
+            if low_stock is not None and x["quantity"] < low_stock:
+                below += 1
+        result = {"count": count, "quantity": quantity, "stock_value": stock_value}
+        if low_stock is not None:
+            result["low_stock"] = below
+        return result
+
+    def count(self, low_stock=None):
+        """Number of items, or of items with a quantity below low_stock."""
+        result = self.aggregate(low_stock)
+        return result["count"] if low_stock is None else result["low_stock"]
+
+    def enable_stats(self):
+        """Start recording statistics for the instrumented methods."""
+        if self._stats is not None:
+            return
+        self._stats = ModelStats()
+        for name in self.instrumented_methods:
+            method = getattr(self, name)
+            setattr(self, name, self._stats.instrument(name, method))
+
+    def disable_stats(self):
+        """Stop recording statistics and discard the ones recorded so far."""
+        if self._stats is None:
+            return
+        for name in self.instrumented_methods:
+            delattr(self, name)
+        self._stats = None
+
+    def stats(self):
+        """Statistics of the methods called since enable_stats().
+
+        Returns
+        -------
+        dict
+            method name -> calls, errors by exception type, and latency
+            histogram. Empty if statistics are not enabled.
+        """
+        return {} if self._stats is None else self._stats.as_dict()
+
+    def stats_json(self, **kwargs):
+        """Same as stats(), exported as a JSON string."""
+        return "{}" if self._stats is None else self._stats.to_json(**kwargs)
+
 
 class ModelBasic(Model):
     def __init__(self, application_items):
         # super().__init__()  # ok in Python 3.x, not in 2.x
         super(self.__class__, self).__init__()  # also ok in Python 2.x
-        self.create_items(application_items)
+        basic_backend.create_items(application_items)
 
     def create_item(self, name, price, quantity):
         basic_backend.create_item(name, price, quantity)
 
     def create_items(self, items):
-        basic_backend.create_items(items)
+        basic_backend.insert_items(items)
 
     def read_item(self, name):
         return basic_backend.read_item(name)
@@ -67,20 +276,49 @@ class ModelBasic(Model):
     def read_items(self):
         return basic_backend.read_items()
 
+    def read_many(self, names):
+        return basic_backend.read_many(names)
+
+    def search(self, query, limit=10):
+        return basic_backend.search(query, limit)
+
     def update_item(self, name, price, quantity):
         basic_backend.update_item(name, price, quantity)
 
     def delete_item(self, name):
         basic_backend.delete_item(name)
 
+    def update_items(self, items):
+        basic_backend.update_items(items)
+
+    def delete_items(self, names):
+        basic_backend.delete_items(names)
+
+    def aggregate(self, low_stock=None):
+        return basic_backend.aggregate(low_stock)
+
+    def count(self, low_stock=None):
+        return basic_backend.count(low_stock)
+
 
 class ModelSQLite(Model):
-    def __init__(self, application_items):
+    def __init__(self, application_items, connection=None, search_index=False):
         # super().__init__()  # ok in Python 3.x, not in 2.x
         super(self.__class__, self).__init__()  # also ok in Python 2.x
-        self._connection = sqlite_backend.connect_to_db(sqlite_backend.DB_name)
+        if connection is None:
+            connection = sqlite_backend.connect_to_db(sqlite_backend.DB_name)
+        self._connection = connection
         sqlite_backend.create_table(self.connection, self._item_type)
-        self.create_items(application_items)
+        try:
+            self.create_items(application_items)
+        except mvc_exc.ItemAlreadyStored as e:
+            # e.g. a database file populated by an earlier run
+            print(e)
+        # an FTS5 index on the names makes search fast, but every write has to
+        # update it too, so it's optional
+        self._search_index = search_index
+        if search_index:
+            sqlite_backend.create_search_index(self.connection, self._item_type)
 
     @property
     def connection(self):
@@ -102,6 +340,23 @@ class ModelSQLite(Model):
     def read_items(self):
         return sqlite_backend.select_all(self.connection, table_name=self.item_type)
 
+    def iter_items(self, chunk_size=1000):
+        return sqlite_backend.iter_all(
+            self.connection, table_name=self.item_type, chunk_size=chunk_size
+        )
+
+    def read_many(self, names):
+        return sqlite_backend.select_many(
+            self.connection, names, table_name=self.item_type
+        )
+
+    def search(self, query, limit=10):
+        if not self._search_index:
+            return Model.search(self, query, limit)
+        return sqlite_backend.search(
+            self.connection, query, table_name=self.item_type, limit=limit
+        )
+
     def update_item(self, name, price, quantity):
         sqlite_backend.update_one(
             self.connection, name, price, quantity, table_name=self.item_type
@@ -110,6 +365,32 @@ class ModelSQLite(Model):
     def delete_item(self, name):
         sqlite_backend.delete_one(self.connection, name, table_name=self.item_type)
 
+    def update_items(self, items):
+        sqlite_backend.update_many(self.connection, items, table_name=self.item_type)
+
+    def delete_items(self, names):
+        sqlite_backend.delete_many(self.connection, names, table_name=self.item_type)
+
+    def aggregate(self, low_stock=None):
+        return sqlite_backend.aggregate(
+            self.connection, table_name=self.item_type, low_stock=low_stock
+        )
+
+    def count(self, low_stock=None):
+        return sqlite_backend.count(
+            self.connection, table_name=self.item_type, low_stock=low_stock
+        )
+
+    def snapshot(self, path, pages_per_step=256, progress=None):
+        """Copy the database to a file without stopping the Model.
+
+        See sqlite_backend.backup_to_file. To serve reads from a snapshot, load
+        it in memory with ModelSQLite([], sqlite_backend.restore_from_file(path)).
+        """
+        return sqlite_backend.backup_to_file(
+            self.connection, path, pages_per_step=pages_per_step, progress=progress
+        )
+
 
 class ModelDataset(Model):
     def __init__(self, application_items):
@@ -119,7 +400,11 @@ class ModelDataset(Model):
             dataset_backend.DB_name, db_engine="postgres"
         )
         dataset_backend.create_table(self.connection, self._item_type)
-        self.create_items(application_items)
+        try:
+            self.create_items(application_items)
+        except mvc_exc.ItemAlreadyStored as e:
+            # e.g. a database populated by an earlier run
+            print(e)
 
     @property
     def connection(self):
@@ -141,6 +426,16 @@ class ModelDataset(Model):
     def read_items(self):
         return dataset_backend.select_all(self.connection, table_name=self.item_type)
 
+    def iter_items(self, chunk_size=1000):
+        return dataset_backend.iter_all(
+            self.connection, table_name=self.item_type, chunk_size=chunk_size
+        )
+
+    def read_many(self, names):
+        return dataset_backend.select_many(
+            self.connection, names, table_name=self.item_type
+        )
+
     def update_item(self, name, price, quantity):
         dataset_backend.update_one(
             self.connection, name, price, quantity, table_name=self.item_type
@@ -149,85 +444,256 @@ class ModelDataset(Model):
     def delete_item(self, name):
         dataset_backend.delete_one(self.connection, name, table_name=self.item_type)
 
+    def update_items(self, items):
+        dataset_backend.update_many(self.connection, items, table_name=self.item_type)
+
+    def delete_items(self, names):
+        dataset_backend.delete_many(self.connection, names, table_name=self.item_type)
+
+    def aggregate(self, low_stock=None):
+        return dataset_backend.aggregate(
+            self.connection, table_name=self.item_type, low_stock=low_stock
+        )
+
+    def count(self, low_stock=None):
+        return dataset_backend.count(
+            self.connection, table_name=self.item_type, low_stock=low_stock
+        )
+
+
+BANNER_SLASH = "//////////////////////////////////////////////////////////////\n"
+BANNER_STAR = "**************************************************************\n"
+BANNER_PLUS = "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++\n"
+BANNER_DASH = "--------------------------------------------------------------\n"
+BANNER_SPACED = "---   ---   ---   ---   ---   ---   ---   ---   ---   ---   --\n"
+
+# Templates are compiled once, as bound str.format methods, so that rendering a
+# long list costs one call per item and no attribute lookup.
+LIST_HEADER = "--- {} LIST ---\n".format
+BULLET_POINT = "* {}\n".format
+NUMBER_POINT = "{}. {}\n".format
+SHOW_ITEM = (
+    BANNER_SLASH
+    + "Good news, we have some {item}!\n{item_type} INFO: {item_info}\n"
+    + BANNER_SLASH
+).format
+MISSING_ITEM_ERROR = (
+    BANNER_STAR + "We are sorry, we have no {item}!\n{err}\n" + BANNER_STAR
+).format
+ITEM_ALREADY_STORED_ERROR = (
+    BANNER_STAR
+    + "Hey! We already have {item} in our {item_type} list!\n{err}\n"
+    + BANNER_STAR
+).format
+ITEM_NOT_YET_STORED_ERROR = (
+    BANNER_STAR
+    + "We don't have any {item} in our {item_type} list. Please insert it first!\n"
+    + "{err}\n"
+    + BANNER_STAR
+).format
+ITEM_STORED = (
+    BANNER_PLUS
+    + "Hooray! We have just added some {item} to our {item_type} list!\n"
+    + BANNER_PLUS
+).format
+CHANGE_ITEM_TYPE = (
+    BANNER_SPACED + 'Change item type from "{older}" to "{newer}"\n' + BANNER_SPACED
+).format
+ITEM_UPDATED = (
+    BANNER_SPACED
+    + "Change {item} price: {o_price} --> {n_price}\n"
+    + "Change {item} quantity: {o_quantity} --> {n_quantity}\n"
+    + BANNER_SPACED
+).format
+ITEM_DELETION = (
+    BANNER_DASH + "We have just removed {name} from our list\n" + BANNER_DASH
+).format
+ITEMS_STORED = "Added {} items to our {} list: {}\n".format
+ITEMS_UPDATED = "Changed {} items in our {} list\n".format
+ITEM_CHANGE = "{}: price {} --> {}, quantity {} --> {}\n".format
+ITEMS_DELETION = "We have just removed {} from our {} list\n".format
+ALREADY_STORED = "Already in our {} list: {}\n".format
+NOT_STORED = "Not in our {} list: {}\n".format
+CHANGES_HEADER = "--- {} CHANGES ---\n".format
+CHANGE_LINES = {
+    "created": "+ {}\n".format,
+    "updated": "~ {}\n".format,
+    "deleted": "- {}\n".format,
+}
+
+# the streaming renderers write only these fields, in this order, whatever
+# else (e.g. the id of a database row) the Model returns
+ITEM_FIELDS = ("name", "price", "quantity")
+JSON_LINE = json.JSONEncoder().encode
+
 
 class View(object):
     """The View class deals with how the data is presented to the user.
 
     A View should never call its own methods. Only a Controller should do it.
+
+    Every method renders its whole output into a single string, using the
+    templates defined above, and hands it to the sink with one write. Listing
+    100k items costs one write, not 100k print calls.
+
+    The exceptions are the streaming renderers, show_items_jsonl and
+    show_items_csv. They consume an iterator of items (e.g. Model.iter_items)
+    and write chunk_size items at a time, so exporting a million items never
+    holds more than one chunk of them, and of their text, in memory.
+
+    Parameters
+    ----------
+    sink : file-like object, str or None
+        where the View writes. It can be a stream (e.g. sys.stderr or an open
+        file), an in-memory buffer (e.g. io.StringIO) or the path of a file
+        that the View opens in append mode. If None, the View writes to
+        whatever sys.stdout is at the time of the write.
     """
 
-    @staticmethod
-    def show_bullet_point_list(item_type, items):
-        print("--- {} LIST ---".format(item_type.upper()))
-        for item in items:
-            print("* {}".format(item))
+    def __init__(self, sink=None):
+        self._owns_sink = isinstance(sink, str)
+        if self._owns_sink:
+            sink = open(sink, "a")
+        self._sink = sink
 
-    @staticmethod
-    def show_number_point_list(item_type, items):
-        print("--- {} LIST ---".format(item_type.upper()))
-        for i, item in enumerate(items):
-            print("{}. {}".format(i + 1, item))
+    @property
+    def sink(self):
+        return sys.stdout if self._sink is None else self._sink
 
-    @staticmethod
-    def show_item(item_type, item, item_info):
-        print("//////////////////////////////////////////////////////////////")
-        print("Good news, we have some {}!".format(item.upper()))
-        print("{} INFO: {}".format(item_type.upper(), item_info))
-        print("//////////////////////////////////////////////////////////////")
+    def write(self, text):
+        self.sink.write(text)
 
-    @staticmethod
-    def display_missing_item_error(item, err):
-        print("**************************************************************")
-        print("We are sorry, we have no {}!".format(item.upper()))
-        print("{}".format(err.args[0]))
-        print("**************************************************************")
+    def flush(self):
+        self.sink.flush()
 
-    @staticmethod
-    def display_item_already_stored_error(item, item_type, err):
-        print("**************************************************************")
-        print("Hey! We already have {} in our {} list!".format(item.upper(), item_type))
-        print("{}".format(err.args[0]))
-        print("**************************************************************")
+    def close(self):
+        """Close the sink, but only if the View opened it."""
+        if self._owns_sink:
+            self._sink.close()
+
+    def show_bullet_point_list(self, item_type, items):
+        self.write(LIST_HEADER(item_type.upper()) + "".join(map(BULLET_POINT, items)))
+
+    def show_number_point_list(self, item_type, items):
+        self.write(
+            LIST_HEADER(item_type.upper())
+            + "".join(map(NUMBER_POINT, itertools.count(1), items))
+        )
 
     @staticmethod
-    def display_item_not_yet_stored_error(item, item_type, err):
-        print("**************************************************************")
-        print(
-            "We don't have any {} in our {} list. Please insert it first!".format(
-                item.upper(), item_type
+    def _chunks(items, chunk_size):
+        items = iter(items)
+        return iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+    def show_items_jsonl(self, items, chunk_size=1000):
+        """Write the items as JSON Lines, i.e. one JSON object per line."""
+        for chunk in self._chunks(items, chunk_size):
+            self.write(
+                "".join(
+                    [
+                        JSON_LINE({k: x[k] for k in ITEM_FIELDS}) + "\n"
+                        for x in chunk
+                    ]
+                )
+            )
+
+    def show_items_csv(self, items, chunk_size=1000):
+        """Write the items as CSV, with a header line."""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(
+            buffer, ITEM_FIELDS, extrasaction="ignore", lineterminator="\n"
+        )
+        writer.writeheader()
+        self.write(buffer.getvalue())
+        for chunk in self._chunks(items, chunk_size):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(chunk)
+            self.write(buffer.getvalue())
+
+    def show_item(self, item_type, item, item_info):
+        self.write(
+            SHOW_ITEM(
+                item=item.upper(), item_type=item_type.upper(), item_info=item_info
             )
         )
-        print("{}".format(err.args[0]))
-        print("**************************************************************")
 
-    @staticmethod
-    def display_item_stored(item, item_type):
-        print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-        print(
-            "Hooray! We have just added some {} to our {} list!".format(
-                item.upper(), item_type
+    def display_missing_item_error(self, item, err):
+        self.write(MISSING_ITEM_ERROR(item=item.upper(), err=err.args[0]))
+
+    def display_item_already_stored_error(self, item, item_type, err):
+        self.write(
+            ITEM_ALREADY_STORED_ERROR(
+                item=item.upper(), item_type=item_type, err=err.args[0]
             )
         )
-        print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
 
-    @staticmethod
-    def display_change_item_type(older, newer):
-        print("---   ---   ---   ---   ---   ---   ---   ---   ---   ---   --")
-        print('Change item type from "{}" to "{}"'.format(older, newer))
-        print("---   ---   ---   ---   ---   ---   ---   ---   ---   ---   --")
+    def display_item_not_yet_stored_error(self, item, item_type, err):
+        self.write(
+            ITEM_NOT_YET_STORED_ERROR(
+                item=item.upper(), item_type=item_type, err=err.args[0]
+            )
+        )
 
-    @staticmethod
-    def display_item_updated(item, o_price, o_quantity, n_price, n_quantity):
-        print("---   ---   ---   ---   ---   ---   ---   ---   ---   ---   --")
-        print("Change {} price: {} --> {}".format(item, o_price, n_price))
-        print("Change {} quantity: {} --> {}".format(item, o_quantity, n_quantity))
-        print("---   ---   ---   ---   ---   ---   ---   ---   ---   ---   --")
+    def display_item_stored(self, item, item_type):
+        self.write(ITEM_STORED(item=item.upper(), item_type=item_type))
 
-    @staticmethod
-    def display_item_deletion(name):
-        print("--------------------------------------------------------------")
-        print("We have just removed {} from our list".format(name))
-        print("--------------------------------------------------------------")
+    def display_change_item_type(self, older, newer):
+        self.write(CHANGE_ITEM_TYPE(older=older, newer=newer))
+
+    def display_item_updated(self, item, o_price, o_quantity, n_price, n_quantity):
+        self.write(
+            ITEM_UPDATED(
+                item=item,
+                o_price=o_price,
+                o_quantity=o_quantity,
+                n_price=n_price,
+                n_quantity=n_quantity,
+            )
+        )
+
+    def display_item_deletion(self, name):
+        self.write(ITEM_DELETION(name=name))
+
+    def display_items_stored(self, item_type, stored, already_stored):
+        text = BANNER_PLUS + ITEMS_STORED(len(stored), item_type, stored)
+        if already_stored:
+            text += ALREADY_STORED(item_type, already_stored)
+        self.write(text + BANNER_PLUS)
+
+    def display_items_updated(self, item_type, changes, not_stored):
+        text = (
+            BANNER_SPACED
+            + ITEMS_UPDATED(len(changes), item_type)
+            + "".join(ITEM_CHANGE(x[0], x[1], x[3], x[2], x[4]) for x in changes)
+        )
+        if not_stored:
+            text += NOT_STORED(item_type, not_stored)
+        self.write(text + BANNER_SPACED)
+
+    def display_items_deletion(self, item_type, deleted, not_stored):
+        text = BANNER_DASH + ITEMS_DELETION(deleted, item_type)
+        if not_stored:
+            text += NOT_STORED(item_type, not_stored)
+        self.write(text + BANNER_DASH)
+
+    def show_changes(self, item_type, changes):
+        """Show the items created (+), updated (~) and deleted (-).
+
+        Parameters
+        ----------
+        item_type : str
+        changes : list
+            (version, kind, name, item) tuples, as returned by a Model with a
+            change feed. item is None for deleted items.
+        """
+        self.write(
+            CHANGES_HEADER(item_type.upper())
+            + "".join(
+                CHANGE_LINES[kind](name if item is None else item)
+                for _, kind, name, item in changes
+            )
+        )
 
 
 class Controller(object):
@@ -242,8 +708,29 @@ class Controller(object):
         self.model = model
         self.view = view
 
-    def show_items(self, bullet_points=False):
-        # items = self.model.get_items_generator()
+    def show_items(self, bullet_points=False, output="text", chunk_size=1000):
+        """Show all the items.
+
+        Parameters
+        ----------
+        bullet_points : bool
+            with output="text", a bullet point list instead of a numbered one
+        output : str
+            "text" for a list to read, "jsonl" (JSON Lines) or "csv" to export
+            the items. jsonl and csv stream the items from the Model
+            chunk_size at a time, however many they are.
+        chunk_size : int
+        """
+        if output == "jsonl":
+            self.view.show_items_jsonl(self.model.iter_items(chunk_size), chunk_size)
+            return
+        if output == "csv":
+            self.view.show_items_csv(self.model.iter_items(chunk_size), chunk_size)
+            return
+        if output != "text":
+            raise ValueError(
+                'output must be "text", "jsonl" or "csv", not {!r}'.format(output)
+            )
         items = self.model.read_items()
         item_type = self.model.item_type
         if bullet_points:
@@ -287,6 +774,30 @@ class Controller(object):
     # 2 options: do nothing or call insert_item to add it.
     # self.insert_item(name, price, quantity)
 
+    def show_changes(self, since_version=None):
+        """Show what changed since since_version, and return the new version.
+
+        This needs a Model with a change feed (e.g. change_feed.ChangeFeedModel).
+        If since_version is None, or the Model no longer has all the changes
+        since then, show the full list instead.
+
+        Returns
+        -------
+        int
+            the version to pass to the next call
+        """
+        item_type = self.model.item_type
+        if since_version is not None:
+            try:
+                version, changes = self.model.changes_since(since_version)
+                self.view.show_changes(item_type, changes)
+                return version
+            except mvc_exc.ChangesNotAvailable:
+                pass
+        version, items = self.model.read_items_versioned()
+        self.view.show_number_point_list(item_type, items)
+        return version
+
     def update_item_type(self, new_item_type):
         old_item_type = self.model.item_type
         self.model.item_type = new_item_type
@@ -300,6 +811,84 @@ class Controller(object):
         except mvc_exc.ItemNotStored as e:
             self.view.display_item_not_yet_stored_error(name, item_type, e)
 
+    def insert_items(self, items):
+        """Insert a batch of items with one Model call and one View render.
+
+        The whole batch is validated before touching the Model, which is asked
+        which items are already stored with a single read_many. These items
+        are skipped and reported in the summary.
+        """
+        names = [x["name"] for x in items]
+        for x in items:
+            assert x["price"] > 0, "price must be greater than 0"
+            assert x["quantity"] >= 0, "quantity must be greater than or equal to 0"
+        assert len(set(names)) == len(names), "{} more than once in the batch".format(
+            sorted(set(x for x in names if names.count(x) > 1))
+        )
+        item_type = self.model.item_type
+        found, _ = self.model.read_many(names)
+        stored = set(x["name"] for x in found)
+        new_items = [x for x in items if x["name"] not in stored]
+        already_stored = [x["name"] for x in items if x["name"] in stored]
+        names = [x["name"] for x in new_items]
+        try:
+            if new_items:
+                self.model.create_items(new_items)
+            self.view.display_items_stored(item_type, names, already_stored)
+        except mvc_exc.ItemAlreadyStored as e:
+            self.view.display_item_already_stored_error(", ".join(names), item_type, e)
+
+    def update_items(self, items):
+        """Update a batch of items with one Model call and one View render.
+
+        The whole batch is validated before touching the Model. Items that are
+        not stored yet are skipped and reported in the summary.
+        """
+        for x in items:
+            assert x["price"] > 0, "price must be greater than 0"
+            assert x["quantity"] >= 0, "quantity must be greater than or equal to 0"
+        item_type = self.model.item_type
+        found, _ = self.model.read_many([x["name"] for x in items])
+        older = {x["name"]: x for x in found}
+        to_update = [x for x in items if x["name"] in older]
+        not_stored = [x["name"] for x in items if x["name"] not in older]
+        try:
+            if to_update:
+                self.model.update_items(to_update)
+            changes = [
+                (
+                    x["name"],
+                    older[x["name"]]["price"],
+                    older[x["name"]]["quantity"],
+                    x["price"],
+                    x["quantity"],
+                )
+                for x in to_update
+            ]
+            self.view.display_items_updated(item_type, changes, not_stored)
+        except mvc_exc.ItemNotStored as e:
+            names = ", ".join(x["name"] for x in to_update)
+            self.view.display_item_not_yet_stored_error(names, item_type, e)
+
+    def delete_items(self, names):
+        """Delete a batch of items with one Model call and one View render.
+
+        Items that are not stored are skipped and reported in the summary.
+        """
+        item_type = self.model.item_type
+        found, _ = self.model.read_many(names)
+        stored = set(x["name"] for x in found)
+        to_delete = [name for name in names if name in stored]
+        not_stored = [name for name in names if name not in stored]
+        try:
+            if to_delete:
+                self.model.delete_items(to_delete)
+            self.view.display_items_deletion(item_type, to_delete, not_stored)
+        except mvc_exc.ItemNotStored as e:
+            self.view.display_item_not_yet_stored_error(
+                ", ".join(to_delete), item_type, e
+            )
+
 
 if __name__ == "__main__":
 
@@ -326,6 +915,32 @@ if __name__ == "__main__":
 
     c.show_items()
 
+    c.insert_items(
+        [
+            {"name": "beer", "price": 3.0, "quantity": 15},
+            {"name": "wine", "price": 9.0, "quantity": 3},
+        ]
+    )
+    c.update_items(
+        [
+            {"name": "beer", "price": 2.5, "quantity": 10},
+            {"name": "milk", "price": 1.5, "quantity": 5},
+            {"name": "fish", "price": 8.0, "quantity": 2},
+        ]
+    )
+    c.delete_items(["beer", "fish"])
+
+    c.show_items()
+
+    # the View can render into any sink, e.g. an in-memory buffer
+    buffer = io.StringIO()
+    Controller(c.model, View(buffer)).show_items(bullet_points=True)
+    print(buffer.getvalue())
+
+    # export the items, streamed from the Model a chunk at a time
+    c.show_items(output="jsonl")
+    c.show_items(output="csv")
+
     # we close the current sqlite database connection explicitly
     if type(c.model) is ModelSQLite:
         sqlite_backend.disconnect_from_db(sqlite_backend.DB_name, c.model.connection)
@@ -0,0 +1,343 @@
+"""Slow-query log and per-statement statistics for the SQLite backend.
+
+A connection opened with sqlite_backend.connect_to_db(..., query_log=log) is a
+ProfiledConnection: it times every statement run through execute,
+executemany and executescript, fetching its rows included. The QueryLog
+aggregates the timings per statement, and keeps the statements that took
+longer than a threshold together with the shape of their parameters (the
+types, never the values) and the output of EXPLAIN QUERY PLAN.
+
+Statements are grouped after replacing their literals with "?", so e.g.
+SELECT * FROM product WHERE name="bread" and ... name="milk" count as the same
+statement.
+"""
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from model_stats import LatencyHistogram
+
+logger = logging.getLogger("sqlite_backend.slow_queries")
+
+SlowQuery = namedtuple("SlowQuery", ["sql", "parameters", "seconds", "plan"])
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """Statement text with its literals replaced by ? and its spaces collapsed."""
+    return WHITESPACE.sub(" ", LITERALS.sub("?", sql)).strip()
+
+
+def parameters_shape(parameters, many=False):
+    """Types of the parameters of a statement, e.g. "(str, float, int)".
+
+    Parameters
+    ----------
+    parameters : sequence or dict
+        parameters of execute, or list of them for executemany
+    many : bool
+        True for the parameters of executemany
+
+    Returns
+    -------
+    str
+    """
+    if many:
+        if not parameters:
+            return "0 x ()"
+        return "{} x {}".format(len(parameters), parameters_shape(parameters[0]))
+    if isinstance(parameters, dict):
+        return "{{{}}}".format(
+            ", ".join(
+                "{}: {}".format(k, type(v).__name__) for k, v in parameters.items()
+            )
+        )
+    return "({})".format(", ".join(type(v).__name__ for v in parameters))
+
+
+def is_full_scan(plan):
+    """True if a query plan reads a whole table without using an index."""
+    return any(
+        detail.startswith("SCAN ") and "USING" not in detail and "VIRTUAL" not in detail
+        for detail in plan or ()
+    )
+
+
+class StatementStats(object):
+    """Statistics of a single (normalized) statement."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.errors = dict()
+        self.latency = LatencyHistogram()
+        self.plan = None
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": dict(self.errors),
+            "latency": self.latency.as_dict(),
+            "plan": self.plan,
+            "full_scan": is_full_scan(self.plan),
+        }
+
+
+class QueryLog(object):
+    """Timings of the statements run by one or more ProfiledConnection.
+
+    Parameters
+    ----------
+    threshold : float
+        statements that take longer than this, in seconds, are slow
+    explain_all : bool
+        if True, capture the query plan of every statement the first time it
+        runs, not only of slow statements, so that full_scans() finds them
+        before they get slow (e.g. in tests, with a small database)
+    max_entries : int
+        number of slow queries kept in memory
+    """
+
+    def __init__(self, threshold=0.1, explain_all=False, max_entries=1000):
+        self.threshold = threshold
+        self.explain_all = explain_all
+        self._slow_queries = deque(maxlen=max_entries)
+        self._statements = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def slow_queries(self):
+        """Slow statements, oldest first, as a list of SlowQuery."""
+        with self._lock:
+            return list(self._slow_queries)
+
+    def record(self, conn, sql, parameters, seconds, many=False, error=None):
+        """Record one run of a statement.
+
+        Parameters
+        ----------
+        conn : sqlite3.Connection
+            connection the statement ran on (used for EXPLAIN QUERY PLAN)
+        sql : str
+        parameters : sequence, dict or None
+            None for the statements of executescript, which are not explained
+        seconds : float
+        many : bool
+            True if the statement ran with executemany
+        error : Exception or None
+        """
+        key = normalize(sql)
+        slow = seconds >= self.threshold
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats(key)
+            stats.calls += 1
+            stats.latency.record(seconds)
+            if error is not None:
+                name = type(error).__name__
+                stats.errors[name] = stats.errors.get(name, 0) + 1
+            explain = stats.plan is None and (slow or self.explain_all)
+        if many and not parameters:
+            # an empty executemany: no parameters to explain the statement
+            # with, a later run will
+            explain = False
+        if explain and parameters is not None:
+            plan = self.explain(conn, sql, parameters[0] if many else parameters)
+            with self._lock:
+                stats.plan = plan
+        if slow:
+            entry = SlowQuery(
+                sql, parameters_shape(parameters or (), many), seconds, stats.plan
+            )
+            with self._lock:
+                self._slow_queries.append(entry)
+            logger.warning(
+                "slow query (%.1f ms): %s %s plan: %s",
+                seconds * 1000,
+                entry.sql,
+                entry.parameters,
+                entry.plan,
+            )
+
+    @staticmethod
+    def explain(conn, sql, parameters):
+        """Output of EXPLAIN QUERY PLAN, as a list of lines (None on errors)."""
+        try:
+            # a plain cursor, so that explaining isn't recorded in turn
+            c = sqlite3.Cursor(conn)
+            rows = c.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        except sqlite3.Error:
+            return None
+        return [row[-1] for row in rows]
+
+    def statements(self):
+        """Statistics of every statement, normalized statement -> dict."""
+        with self._lock:
+            return {key: s.as_dict() for key, s in self._statements.items()}
+
+    def full_scans(self):
+        """Statements whose captured query plan reads a whole table."""
+        with self._lock:
+            return [key for key, s in self._statements.items() if is_full_scan(s.plan)]
+
+    def to_json(self, **kwargs):
+        """Export the statistics as a JSON string (kwargs go to json.dumps)."""
+        return json.dumps(self.statements(), **kwargs)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports the time of its statements to a QueryLog.
+
+    The time of a statement includes fetching its rows. It is recorded when
+    the rows run out, when the cursor runs another statement, or when it is
+    closed or garbage collected.
+    """
+
+    _pending = None
+
+    def _start(self, sql, parameters, many, func, *args):
+        self._finish()
+        log = self.connection.query_log
+        if log is None:
+            return func(*args)
+        t0 = time.perf_counter()
+        try:
+            func(*args)
+        except Exception as e:
+            log.record(
+                self.connection,
+                sql,
+                parameters,
+                time.perf_counter() - t0,
+                many=many,
+                error=e,
+            )
+            raise
+        self._pending = [log, sql, parameters, many, time.perf_counter() - t0]
+        if self.description is None:
+            # no rows to fetch
+            self._finish()
+        return self
+
+    def _fetched(self, seconds, done):
+        if self._pending is not None:
+            self._pending[4] += seconds
+            if done:
+                self._finish()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            log, sql, parameters, many, seconds = pending
+            log.record(self.connection, sql, parameters, seconds, many=many)
+
+    def execute(self, sql, parameters=()):
+        return self._start(sql, parameters, False, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        return self._start(
+            sql,
+            seq_of_parameters,
+            True,
+            super().executemany,
+            sql,
+            seq_of_parameters,
+        )
+
+    def executescript(self, sql_script):
+        return self._start(sql_script, None, False, super().executescript, sql_script)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - t0, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(time.perf_counter() - t0, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - t0, True)
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(time.perf_counter() - t0, True)
+            raise
+        self._fetched(time.perf_counter() - t0, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose statements run on ProfiledCursor.
+
+    Pass it as factory to sqlite3.connect, then set its query_log.
+    """
+
+    query_log = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def main():
+    # imported here because sqlite_backend itself imports this module
+    import mvc_mock_objects as mock
+    import sqlite_backend
+
+    log = QueryLog(threshold=0.0001, explain_all=True)
+    conn = sqlite_backend.connect_to_db(query_log=log)
+    sqlite_backend.create_table(conn, "items")
+    sqlite_backend.insert_many(conn, mock.items(), table_name="items")
+    sqlite_backend.select_one(conn, "milk", table_name="items")
+    sqlite_backend.select_one(conn, "bread", table_name="items")
+    sqlite_backend.count(conn, table_name="items", low_stock=10)
+    # an empty batch is recorded, but can't be explained
+    sqlite_backend.update_many(conn, [], table_name="items")
+
+    print("Slow queries:")
+    for entry in log.slow_queries:
+        print(entry)
+    print("Full scans:")
+    for sql in log.full_scans():
+        print(sql)
+    print(log.to_json(indent=2))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
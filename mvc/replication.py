@@ -0,0 +1,301 @@
+"""Incremental replication from one Model to another.
+
+replicate() copies to a target Model only what changed in a source Model since
+the last time, reading the changes from the feed of a ChangeFeedModel. The
+target can be any Model (e.g. a ModelSQLite used as a local read cache of a
+primary store). Changes are applied in batches through create_items,
+update_items and delete_items, and the version reached after each batch can be
+saved to a state file, so that a replication that was interrupted resumes
+where it stopped instead of starting over. The state file also records the
+epoch of the source: after a restart the source counts versions from 0 again,
+and a version of the old history would skip changes of the new one.
+
+When the changes since the last version are no longer available (or there is
+no last version, or it belongs to another epoch), replicate() falls back to a
+full copy, and afterwards it is incremental again.
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+import mvc_exceptions as mvc_exc
+import mvc_mock_objects as mock
+import sqlite_backend
+from change_feed import ChangeFeedModel
+from model_view_controller import ModelBasic, ModelSQLite, View, Controller
+
+
+ReplicationStatus = namedtuple(
+    "ReplicationStatus",
+    ["epoch", "version", "full_copy", "created", "updated", "deleted", "lag"],
+)
+
+
+def load_state(state_file):
+    """Epoch and version saved in the state file.
+
+    Returns
+    -------
+    tuple
+        (epoch, version), (None, None) if there is no state file. The epoch
+        is None in a state file written before epochs were saved.
+    """
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    return state.get("epoch"), state["version"]
+
+
+def save_state(state_file, epoch, version):
+    """Save the epoch and the version in the state file, atomically."""
+    tmp_path = "{}.tmp".format(state_file)
+    with open(tmp_path, "w") as f:
+        json.dump({"epoch": epoch, "version": version}, f)
+    os.replace(tmp_path, state_file)
+
+
+def _record(item):
+    return {"name": item["name"], "price": item["price"], "quantity": item["quantity"]}
+
+
+def _apply(target, records, deleted, batch_size):
+    """Store records (name -> item) and delete names (deleted) in target.
+
+    Returns
+    -------
+    tuple
+        number of items created, updated and deleted
+    """
+    found, _ = target.read_many(list(records) + list(deleted))
+    stored = {x["name"]: _record(x) for x in found}
+    creates = [x for name, x in records.items() if name not in stored]
+    # items that target already has as they are don't need to be written
+    updates = [x for name, x in records.items() if name in stored and stored[name] != x]
+    deletes = [name for name in deleted if name in stored]
+    for i in range(0, len(creates), batch_size):
+        target.create_items(creates[i : i + batch_size])
+    for i in range(0, len(updates), batch_size):
+        target.update_items(updates[i : i + batch_size])
+    for i in range(0, len(deletes), batch_size):
+        target.delete_items(deletes[i : i + batch_size])
+    return len(creates), len(updates), len(deletes)
+
+
+def replicate(
+    source, target, since_version=None, batch_size=500, state_file=None, epoch=None
+):
+    """Apply to target the changes made to source after since_version.
+
+    Parameters
+    ----------
+    source : change_feed.ChangeFeedModel
+    target : Model
+        it should not be written by anybody else, or the two would diverge
+    since_version : int or None
+        last version of source already in target. If None, use the version
+        saved in state_file; if there isn't one either, copy everything.
+    epoch : str or None
+        epoch of source that since_version belongs to. If it isn't the epoch
+        of source, since_version is ignored and everything is copied. If None,
+        since_version is taken to belong to the epoch of source.
+    batch_size : int
+        maximum number of changes applied (and items written) at a time
+    state_file : str or None
+        if not None, save there the epoch and the version reached after each
+        batch
+
+    Returns
+    -------
+    ReplicationStatus
+        epoch and version of source now in target, whether a full copy was
+        needed, number of items created, updated and deleted in target, and
+        lag (number of changes made to source meanwhile, not yet replicated)
+    """
+    if since_version is None and state_file is not None:
+        epoch, since_version = load_state(state_file)
+        if epoch is None:
+            # the version of an old state file could belong to any epoch
+            since_version = None
+    if epoch is not None and epoch != source.epoch:
+        # source restarted, its versions count from 0 again
+        since_version = None
+    counts = [0, 0, 0]
+
+    changes = None
+    if since_version is not None:
+        try:
+            version, changes = source.changes_since(since_version)
+        except mvc_exc.ChangesNotAvailable:
+            pass
+
+    if changes is None:
+        # full copy: store every item of source, delete what target has more
+        version, items = source.read_items_versioned()
+        records = {x["name"]: _record(x) for x in items}
+        deleted = set(x["name"] for x in target.read_items()).difference(records)
+        counts = _apply(target, records, deleted, batch_size)
+        if state_file is not None:
+            save_state(state_file, source.epoch, version)
+    else:
+        for start in range(0, len(changes), batch_size):
+            batch = changes[start : start + batch_size]
+            # only the last change of each item in the batch matters
+            records, deleted = dict(), set()
+            for change in batch:
+                if change.kind == "deleted":
+                    records.pop(change.name, None)
+                    deleted.add(change.name)
+                else:
+                    records[change.name] = _record(change.item)
+                    deleted.discard(change.name)
+            for i, n in enumerate(_apply(target, records, deleted, batch_size)):
+                counts[i] += n
+            if state_file is not None:
+                save_state(state_file, source.epoch, batch[-1].version)
+
+    return ReplicationStatus(
+        source.epoch,
+        version,
+        changes is None,
+        counts[0],
+        counts[1],
+        counts[2],
+        source.version - version,
+    )
+
+
+class Replicator(object):
+    """Keep a target Model in sync with a source ChangeFeedModel.
+
+    Call sync() to replicate now, or start() to replicate every interval
+    seconds in a background thread.
+
+    Parameters
+    ----------
+    source : change_feed.ChangeFeedModel
+    target : Model
+        a ModelSQLite synced in the background needs a connection opened with
+        check_same_thread=False
+    interval : float
+        seconds between two syncs of the background thread
+    batch_size : int
+    state_file : str or None
+        see replicate
+    """
+
+    def __init__(self, source, target, interval=1.0, batch_size=500, state_file=None):
+        self._source = source
+        self._target = target
+        self._interval = interval
+        self._batch_size = batch_size
+        self._state_file = state_file
+        self._epoch, self._version = None, None
+        if state_file is not None:
+            self._epoch, self._version = load_state(state_file)
+        self._status = None
+        self._synced_at = None
+        self._errors = list()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wake_up = threading.Condition()
+        self._thread = None
+
+    @property
+    def version(self):
+        """Version of source replicated to target (None before the first sync)."""
+        return self._version
+
+    @property
+    def status(self):
+        """ReplicationStatus of the last sync, or None."""
+        return self._status
+
+    @property
+    def lag(self):
+        """Number of changes made to source and not yet replicated."""
+        if self._version is None or self._epoch != self._source.epoch:
+            return self._source.version
+        return self._source.version - self._version
+
+    @property
+    def seconds_since_sync(self):
+        """Time since the last successful sync (None before the first one)."""
+        if self._synced_at is None:
+            return None
+        return time.monotonic() - self._synced_at
+
+    @property
+    def errors(self):
+        """Syncs that failed in the background thread, as a list of exceptions."""
+        return list(self._errors)
+
+    def sync(self):
+        with self._lock:
+            self._status = replicate(
+                self._source,
+                self._target,
+                since_version=self._version,
+                batch_size=self._batch_size,
+                state_file=self._state_file,
+                epoch=self._epoch,
+            )
+            self._epoch = self._status.epoch
+            self._version = self._status.version
+            self._synced_at = time.monotonic()
+            return self._status
+
+    def _run(self):
+        while True:
+            with self._wake_up:
+                if not self._closed:
+                    self._wake_up.wait(self._interval)
+                if self._closed:
+                    return
+            try:
+                self.sync()
+            except Exception as e:
+                # the target keeps serving the last version, try again later
+                self._errors.append(e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the background thread (if any) and sync one last time."""
+        with self._wake_up:
+            self._closed = True
+            self._wake_up.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.sync()
+
+
+def main():
+
+    primary = ChangeFeedModel(ModelBasic(mock.items()))
+    cache = ModelSQLite([], connection=sqlite_backend.connect_to_db())
+    state_file = "replication_state.json"
+    replicator = Replicator(primary, cache, state_file=state_file)
+
+    # the first sync copies everything...
+    print(replicator.sync())
+
+    c = Controller(primary, View())
+    c.insert_item("beer", price=3.0, quantity=15)
+    c.update_item("milk", price=1.2, quantity=20)
+    c.delete_item("wine")
+    print("Lag: {} changes".format(replicator.lag))
+
+    # ...the next ones only what changed
+    print(replicator.sync())
+    Controller(cache, View()).show_items()
+
+    os.remove(state_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""SQLite Model sharded across several database files.
+
+A single SQLite file serializes every writer. ShardedModelSQLite spreads the
+items over N database files, routing each item by a hash of its name, so
+writers to different shards don't wait for each other. Point reads and writes
+touch a single shard; read_items and the batch operations fan out to all the
+shards involved in parallel, with a thread pool, and merge the results.
+
+Note: a batch that spans several shards is atomic on each shard, but not
+across shards.
+"""
+
+import heapq
+import itertools
+import operator
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import mvc_exceptions as mvc_exc
+import mvc_mock_objects as mock
+import sqlite_backend
+from model_view_controller import Model, ModelSQLite, View, Controller
+
+by_name = operator.itemgetter("name")
+
+
+class ShardedModelSQLite(Model):
+    """Model that stores items in n_shards SQLite databases.
+
+    Parameters
+    ----------
+    application_items : list
+        items to store when the Model is created
+    n_shards : int
+        number of database files. Shard i is stored in <db>_shard<i>.db
+    db : str
+        database name (without .db extension) used as prefix of the shards
+    search_index : bool
+        if True, every shard keeps a FTS5 index on the item names
+    """
+
+    def __init__(
+        self,
+        application_items,
+        n_shards=4,
+        db=sqlite_backend.DB_name,
+        search_index=False,
+    ):
+        super().__init__()
+        self._shards = list()
+        self._locks = list()
+        for i in range(n_shards):
+            # shards are used by the threads of the pool, not by their creator
+            connection = sqlite_backend.connect_to_db(
+                "{}_shard{}".format(db, i), check_same_thread=False
+            )
+            self._shards.append(
+                ModelSQLite([], connection=connection, search_index=search_index)
+            )
+            self._locks.append(threading.Lock())
+        self._executor = ThreadPoolExecutor(max_workers=n_shards)
+        try:
+            self.create_items(application_items)
+        except mvc_exc.ItemAlreadyStored as e:
+            # e.g. shard files populated by an earlier run
+            print(e)
+
+    @property
+    def n_shards(self):
+        return len(self._shards)
+
+    @property
+    def connections(self):
+        return [shard.connection for shard in self._shards]
+
+    @property
+    def item_type(self):
+        return self._item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        self._item_type = new_item_type
+        for i, shard in enumerate(self._shards):
+            with self._locks[i]:
+                shard.item_type = new_item_type
+
+    def shard_of(self, name):
+        """Index of the shard that stores the item with this name.
+
+        crc32 is stable across processes (unlike hash(), which is salted), so
+        an item is always routed to the same database file.
+        """
+        return zlib.crc32(name.encode("utf-8")) % len(self._shards)
+
+    def _call(self, i, method, *args):
+        with self._locks[i]:
+            return getattr(self._shards[i], method)(*args)
+
+    def _fan_out(self, method, args_by_shard):
+        """Call method on every shard in args_by_shard, in parallel.
+
+        Parameters
+        ----------
+        method : str
+            name of the ModelSQLite method
+        args_by_shard : dict
+            shard index -> tuple of arguments
+
+        Returns
+        -------
+        dict
+            shard index -> result. If one of the calls raised, the first
+            exception is raised after all the calls have completed.
+        """
+        futures = {
+            i: self._executor.submit(self._call, i, method, *args)
+            for i, args in args_by_shard.items()
+        }
+        results, error = dict(), None
+        for i, future in futures.items():
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return results
+
+    def _group(self, items, key):
+        groups = dict()
+        for x in items:
+            groups.setdefault(self.shard_of(key(x)), list()).append(x)
+        return {i: (group,) for i, group in groups.items()}
+
+    def create_item(self, name, price, quantity):
+        self._call(self.shard_of(name), "create_item", name, price, quantity)
+
+    def create_items(self, items):
+        self._fan_out("create_items", self._group(items, by_name))
+
+    def read_item(self, name):
+        return self._call(self.shard_of(name), "read_item", name)
+
+    def _read_sorted(self, i):
+        return sorted(self._call(i, "read_items"), key=by_name)
+
+    def read_items(self):
+        futures = [
+            self._executor.submit(self._read_sorted, i)
+            for i in range(len(self._shards))
+        ]
+        # each shard sorts its own items in a pool thread, so we only need a
+        # k-way merge to get all the items ordered by name
+        return list(heapq.merge(*[f.result() for f in futures], key=by_name))
+
+    def iter_items(self, chunk_size=1000):
+        """Iterate over the items of one shard after the other.
+
+        Unlike read_items, the items are not ordered by name.
+        """
+        for i, shard in enumerate(self._shards):
+            with self._locks[i]:
+                items = shard.iter_items(chunk_size)
+            while True:
+                # writers to this shard get in between two chunks
+                with self._locks[i]:
+                    chunk = list(itertools.islice(items, chunk_size))
+                if not chunk:
+                    break
+                yield from chunk
+
+    def read_many(self, names):
+        names = list(dict.fromkeys(names))
+        found = dict()
+        for partial, _ in self._fan_out(
+            "read_many", self._group(names, lambda name: name)
+        ).values():
+            found.update((x["name"], x) for x in partial)
+        return (
+            [found[name] for name in names if name in found],
+            [name for name in names if name not in found],
+        )
+
+    def search(self, query, limit=10):
+        """Items that match the words of the query, ordered by name.
+
+        Each shard returns up to limit matches in the order of its own search,
+        not by name. When more than limit items match, which ones are returned
+        depends on the shards, so they are not necessarily the first ones by
+        name.
+        """
+        every_shard = {i: (query, limit) for i in range(len(self._shards))}
+        results = self._fan_out("search", every_shard).values()
+        # any shard may have some of the matches, so each one returns up to
+        # limit items and we keep limit of them
+        return heapq.nsmallest(limit, itertools.chain(*results), key=by_name)
+
+    def update_item(self, name, price, quantity):
+        self._call(self.shard_of(name), "update_item", name, price, quantity)
+
+    def delete_item(self, name):
+        self._call(self.shard_of(name), "delete_item", name)
+
+    def update_items(self, items):
+        self._fan_out("update_items", self._group(items, by_name))
+
+    def delete_items(self, names):
+        self._fan_out("delete_items", self._group(names, lambda name: name))
+
+    def aggregate(self, low_stock=None):
+        every_shard = {i: (low_stock,) for i in range(len(self._shards))}
+        result = dict()
+        for partial in self._fan_out("aggregate", every_shard).values():
+            for key, value in partial.items():
+                result[key] = result.get(key, 0) + value
+        return result
+
+    def count(self, low_stock=None):
+        every_shard = {i: (low_stock,) for i in range(len(self._shards))}
+        return sum(self._fan_out("count", every_shard).values())
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for connection in self.connections:
+            connection.close()
+
+
+def main():
+
+    model = ShardedModelSQLite(mock.items(), n_shards=2)
+    c = Controller(model, View())
+
+    for name in ("bread", "milk", "wine"):
+        print("{} is stored in shard {}".format(name, model.shard_of(name)))
+
+    c.insert_items(
+        [
+            {"name": "beer", "price": 3.0, "quantity": 15},
+            {"name": "chocolate", "price": 2.0, "quantity": 10},
+        ]
+    )
+    c.update_item("milk", price=1.2, quantity=20)
+    c.show_items()
+    print(model.aggregate(low_stock=10))
+
+    c.delete_items(["beer", "chocolate"])
+    model.close()
+
+
+if __name__ == "__main__":
+    main()
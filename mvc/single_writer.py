@@ -0,0 +1,306 @@
+"""Single writer process for a SQLite database shared by several processes.
+
+When several processes write to the same database file, each commit takes
+the database lock, and under load the writers time out with "database is
+locked". Here a single process, started by SingleWriter, owns the only
+connection that writes. The other processes use a SingleWriterModel: it sends
+every write to the writer process over a pipe and waits for the reply, and it
+reads the database directly, with its own connection.
+
+The writer takes all the writes waiting in the pipes and applies them in a
+single transaction (or in a few, of at most batch_size writes each). Each
+write runs inside its own savepoint, so that a write that fails (e.g.
+ItemAlreadyStored) is rolled back alone. A commit costs about the same for one
+write or for a hundred, so the more processes send writes, the larger the
+batches and the higher the throughput.
+
+The database is in WAL mode, where readers don't block the writer and the
+writer doesn't block readers.
+"""
+import multiprocessing
+import multiprocessing.connection
+import os
+import sqlite3
+import threading
+import mvc_mock_objects as mock
+import sqlite_backend
+from model_view_controller import Model, ModelSQLite, View, Controller
+
+
+class SavepointConnection(sqlite3.Connection):
+    """Connection that runs each write of a batch in its own savepoint.
+
+    The sqlite_backend functions call commit() when a write succeeds, and
+    rollback() when it fails. Between begin_savepoint() and end_savepoint(),
+    they release or roll back the savepoint instead, so the batch as a whole
+    is committed once, by commit_batch().
+
+    Open it with isolation_level=None: the writer, not the sqlite3 module,
+    decides when transactions begin and end.
+    """
+
+    _savepoint = False
+
+    def begin_savepoint(self):
+        super().execute("SAVEPOINT write")
+        self._savepoint = True
+
+    def end_savepoint(self, failed):
+        if self._savepoint:
+            if failed:
+                super().execute("ROLLBACK TO SAVEPOINT write")
+            super().execute("RELEASE SAVEPOINT write")
+            self._savepoint = False
+
+    def commit(self):
+        if self._savepoint:
+            self.end_savepoint(failed=False)
+        else:
+            super().commit()
+
+    def rollback(self):
+        if self._savepoint:
+            self.end_savepoint(failed=True)
+        else:
+            super().rollback()
+
+    def commit_batch(self):
+        super().execute("COMMIT")
+
+
+def serve(db, connections, batch_size):
+    """Loop of the writer process: apply the writes sent by the clients.
+
+    Parameters
+    ----------
+    db : str
+        database name (without .db extension)
+    connections : list of multiprocessing.connection.Connection
+        one per client. A client sends (sequence number, item type, method,
+        args) and gets back (sequence number, exception or None). The last
+        connection is the control one: anything sent on it stops the writer.
+    batch_size : int
+        maximum number of writes committed together
+    """
+    connection = sqlite3.connect(
+        "{}.db".format(db), factory=SavepointConnection, isolation_level=None
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    control = connections[-1]
+    clients = list(connections[:-1])
+    models = dict()
+    stop = False
+    while not stop:
+        # every client waits for the reply to its request before sending the
+        # next one, so each ready client has exactly one request for us
+        batch = list()
+        for conn in multiprocessing.connection.wait(clients + [control]):
+            if conn is control:
+                stop = True
+                continue
+            try:
+                batch.append((conn, conn.recv()))
+            except EOFError:
+                clients.remove(conn)
+        if not batch:
+            continue
+
+        # creating a table is not part of the batch
+        for _, (_, item_type, _, _) in batch:
+            if item_type not in models:
+                model = ModelSQLite([], connection=connection)
+                model.item_type = item_type
+                sqlite_backend.create_table(connection, item_type)
+                models[item_type] = model
+
+        for start in range(0, len(batch), batch_size):
+            results = list()
+            connection.execute("BEGIN IMMEDIATE")
+            for conn, (seq, item_type, method, args) in batch[
+                start : start + batch_size
+            ]:
+                connection.begin_savepoint()
+                try:
+                    getattr(models[item_type], method)(*args)
+                    error = None
+                except Exception as e:
+                    error = e
+                connection.end_savepoint(failed=error is not None)
+                results.append((conn, seq, error))
+            try:
+                connection.commit_batch()
+            except sqlite3.Error as e:
+                connection.rollback()
+                results = [(conn, seq, e) for conn, seq, _ in results]
+
+            # reply only once the writes are committed
+            for conn, seq, error in results:
+                conn.send((seq, error))
+    connection.close()
+
+
+class SingleWriterModel(Model):
+    """Model used by a client process of a SingleWriter.
+
+    Writes go to the writer process, reads go directly to the database. Get
+    one from SingleWriter.client(); it can be passed to a child process.
+    """
+
+    def __init__(self, db, writer):
+        super().__init__()
+        self._db = db
+        self._writer = writer
+        self._seq = 0
+        self._connection = None
+        self._lock = None
+        self._pid = None
+
+    def __getstate__(self):
+        # the connection and the lock belong to the process that opened them
+        state = self.__dict__.copy()
+        state.update(_connection=None, _lock=None, _pid=None)
+        return state
+
+    def _open(self):
+        if self._pid != os.getpid():
+            self._connection = sqlite_backend.connect_to_db(self._db)
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    @property
+    def connection(self):
+        """Read connection of this process."""
+        self._open()
+        return self._connection
+
+    def _write(self, method, *args):
+        self._open()
+        # one request at a time, so that the replies come back in order
+        with self._lock:
+            self._seq += 1
+            self._writer.send((self._seq, self.item_type, method, args))
+            seq, error = self._writer.recv()
+            assert seq == self._seq, "reply {} to request {}".format(seq, self._seq)
+        if error is not None:
+            raise error
+
+    def create_item(self, name, price, quantity):
+        self._write("create_item", name, price, quantity)
+
+    def create_items(self, items):
+        self._write("create_items", items)
+
+    def update_item(self, name, price, quantity):
+        self._write("update_item", name, price, quantity)
+
+    def delete_item(self, name):
+        self._write("delete_item", name)
+
+    def update_items(self, items):
+        self._write("update_items", items)
+
+    def delete_items(self, names):
+        self._write("delete_items", names)
+
+    def read_item(self, name):
+        return sqlite_backend.select_one(
+            self.connection, name, table_name=self.item_type
+        )
+
+    def read_items(self):
+        return sqlite_backend.select_all(self.connection, table_name=self.item_type)
+
+    def iter_items(self, chunk_size=1000):
+        return sqlite_backend.iter_all(
+            self.connection, table_name=self.item_type, chunk_size=chunk_size
+        )
+
+    def read_many(self, names):
+        return sqlite_backend.select_many(
+            self.connection, names, table_name=self.item_type
+        )
+
+    def aggregate(self, low_stock=None):
+        return sqlite_backend.aggregate(
+            self.connection, table_name=self.item_type, low_stock=low_stock
+        )
+
+    def count(self, low_stock=None):
+        return sqlite_backend.count(
+            self.connection, table_name=self.item_type, low_stock=low_stock
+        )
+
+
+class SingleWriter(object):
+    """Start the writer process of a database and hand out its clients.
+
+    Parameters
+    ----------
+    db : str
+        database name (without .db extension)
+    n_clients : int
+        number of clients, i.e. of processes that write to the database
+    batch_size : int
+        maximum number of writes committed together
+    """
+
+    def __init__(self, db=sqlite_backend.DB_name, n_clients=4, batch_size=256):
+        self._db = db
+        pipes = [multiprocessing.Pipe() for _ in range(n_clients + 1)]
+        self._clients = [client for client, _ in pipes[:-1]]
+        self._control = pipes[-1][0]
+        self._process = multiprocessing.Process(
+            target=serve,
+            args=(db, [writer for _, writer in pipes], batch_size),
+            daemon=True,
+        )
+        self._process.start()
+
+    @property
+    def n_clients(self):
+        return len(self._clients)
+
+    def client(self, i):
+        """Model for the i-th client process (0 <= i < n_clients)."""
+        return SingleWriterModel(self._db, self._clients[i])
+
+    def close(self):
+        """Apply the writes already received, then stop the writer process."""
+        self._control.send(None)
+        self._process.join()
+
+
+def worker(model, names):
+    c = Controller(model, View())
+    for name in names:
+        c.insert_item(name, price=1.0, quantity=10)
+    c.update_item(names[0], price=2.0, quantity=5)
+
+
+def main():
+
+    db = "myDB_single_writer"
+    writer = SingleWriter(db, n_clients=2)
+    model = writer.client(0)
+    model.create_items(mock.items())
+
+    # two processes write at the same time through the writer process
+    processes = [
+        multiprocessing.Process(target=worker, args=(writer.client(i), names))
+        for i, names in enumerate([["beer", "chocolate"], ["pizza", "bread"]])
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    # this process reads the database directly
+    Controller(model, View()).show_items()
+    writer.close()
+    for suffix in (".db", ".db-wal", ".db-shm"):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+
+
+if __name__ == "__main__":
+    main()
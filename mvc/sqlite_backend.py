@@ -7,16 +7,20 @@ Documentation:
 https://www.sqlite.org/datatype3.html
 https://docs.python.org/3/library/sqlite3.html
 """
+import os
+import re
 import sqlite3
+import time
 from sqlite3 import OperationalError, IntegrityError, ProgrammingError
 import mvc_exceptions as mvc_exc
 import mvc_mock_objects as mock
+from query_log import ProfiledConnection
 
 
 DB_name = "myDB"
 
 
-def connect_to_db(db=None):
+def connect_to_db(db=None, check_same_thread=True, query_log=None):
     """Connect to a sqlite DB. Create the database if there isn't one yet.
 
     Opens a connection to a SQLite DB (either a DB file or an in-memory DB).
@@ -28,6 +32,13 @@ def connect_to_db(db=None):
     ----------
     db : str
         database name (without .db extension). If None, create an In-Memory DB.
+    check_same_thread : bool
+        if False, the connection can be used by threads other than the one
+        that created it. The caller is then responsible for not using it from
+        two threads at the same time.
+    query_log : query_log.QueryLog or None
+        if not None, time every statement run on the connection and report
+        it to this log (see query_log.py)
 
     Returns
     -------
@@ -40,7 +51,13 @@ def connect_to_db(db=None):
     else:
         mydb = "{}.db".format(db)
         print("New connection to SQLite DB...")
-    connection = sqlite3.connect(mydb)
+    if query_log is None:
+        connection = sqlite3.connect(mydb, check_same_thread=check_same_thread)
+    else:
+        connection = sqlite3.connect(
+            mydb, check_same_thread=check_same_thread, factory=ProfiledConnection
+        )
+        connection.query_log = query_log
     return connection
 
 
@@ -130,6 +147,9 @@ def insert_one(conn, name, price, quantity, table_name):
         conn.execute(sql, (name, price, quantity))
         conn.commit()
     except IntegrityError as e:
+        # the failed INSERT left a transaction open: a later snapshot would
+        # wait for it forever
+        conn.rollback()
         raise mvc_exc.ItemAlreadyStored(
             '{}: "{}" already stored in table "{}"'.format(e, name, table_name)
         )
@@ -137,6 +157,13 @@ def insert_one(conn, name, price, quantity, table_name):
 
 @connect
 def insert_many(conn, items, table_name):
+    """Insert all items in a single transaction.
+
+    Raises
+    ------
+    mvc_exc.ItemAlreadyStored: if at least one item is already stored in the
+    table, or is twice in items. In this case no item is inserted.
+    """
     table_name = scrub(table_name)
     sql = "INSERT INTO {} ('name', 'price', 'quantity') VALUES (?, ?, ?)".format(
         table_name
@@ -148,7 +175,10 @@ def insert_many(conn, items, table_name):
         conn.executemany(sql, entries)
         conn.commit()
     except IntegrityError as e:
-        print(
+        # don't leave the items inserted before the duplicate in an open
+        # transaction, where the next commit would store them
+        conn.rollback()
+        raise mvc_exc.ItemAlreadyStored(
             '{}: at least one in {} was already stored in table "{}"'.format(
                 e, [x["name"] for x in items], table_name
             )
@@ -182,6 +212,80 @@ def select_all(conn, table_name):
     return list(map(lambda x: tuple_to_dict(x), results))
 
 
+@connect
+def iter_all(conn, table_name, chunk_size=1000):
+    """Iterate over all items in a table, chunk_size rows at a time.
+
+    Unlike select_all, only one chunk of rows is in memory at any time, so
+    this can go through a table of any size.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+    table_name : str
+    chunk_size : int
+        number of rows fetched from the database at a time
+
+    Returns
+    -------
+    generator
+        of dictionaries. Each dict is a record.
+    """
+    table_name = scrub(table_name)
+    c = conn.execute("SELECT * FROM {}".format(table_name))
+    return _iter_rows(c, chunk_size)
+
+
+def _iter_rows(c, chunk_size):
+    # a separate generator, so that the query runs (and fails, e.g. if there
+    # is no table) when iter_all is called, not at the first next()
+    try:
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from map(tuple_to_dict, rows)
+    finally:
+        c.close()
+
+
+# SQLite limits the number of host parameters in a statement (999 before
+# version 3.32), so long lists of names are queried in chunks.
+MAX_VARIABLES = 500
+
+
+@connect
+def select_many(conn, names, table_name):
+    """Select all items with the given names, with as few queries as possible.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+    names : list
+    table_name : str
+
+    Returns
+    -------
+    tuple
+        (list of the items found, in the order of names; list of the names
+        that are not stored)
+    """
+    table_name = scrub(table_name)
+    names = list(dict.fromkeys(names))  # drop duplicates, keep the order
+    found = dict()
+    for i in range(0, len(names), MAX_VARIABLES):
+        chunk = names[i : i + MAX_VARIABLES]
+        sql = "SELECT * FROM {} WHERE name IN ({})".format(
+            table_name, ", ".join("?" * len(chunk))
+        )
+        for row in conn.execute(sql, chunk):
+            found[row[1]] = tuple_to_dict(row)
+    return (
+        [found[name] for name in names if name in found],
+        [name for name in names if name not in found],
+    )
+
+
 @connect
 def update_one(conn, name, price, quantity, table_name):
     table_name = scrub(table_name)
@@ -223,6 +327,299 @@ def delete_one(conn, name, table_name):
         )
 
 
+@connect
+def update_many(conn, items, table_name):
+    """Update all items in a single transaction.
+
+    If at least one item is not stored in the table the transaction is rolled
+    back, so either all items are updated or none of them is.
+
+    Raises
+    ------
+    mvc_exc.ItemNotStored: if at least one item is not stored in the table.
+    """
+    table_name = scrub(table_name)
+    sql = "UPDATE {} SET price=?, quantity=? WHERE name=?".format(table_name)
+    entries = [(x["price"], x["quantity"], x["name"]) for x in items]
+    c = conn.executemany(sql, entries)
+    if c.rowcount == len(entries):
+        conn.commit()
+    else:
+        conn.rollback()
+        raise mvc_exc.ItemNotStored(
+            'Can\'t update: at least one in {} is not stored in table "{}"'.format(
+                [x["name"] for x in items], table_name
+            )
+        )
+
+
+@connect
+def delete_many(conn, names, table_name):
+    """Delete all items in a single transaction.
+
+    If at least one item is not stored in the table the transaction is rolled
+    back, so either all items are deleted or none of them is.
+
+    Raises
+    ------
+    mvc_exc.ItemNotStored: if at least one item is not stored in the table.
+    """
+    table_name = scrub(table_name)
+    sql = "DELETE FROM {} WHERE name=?".format(table_name)
+    # a name given twice is deleted once, and counted once
+    entries = [(name,) for name in dict.fromkeys(names)]
+    c = conn.executemany(sql, entries)
+    if c.rowcount == len(entries):
+        conn.commit()
+    else:
+        conn.rollback()
+        raise mvc_exc.ItemNotStored(
+            'Can\'t delete: at least one in {} is not stored in table "{}"'.format(
+                list(names), table_name
+            )
+        )
+
+
+@connect
+def aggregate(conn, table_name, low_stock=None):
+    """Count the items and sum their quantity and value, in the database.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+    table_name : str
+    low_stock : int or None
+        if not None, also count the items with a quantity below this value
+
+    Returns
+    -------
+    dict
+        count, quantity, stock_value (and low_stock) of the items
+    """
+    table_name = scrub(table_name)
+    if low_stock is None:
+        sql = (
+            "SELECT COUNT(*), COALESCE(SUM(quantity), 0), TOTAL(price * quantity) "
+            "FROM {}".format(table_name)
+        )
+        c = conn.execute(sql)
+    else:
+        sql = (
+            "SELECT COUNT(*), COALESCE(SUM(quantity), 0), TOTAL(price * quantity), "
+            "COALESCE(SUM(quantity < ?), 0) FROM {}".format(table_name)
+        )
+        c = conn.execute(sql, (low_stock,))  # we need the comma
+    result = c.fetchone()
+    aggregates = {"count": result[0], "quantity": result[1], "stock_value": result[2]}
+    if low_stock is not None:
+        aggregates["low_stock"] = result[3]
+    return aggregates
+
+
+@connect
+def count(conn, table_name, low_stock=None):
+    table_name = scrub(table_name)
+    if low_stock is None:
+        c = conn.execute("SELECT COUNT(*) FROM {}".format(table_name))
+    else:
+        sql = "SELECT COUNT(*) FROM {} WHERE quantity < ?".format(table_name)
+        c = conn.execute(sql, (low_stock,))  # we need the comma
+    return c.fetchone()[0]
+
+
+@connect
+def create_search_index(conn, table_name):
+    """Create a FTS5 index on the item names, kept in sync by triggers.
+
+    The index is an external content table: it stores only the index, not a
+    second copy of the names, and the triggers update it in the same
+    transaction as the writes to the table. Rows stored before the index was
+    created are indexed too. Calling this function again does nothing.
+
+    Creating the index after loading the items is faster than loading them
+    with the index in place.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+    table_name : str
+
+    Raises
+    ------
+    OperationalError: if SQLite was compiled without FTS5.
+    """
+    table_name = scrub(table_name)
+    index_name = "{}_search".format(table_name)
+    sql = "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?"
+    if conn.execute(sql, (index_name,)).fetchone() is not None:
+        return
+
+    # prefix='1 2 3' adds indexes for the 1, 2 and 3 character prefixes of
+    # every word, so that the first keystrokes of an autocomplete are fast too.
+    # We never search for phrases, so the index doesn't need the positions of
+    # the words (detail=column) or the number of words (columnsize=0).
+    script = """
+        CREATE VIRTUAL TABLE {i} USING fts5(
+            name, content='{t}', content_rowid='rowid',
+            prefix='1 2 3', detail=column, columnsize=0
+        );
+        CREATE TRIGGER {i}_insert AFTER INSERT ON {t} BEGIN
+            INSERT INTO {i}(rowid, name) VALUES (new.rowid, new.name);
+        END;
+        CREATE TRIGGER {i}_delete AFTER DELETE ON {t} BEGIN
+            INSERT INTO {i}({i}, rowid, name) VALUES ('delete', old.rowid, old.name);
+        END;
+        CREATE TRIGGER {i}_update AFTER UPDATE OF name ON {t} BEGIN
+            INSERT INTO {i}({i}, rowid, name) VALUES ('delete', old.rowid, old.name);
+            INSERT INTO {i}(rowid, name) VALUES (new.rowid, new.name);
+        END;
+        INSERT INTO {i}({i}) VALUES ('rebuild');
+        """.format(i=index_name, t=table_name)
+    conn.executescript(script)
+    optimize_search_index(conn, table_name)
+
+
+@connect
+def optimize_search_index(conn, table_name):
+    """Merge the segments of the FTS5 index into one.
+
+    Every transaction that writes to the table adds a small segment to the
+    index, and a search has to look at all of them. SQLite merges some of
+    them automatically; call this after loading many items to merge all.
+    """
+    table_name = scrub(table_name)
+    sql = "INSERT INTO {i}({i}) VALUES ('optimize')".format(
+        i="{}_search".format(table_name)
+    )
+    conn.execute(sql)
+    conn.commit()
+
+
+@connect
+def search(conn, query, table_name, limit=10):
+    """Items that match the words of the query, as typed in an autocomplete.
+
+    Every word of the query but the last one must be a word of the item name.
+    The last word can be the beginning of a word of the name. Needs the index
+    created by create_search_index.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+    query : str
+        one or more words, e.g. "choc" or "dark choc"
+    table_name : str
+    limit : int
+
+    Returns
+    -------
+    list
+        items, in the order they were stored
+    """
+    table_name = scrub(table_name)
+    # words are made of letters and digits only, so they can be quoted as
+    # they are. Quoting keeps words like AND, OR, NOT from being operators.
+    terms = re.findall(r"[^\W_]+", query.lower())
+    if not terms:
+        return list()
+    sql = (
+        "SELECT {t}.* FROM {t}_search JOIN {t} ON {t}.rowid = {t}_search.rowid "
+        "WHERE {t}_search MATCH ? LIMIT ?".format(t=table_name)
+    )
+    match = " ".join('"{}"'.format(term) for term in terms) + "*"
+    c = conn.execute(sql, (match, limit))
+    return list(map(lambda x: tuple_to_dict(x), c.fetchall()))
+
+
+@connect
+def backup_to_file(conn, path, pages_per_step=256, progress=None):
+    """Copy the database to a file while it keeps serving requests.
+
+    The copy is made pages_per_step pages at a time, and the database is
+    locked only while a step runs, so writers wait for one step at most, not
+    for the whole copy. The copy is written to a temporary file that replaces
+    path only once it is complete, so path always holds a whole snapshot.
+
+    Writes made through conn during the copy end up in the snapshot. Writes
+    made through other connections make SQLite restart the copy, so writers
+    should share conn while a snapshot is taken.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+    path : str
+        file of the snapshot
+    pages_per_step : int
+        pages copied by each step. -1 copies the database in a single step.
+    progress : callable or None
+        called after each step as progress(pages_copied, pages_total)
+
+    Returns
+    -------
+    dict
+        pages, bytes, steps, seconds and throughput (bytes per second) of the
+        copy
+    """
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    steps = [0, 0, 0]  # steps, pages copied, pages total
+
+    def on_step(status, remaining, total):
+        steps[0] += 1
+        steps[1], steps[2] = total - remaining, total
+        if progress is not None:
+            progress(total - remaining, total)
+
+    tmp_path = "{}.tmp".format(path)
+    target = sqlite3.connect(tmp_path)
+    t0 = time.perf_counter()
+    try:
+        conn.backup(target, pages=pages_per_step, progress=on_step)
+    except Exception:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    target.close()
+    os.replace(tmp_path, path)
+    elapsed = time.perf_counter() - t0
+    n_bytes = steps[2] * page_size
+    return {
+        "pages": steps[2],
+        "bytes": n_bytes,
+        "steps": steps[0],
+        "seconds": elapsed,
+        "throughput": n_bytes / elapsed if elapsed else None,
+    }
+
+
+def restore_from_file(path, read_only=True, check_same_thread=True):
+    """Load a snapshot made by backup_to_file into an in-memory database.
+
+    Parameters
+    ----------
+    path : str
+        file of the snapshot
+    read_only : bool
+        if True, the in-memory database refuses writes, which is what a
+        replica that only serves reads wants
+    check_same_thread : bool
+        see connect_to_db
+
+    Returns
+    -------
+    connection : sqlite3.Connection
+        connection to the in-memory database
+    """
+    source = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+    connection = connect_to_db(check_same_thread=check_same_thread)
+    try:
+        source.backup(connection)
+    finally:
+        source.close()
+    if read_only:
+        connection.execute("PRAGMA query_only = ON")
+    return connection
+
+
 def main():
 
     table_name = "items"
@@ -243,6 +640,11 @@ def main():
     print(select_one(conn, "milk", table_name="items"))
     print("SELECT all")
     print(select_all(conn, table_name="items"))
+    print("SELECT bread, wine and chocolate")
+    print(select_many(conn, ["bread", "wine", "chocolate"], table_name="items"))
+    print("SEARCH names starting with b")
+    create_search_index(conn, table_name="items")
+    print(search(conn, "b", table_name="items"))
     # if we try to select an object not stored we get an ItemNotStored exception
     # print(select_one(conn, 'pizza', table_name='items'))
 
@@ -264,6 +666,31 @@ def main():
     # print('DELETE fish')
     # delete_one(conn, 'fish', table_name='items')
 
+    # BATCH
+    print("UPDATE and DELETE in batch, SELECT all")
+    update_many(
+        conn,
+        [
+            {"name": "bread", "price": 1.0, "quantity": 10},
+            {"name": "milk", "price": 1.5, "quantity": 5},
+        ],
+        table_name="items",
+    )
+    delete_many(conn, ["wine"], table_name="items")
+    print(select_all(conn, table_name="items"))
+
+    # AGGREGATE
+    print("AGGREGATE with low stock below 10")
+    print(aggregate(conn, table_name="items", low_stock=10))
+
+    # SNAPSHOT
+    print("SNAPSHOT to items_snapshot.db, RESTORE it in memory, SELECT all")
+    print(backup_to_file(conn, "items_snapshot.db", pages_per_step=1))
+    replica = restore_from_file("items_snapshot.db")
+    print(select_all(replica, table_name="items"))
+    replica.close()
+    os.remove("items_snapshot.db")
+
     # save (commit) the changes
     # conn.commit()
 
@@ -0,0 +1,388 @@
+"""Write-behind (write-back) wrapper for a Model.
+
+WriteBehindModel applies every write to an in-memory overlay right away and
+queues it. A background thread flushes the queue to the wrapped Model in
+batches (i.e. through create_items, update_items and delete_items), at the
+latest max_lag seconds after the oldest queued write. Reads go through the
+overlay first, so a client always reads its own writes, even before they
+reach the database.
+
+The price to pay is durability: the writes still in the queue are lost if the
+process crashes. And a write is checked against the overlay when it is made,
+but the backend can still reject its batch (e.g. another client created the
+same item meanwhile): the next call to flush or close raises the exception of
+the rejected batch.
+"""
+
+import itertools
+import threading
+import time
+import mvc_exceptions as mvc_exc
+import mvc_mock_objects as mock
+from model_view_controller import Model, ModelBasic, View, Controller
+
+# overlay value of an item deleted in the overlay but not yet in the backend
+DELETED = object()
+
+
+class WriteBehindModel(Model):
+    """Model wrapper that queues writes and flushes them in the background.
+
+    Parameters
+    ----------
+    model : Model
+        the Model that actually stores the items. The flush runs in another
+        thread, so a ModelSQLite needs a connection opened with
+        check_same_thread=False.
+    max_lag : float
+        maximum time, in seconds, a write can wait in the queue.
+    batch_size : int
+        flush as soon as this many writes are queued, without waiting max_lag.
+    """
+
+    def __init__(self, model, max_lag=1.0, batch_size=500):
+        super().__init__()
+        self._model = model
+        self._max_lag = max_lag
+        self._batch_size = batch_size
+        # name -> latest record (or DELETED) of the items with queued writes
+        self._overlay = dict()
+        # name -> number of queued writes for that item
+        self._pending_names = dict()
+        self._queue = list()
+        self._oldest = None
+        self._errors = list()
+        # rejected batches that flush or close haven't raised yet
+        self._unreported = list()
+        self._closed = False
+        # lock ordering: _flush_lock -> _lock, _lock -> _backend_lock
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._backend_lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def item_type(self):
+        return self._model.item_type
+
+    @item_type.setter
+    def item_type(self, new_item_type):
+        # queued writes belong to the old item type (i.e. the old table)
+        self._flush()
+        with self._backend_lock:
+            self._model.item_type = new_item_type
+
+    @property
+    def pending(self):
+        """Number of writes queued and not yet flushed."""
+        with self._lock:
+            return len(self._queue)
+
+    @property
+    def lag(self):
+        """Age, in seconds, of the oldest queued write (0 if none)."""
+        with self._lock:
+            return 0.0 if self._oldest is None else time.monotonic() - self._oldest
+
+    @property
+    def errors(self):
+        """Batches the backend rejected, as a list of (kind, batch, exception)."""
+        return list(self._errors)
+
+    def _is_stored(self, name):
+        # call with self._lock held
+        record = self._overlay.get(name)
+        if record is not None:
+            return record is not DELETED
+        with self._backend_lock:
+            try:
+                self._model.read_item(name)
+            except mvc_exc.ItemNotStored:
+                return False
+        return True
+
+    def _stored(self, names):
+        # call with self._lock held. Like _is_stored, but the names that are
+        # not in the overlay are looked up with a single backend read_many
+        stored, unknown = set(), list()
+        for name in names:
+            record = self._overlay.get(name)
+            if record is None:
+                unknown.append(name)
+            elif record is not DELETED:
+                stored.add(name)
+        if unknown:
+            with self._backend_lock:
+                found, _ = self._model.read_many(unknown)
+            stored.update(x["name"] for x in found)
+        return stored
+
+    def _enqueue(self, kind, name, value):
+        # call with self._lock held
+        self._overlay[name] = DELETED if kind == "delete" else value
+        self._pending_names[name] = self._pending_names.get(name, 0) + 1
+        self._queue.append((kind, name, value))
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._not_empty.notify()
+
+    def create_item(self, name, price, quantity):
+        with self._lock:
+            if self._is_stored(name):
+                raise mvc_exc.ItemAlreadyStored('"{}" already stored!'.format(name))
+            record = {"name": name, "price": price, "quantity": quantity}
+            self._enqueue("create", name, record)
+
+    def create_items(self, items):
+        with self._lock:
+            stored = self._stored([x["name"] for x in items])
+            duplicates = [x["name"] for x in items if x["name"] in stored]
+            if duplicates:
+                raise mvc_exc.ItemAlreadyStored("{} already stored!".format(duplicates))
+            for x in items:
+                record = dict(name=x["name"], price=x["price"], quantity=x["quantity"])
+                self._enqueue("create", x["name"], record)
+
+    def read_item(self, name):
+        with self._lock:
+            record = self._overlay.get(name)
+        if record is DELETED:
+            raise mvc_exc.ItemNotStored(
+                "Can't read \"{}\" because it's not stored".format(name)
+            )
+        elif record is not None:
+            return dict(record)
+        with self._backend_lock:
+            return self._model.read_item(name)
+
+    def read_items(self):
+        with self._lock:
+            overlay = dict(self._overlay)
+        with self._backend_lock:
+            items = self._model.read_items()
+        results = list()
+        for x in items:
+            record = overlay.pop(x["name"], None)
+            if record is None:
+                results.append(x)
+            elif record is not DELETED:
+                results.append(dict(record))
+        # what is left in the overlay was created and not flushed yet
+        results.extend(dict(r) for r in overlay.values() if r is not DELETED)
+        return results
+
+    def iter_items(self, chunk_size=1000):
+        with self._lock:
+            overlay = dict(self._overlay)
+        with self._backend_lock:
+            items = self._model.iter_items(chunk_size)
+        while True:
+            # the flush thread writes to the backend between two chunks
+            with self._backend_lock:
+                chunk = list(itertools.islice(items, chunk_size))
+            if not chunk:
+                break
+            for x in chunk:
+                record = overlay.pop(x["name"], None)
+                if record is None:
+                    yield x
+                elif record is not DELETED:
+                    yield dict(record)
+        # what is left in the overlay was created and not flushed yet
+        for record in overlay.values():
+            if record is not DELETED:
+                yield dict(record)
+
+    def read_many(self, names):
+        names = list(dict.fromkeys(names))
+        with self._lock:
+            overlay = {name: self._overlay.get(name) for name in names}
+        unknown = [name for name in names if overlay[name] is None]
+        if unknown:
+            with self._backend_lock:
+                found, _ = self._model.read_many(unknown)
+            overlay.update((x["name"], x) for x in found)
+        results = [overlay[name] for name in names]
+        return (
+            [dict(r) for r in results if r is not None and r is not DELETED],
+            [name for name, r in zip(names, results) if r is None or r is DELETED],
+        )
+
+    def update_item(self, name, price, quantity):
+        with self._lock:
+            if not self._is_stored(name):
+                raise mvc_exc.ItemNotStored(
+                    "Can't update \"{}\" because it's not stored".format(name)
+                )
+            record = {"name": name, "price": price, "quantity": quantity}
+            self._enqueue("update", name, record)
+
+    def delete_item(self, name):
+        with self._lock:
+            if not self._is_stored(name):
+                raise mvc_exc.ItemNotStored(
+                    "Can't delete \"{}\" because it's not stored".format(name)
+                )
+            self._enqueue("delete", name, name)
+
+    def update_items(self, items):
+        with self._lock:
+            stored = self._stored([x["name"] for x in items])
+            missing = [x["name"] for x in items if x["name"] not in stored]
+            if missing:
+                raise mvc_exc.ItemNotStored(
+                    "Can't update {} because they are not stored".format(missing)
+                )
+            for x in items:
+                record = dict(name=x["name"], price=x["price"], quantity=x["quantity"])
+                self._enqueue("update", x["name"], record)
+
+    def delete_items(self, names):
+        with self._lock:
+            stored = self._stored(names)
+            missing = [name for name in names if name not in stored]
+            if missing:
+                raise mvc_exc.ItemNotStored(
+                    "Can't delete {} because they are not stored".format(missing)
+                )
+            for name in names:
+                self._enqueue("delete", name, name)
+
+    def aggregate(self, low_stock=None):
+        # the backend computes the aggregates, so it must have all the writes
+        self._flush()
+        with self._backend_lock:
+            return self._model.aggregate(low_stock)
+
+    def count(self, low_stock=None):
+        self._flush()
+        with self._backend_lock:
+            return self._model.count(low_stock)
+
+    def search(self, query, limit=10):
+        # the backend indexes the names, so it must have all the writes
+        self._flush()
+        with self._backend_lock:
+            return self._model.search(query, limit)
+
+    def flush(self):
+        """Write all queued writes to the wrapped Model, and wait for it.
+
+        Raises
+        ------
+        Exception
+            the exception of the first batch the backend rejected since the
+            last flush or close (e.g. mvc_exc.ItemAlreadyStored), whether
+            this flush or the background thread wrote it. All the rejected
+            batches are in errors.
+        """
+        self._flush()
+        self._raise_unreported()
+
+    def _raise_unreported(self):
+        with self._lock:
+            unreported, self._unreported = self._unreported, list()
+        if unreported:
+            raise unreported[0]
+
+    def _flush(self):
+        with self._flush_lock:
+            with self._lock:
+                queue, self._queue = self._queue, list()
+                self._oldest = None
+            if not queue:
+                return
+
+            # consecutive writes of the same kind become a single batch call
+            batches = list()
+            for kind, name, value in queue:
+                if batches and batches[-1][0] == kind:
+                    batches[-1][1].append(value)
+                else:
+                    batches.append((kind, [value]))
+            calls = {
+                "create": self._model.create_items,
+                "update": self._model.update_items,
+                "delete": self._model.delete_items,
+            }
+            rejected = list()
+            with self._backend_lock:
+                for kind, batch in batches:
+                    try:
+                        calls[kind](batch)
+                    except Exception as e:
+                        # the writes of the batch are lost, but not silently
+                        self._errors.append((kind, batch, e))
+                        rejected.append(e)
+
+            # not under _backend_lock: the lock ordering is _lock -> _backend_lock
+            with self._lock:
+                self._unreported.extend(rejected)
+                for kind, name, value in queue:
+                    self._pending_names[name] -= 1
+                    if self._pending_names[name] == 0:
+                        del self._pending_names[name]
+                        del self._overlay[name]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if self._closed:
+                    return
+                while len(self._queue) < self._batch_size and not self._closed:
+                    remaining = self._oldest + self._max_lag - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+            try:
+                self._flush()
+            except Exception as e:
+                # keep flushing the next writes; close raises e
+                with self._lock:
+                    self._unreported.append(e)
+
+    def close(self):
+        """Stop the background thread and flush the remaining writes.
+
+        Raises
+        ------
+        Exception
+            as flush does
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify()
+        self._thread.join()
+        self.flush()
+
+
+def main():
+
+    model = WriteBehindModel(ModelBasic(mock.items()), max_lag=0.5)
+    c = Controller(model, View())
+
+    # writes return immediately, and we can read them back before the flush
+    c.insert_item("beer", price=3.0, quantity=15)
+    c.update_item("milk", price=1.2, quantity=20)
+    c.delete_item("wine")
+    print("Pending writes: {}".format(model.pending))
+    c.show_items()
+
+    # after at most max_lag seconds they have reached the wrapped Model
+    time.sleep(1.0)
+    print("Pending writes: {}".format(model.pending))
+    c.show_items()
+
+    model.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,19 @@
+import asyncio
+import functools
+import inspect
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import pickle
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+
 class Subscriber(object):
     """It's the Observer object. It receives messages from the Observable."""
 
@@ -17,6 +33,86 @@ class Subscriber(object):
         print("{} received: {}".format(self.name, message))
 
 
+def _drop_subscription(subscriptions_ref, who_ref):
+    """Callback of the WeakMethod of a subscription, called when it dies.
+
+    It holds only weak references, so that it doesn't keep the Subscriptions
+    or the Subscriber alive.
+    """
+
+    def drop(method_ref):
+        subscriptions, who = subscriptions_ref(), who_ref()
+        if subscriptions is None or who is None:
+            # the WeakKeyDictionary dropped the subscription already
+            return
+        if subscriptions._callbacks.get(who) is method_ref:
+            subscriptions._callbacks.pop(who, None)
+
+    return drop
+
+
+class Subscriptions(MutableMapping):
+    """Subscribers of a newsletter, with their callbacks.
+
+    It works like a dict, but it doesn't keep its subscribers alive: when a
+    Subscriber is garbage collected, its subscription goes away with it. A
+    callback that is a bound method is held by a weak reference too (a
+    WeakMethod), since a strong reference to the method of a Subscriber would
+    keep the Subscriber alive; its subscription goes away when the object of
+    the method does. Other callbacks (e.g. functions) are held as they are.
+
+    Dead subscriptions are dropped by weakref callbacks as soon as they die,
+    so len() and bool() don't have to look at every subscriber.
+    """
+
+    def __init__(self):
+        self._callbacks = weakref.WeakKeyDictionary()
+
+    def __getitem__(self, who):
+        callback = self._callbacks[who]
+        if isinstance(callback, weakref.WeakMethod):
+            callback = callback()
+            if callback is None:
+                del self._callbacks[who]
+                raise KeyError(who)
+        return callback
+
+    def __setitem__(self, who, callback):
+        if inspect.ismethod(callback):
+            callback = weakref.WeakMethod(
+                callback, _drop_subscription(weakref.ref(self), weakref.ref(who))
+            )
+        self._callbacks[who] = callback
+
+    def __delitem__(self, who):
+        del self._callbacks[who]
+
+    def __iter__(self):
+        return iter([who for who, _ in self.items()])
+
+    def __len__(self):
+        return len(self._callbacks)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, dict(self.items()))
+
+    def items(self):
+        """Subscribers and callbacks, as a list of (who, callback) pairs.
+
+        A list, not a view: a subscription may go away at any time, even while
+        we iterate over the subscriptions.
+        """
+        pairs = list()
+        for who, callback in list(self._callbacks.items()):
+            if isinstance(callback, weakref.WeakMethod):
+                callback = callback()
+                if callback is None:
+                    self._callbacks.pop(who, None)
+                    continue
+            pairs.append((who, callback))
+        return pairs
+
+
 class Publisher(object):
     """It's the Observable object. It dispatches messages to the Observers."""
 
@@ -67,7 +163,8 @@ class Publisher(object):
         newsletter : str
         message : str
         """
-        if len(self.get_subscriptions(newsletter).items()) == 0:
+        subscriptions = self.get_subscriptions(newsletter).items()
+        if len(subscriptions) == 0:
             print(
                 "No subscribers for the {} newsletter. Nothing to send!".format(
                     newsletter
@@ -75,21 +172,1015 @@ class Publisher(object):
             )
             return
 
-        for subscriber, callback in self.get_subscriptions(newsletter).items():
+        for subscriber, callback in subscriptions:
             callback(message)
 
     def add_newsletter(self, newsletter):
         """Add a subscription key-value pair for a new newsletter.
 
         The key is the name of the new subscription, namely the name of the
-        newsletter (e.g. 'Tech'). The value is an empty dictionary which will be
-        populated by subscriber objects willing to register to this newsletter.
+        newsletter (e.g. 'Tech'). The value is an empty Subscriptions mapping
+        which will be populated by subscriber objects willing to register to
+        this newsletter.
+
+        Parameters
+        ----------
+        newsletter : str
+        """
+        self.subscriptions[newsletter] = Subscriptions()
+
+
+class AsyncPublisher(Publisher):
+    """Publisher that dispatches messages to its Subscribers with asyncio.
+
+    The callbacks of the subscribers run concurrently, so a slow Subscriber
+    doesn't delay the ones after it. A callback can be a coroutine function or
+    a plain function; plain functions run in the default executor of the event
+    loop, so that they don't block it either.
+
+    Parameters
+    ----------
+    newsletters : list
+    max_concurrency : int
+        maximum number of callbacks running at the same time, across all
+        the dispatches of an event loop
+    timeout : float or None
+        seconds a callback has to receive a message, unless its Subscriber was
+        registered with a timeout of its own. A coroutine that takes longer is
+        cancelled; a plain function can't be, so it's only left behind.
+    """
+
+    def __init__(self, newsletters, max_concurrency=100, timeout=None):
+        super().__init__(newsletters)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        # subscriber -> {newsletter: timeout of that subscription}
+        self.timeouts = weakref.WeakKeyDictionary()
+        # event loop -> Semaphore, since a Semaphore is bound to the first loop
+        # that waits on it (e.g. each asyncio.run starts a new one)
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def slots(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def register(self, newsletter, who, callback=None, timeout=None):
+        """Register a Subscriber to this newsletter.
+
+        Parameters
+        ----------
+        newsletter : str
+        who : Subscriber
+        callback : method or coroutine function
+            callback function bound to the Subscriber object
+        timeout : float or None
+            if not None, overrides the timeout of the Publisher for this
+            subscription
+        """
+        super().register(newsletter, who, callback)
+        if timeout is None:
+            self.timeouts.get(who, {}).pop(newsletter, None)
+        else:
+            self.timeouts.setdefault(who, dict())[newsletter] = timeout
+
+    def unregister(self, newsletter, who):
+        super().unregister(newsletter, who)
+        self.timeouts.get(who, {}).pop(newsletter, None)
+
+    async def _deliver(self, callback, message, timeout):
+        async with self.slots:
+            if inspect.iscoroutinefunction(callback):
+                delivery = callback(message)
+            else:
+                loop = asyncio.get_running_loop()
+                delivery = loop.run_in_executor(None, callback, message)
+            await asyncio.wait_for(delivery, timeout)
+
+    async def dispatch(self, newsletter, message):
+        """Send a message to all subscribers registered to this newsletter.
+
+        Returns when every subscriber has received the message, or failed to
+        (e.g. timed out).
+
+        Parameters
+        ----------
+        newsletter : str
+        message : str
+
+        Returns
+        -------
+        dict
+            subscriber -> exception, for the subscribers that failed to
+            receive the message (asyncio.TimeoutError if they timed out)
+        """
+        # the subscriptions may change while we wait for the callbacks
+        subscriptions = list(self.get_subscriptions(newsletter).items())
+        if not subscriptions:
+            print(
+                "No subscribers for the {} newsletter. Nothing to send!".format(
+                    newsletter
+                )
+            )
+            return dict()
+
+        results = await asyncio.gather(
+            *[
+                self._deliver(
+                    callback,
+                    message,
+                    self.timeouts.get(subscriber, {}).get(newsletter, self.timeout),
+                )
+                for subscriber, callback in subscriptions
+            ],
+            return_exceptions=True,
+        )
+        return {
+            subscriber: result
+            for (subscriber, _), result in zip(subscriptions, results)
+            if result is not None
+        }
+
+    def publish(self, newsletter, message):
+        """Schedule a dispatch and return right away, without waiting for it.
+
+        Call it from a coroutine, i.e. with an event loop running.
+
+        Returns
+        -------
+        asyncio.Task
+            await it to get the result of dispatch
+        """
+        return asyncio.ensure_future(self.dispatch(newsletter, message))
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber that receives messages with a coroutine."""
+
+    async def receive(self, message):
+        await asyncio.sleep(0)
+        print("{} received: {}".format(self.name, message))
+
+
+class Mailbox(object):
+    """Bounded queue of the messages not yet received by a Subscriber."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.messages = deque()
+        # True while a worker of the pool is delivering these messages
+        self.scheduled = False
+        self.max_depth = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def full(self):
+        return len(self.messages) >= self.maxsize
+
+    def stats(self):
+        return {
+            "depth": len(self.messages),
+            "max_depth": self.max_depth,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+class ThreadedPublisher(Publisher):
+    """Publisher that delivers messages with a pool of worker threads.
+
+    Every Subscriber has a bounded queue (a Mailbox). dispatch puts the
+    message in the queue of each subscriber and returns; the workers deliver
+    the messages of different subscribers in parallel, and the messages of
+    each subscriber one at a time, in the order they were dispatched.
+
+    Parameters
+    ----------
+    newsletters : list
+    max_workers : int
+        number of worker threads
+    maxsize : int
+        maximum number of messages waiting for a subscriber
+    policy : str
+        what dispatch does when the queue of a subscriber is full: "block"
+        waits for room (don't dispatch from a callback then, it may wait for
+        itself), "drop_oldest" drops the oldest message of the queue,
+        "drop_newest" drops the message being dispatched.
+    """
+
+    policies = ("block", "drop_oldest", "drop_newest")
+
+    def __init__(self, newsletters, max_workers=8, maxsize=1000, policy="block"):
+        if policy not in self.policies:
+            raise ValueError(
+                "policy must be one of {}, not {!r}".format(self.policies, policy)
+            )
+        if maxsize < 1:
+            raise ValueError("maxsize must be greater than 0")
+        super().__init__(newsletters)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.mailboxes = weakref.WeakKeyDictionary()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # number of mailboxes that a worker is delivering
+        self._busy = 0
+        self._lock = threading.Lock()
+        # notified every time a message leaves a queue
+        self._changed = threading.Condition(self._lock)
+
+    def unregister(self, newsletter, who):
+        super().unregister(newsletter, who)
+        with self._lock:
+            if not any(who in s for s in self.subscriptions.values()):
+                # the messages already queued are still delivered
+                self.mailboxes.pop(who, None)
+
+    def _deliver(self, mailbox):
+        while True:
+            with self._lock:
+                if not mailbox.messages:
+                    mailbox.scheduled = False
+                    self._busy -= 1
+                    self._changed.notify_all()
+                    return
+                callback, message = mailbox.messages.popleft()
+                self._changed.notify_all()
+            try:
+                callback(message)
+                mailbox.delivered += 1
+            except Exception:
+                # a failing subscriber must not stop the others
+                mailbox.errors += 1
+
+    def _put(self, mailbox, callback, message):
+        # called with the lock held
+        if mailbox.full:
+            if self.policy == "block":
+                while mailbox.full:
+                    self._changed.wait()
+            elif self.policy == "drop_oldest":
+                mailbox.messages.popleft()
+                mailbox.dropped += 1
+            else:
+                mailbox.dropped += 1
+                return
+        mailbox.messages.append((callback, message))
+        mailbox.max_depth = max(mailbox.max_depth, len(mailbox.messages))
+        if not mailbox.scheduled:
+            mailbox.scheduled = True
+            self._busy += 1
+            self._executor.submit(self._deliver, mailbox)
+
+    def dispatch(self, newsletter, message):
+        """Queue a message for all subscribers registered to this newsletter.
+
+        Parameters
+        ----------
+        newsletter : str
+        message : str
+        """
+        subscriptions = list(self.get_subscriptions(newsletter).items())
+        if not subscriptions:
+            print(
+                "No subscribers for the {} newsletter. Nothing to send!".format(
+                    newsletter
+                )
+            )
+            return
+
+        with self._lock:
+            for subscriber, callback in subscriptions:
+                mailbox = self.mailboxes.get(subscriber)
+                if mailbox is None:
+                    mailbox = self.mailboxes[subscriber] = Mailbox(self.maxsize)
+                self._put(mailbox, callback, message)
+
+    def queue_depths(self):
+        """Number of messages waiting, subscriber -> depth."""
+        with self._lock:
+            return {who: len(m.messages) for who, m in list(self.mailboxes.items())}
+
+    def stats(self):
+        """Queue depth, maximum depth and counters of every subscriber.
+
+        Returns
+        -------
+        dict
+            subscriber -> depth, max_depth, delivered, dropped and errors
+        """
+        with self._lock:
+            return {who: m.stats() for who, m in list(self.mailboxes.items())}
+
+    def join(self, timeout=None):
+        """Wait until every queued message has been delivered.
+
+        Returns
+        -------
+        bool
+            False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def close(self):
+        """Deliver the queued messages, then stop the workers."""
+        self.join()
+        self._executor.shutdown(wait=True)
+
+
+class BatchSubscriber(Subscriber):
+    """Subscriber that receives the messages of a batch all at once."""
+
+    def receive_batch(self, messages):
+        """Method assigned in, and called by, a BatchingPublisher.
+
+        Parameters
+        ----------
+        messages : list
+        """
+        print("{} received {} messages: {}".format(self.name, len(messages), messages))
+
+
+class BatchingPublisher(Publisher):
+    """Publisher that gathers messages and delivers them in batches.
+
+    dispatch doesn't deliver right away: it adds the message to the batch of
+    its newsletter. A batch is delivered when it has max_batch messages, or
+    max_delay seconds after its first message, whichever comes first.
+    Subscribers with a receive_batch method get the whole batch with a single
+    call; the others get its messages one by one, as with Publisher. A
+    callback that raises is counted in errors, and the others still receive.
+
+    Parameters
+    ----------
+    newsletters : list
+    max_batch : int
+        maximum number of messages in a batch
+    max_delay : float
+        maximum time, in seconds, a message waits for its batch to be
+        delivered
+    key : callable or None
+        if not None, key(message) identifies what a message is about (e.g.
+        the price of which stock), and a batch keeps only the latest message
+        for each key, in the place of the first one
+    """
+
+    def __init__(self, newsletters, max_batch=100, max_delay=0.05, key=None):
+        if max_batch < 1:
+            raise ValueError("max_batch must be greater than 0")
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.key = key
+        # newsletter -> messages (or key -> message) not yet delivered
+        self.batches = dict()
+        # subscriber -> newsletters whose batches it receives with one call
+        self.batch_subscriptions = weakref.WeakKeyDictionary()
+        self.delivered_batches = 0
+        self.coalesced = 0
+        # calls of a callback that raised an exception
+        self.errors = 0
+        self._first_at = dict()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wake_up = threading.Condition(self._lock)
+        # batches of the same newsletter are delivered in order
+        self._deliver_lock = threading.Lock()
+        super().__init__(newsletters)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def register(self, newsletter, who, callback=None, batch=None):
+        """Register a Subscriber to this newsletter.
+
+        Parameters
+        ----------
+        newsletter : str
+        who : Subscriber
+        callback : method
+            callback function bound to the Subscriber object. If None, use
+            who.receive_batch if who has one, else who.receive.
+        batch : bool or None
+            True if callback receives a list of messages. If None, True when
+            callback is None and who has a receive_batch method.
+        """
+        if callback is None and hasattr(who, "receive_batch"):
+            callback = who.receive_batch
+            batch = True if batch is None else batch
+        super().register(newsletter, who, callback)
+        if batch:
+            self.batch_subscriptions.setdefault(who, set()).add(newsletter)
+        else:
+            self.batch_subscriptions.get(who, set()).discard(newsletter)
+
+    def unregister(self, newsletter, who):
+        super().unregister(newsletter, who)
+        self.batch_subscriptions.get(who, set()).discard(newsletter)
+
+    def add_newsletter(self, newsletter):
+        super().add_newsletter(newsletter)
+        with self._lock:
+            self.batches[newsletter] = list() if self.key is None else dict()
+
+    def dispatch(self, newsletter, message):
+        """Add a message to the batch of this newsletter.
+
+        Parameters
+        ----------
+        newsletter : str
+        message : str
+        """
+        if not self.get_subscriptions(newsletter):
+            print(
+                "No subscribers for the {} newsletter. Nothing to send!".format(
+                    newsletter
+                )
+            )
+            return
+
+        with self._lock:
+            batch = self.batches[newsletter]
+            if self.key is None:
+                batch.append(message)
+            else:
+                key = self.key(message)
+                if key in batch:
+                    self.coalesced += 1
+                batch[key] = message
+            if newsletter not in self._first_at:
+                # the first message of the batch, not one that replaced it
+                self._first_at[newsletter] = time.monotonic()
+                self._wake_up.notify()
+            full = len(batch) >= self.max_batch
+        if full:
+            self.flush(newsletter)
+
+    def _take(self, newsletter):
+        # called with the lock held
+        batch = self.batches[newsletter]
+        if not batch:
+            return list()
+        self.batches[newsletter] = list() if self.key is None else dict()
+        self._first_at.pop(newsletter, None)
+        return batch if self.key is None else list(batch.values())
+
+    def flush(self, newsletter=None):
+        """Deliver the batch of a newsletter (of every one, if None) now."""
+        newsletters = list(self.batches) if newsletter is None else [newsletter]
+        with self._deliver_lock:
+            for newsletter in newsletters:
+                with self._lock:
+                    messages = self._take(newsletter)
+                if messages:
+                    self._deliver(newsletter, messages)
+
+    def _deliver(self, newsletter, messages):
+        for subscriber, callback in list(self.get_subscriptions(newsletter).items()):
+            if newsletter in self.batch_subscriptions.get(subscriber, ()):
+                self._call(callback, messages)
+            else:
+                for message in messages:
+                    self._call(callback, message)
+        self.delivered_batches += 1
+
+    def _call(self, callback, argument):
+        # called with the deliver lock held
+        try:
+            callback(argument)
+        except Exception:
+            # a failing subscriber must not stop the others, nor the thread
+            self.errors += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                if self._first_at:
+                    due_at = min(self._first_at.values()) + self.max_delay
+                    self._wake_up.wait(max(due_at - time.monotonic(), 0))
+                else:
+                    self._wake_up.wait()
+                if self._closed:
+                    return
+                now = time.monotonic()
+                due = [
+                    n for n, t in self._first_at.items() if t + self.max_delay <= now
+                ]
+            for newsletter in due:
+                self.flush(newsletter)
+
+    def close(self):
+        """Deliver the pending batches and stop the background thread."""
+        with self._lock:
+            self._closed = True
+            self._wake_up.notify()
+        self._thread.join()
+        self.flush()
+
+
+class TopicNode(object):
+    """Node of the trie of topic patterns: one word of a pattern."""
+
+    def __init__(self):
+        self.children = dict()
+        # the pattern that ends at this node, if any
+        self.pattern = None
+
+
+class TopicPublisher(Publisher):
+    """Publisher of hierarchical topics, with wildcard subscriptions.
+
+    A topic is a list of words separated by dots, e.g. "tech.ai.llm". A
+    Subscriber registers to a pattern, where "*" matches exactly one word and
+    "#" matches zero or more words: "tech.*" matches "tech.ai" but not
+    "tech.ai.llm", "tech.#" matches "tech", "tech.ai" and "tech.ai.llm".
+
+    The patterns are stored in a trie, one word per level, so finding the
+    patterns that match a topic costs O(depth of the topic), not O(number of
+    patterns). The result is cached per topic, until a pattern is added or
+    removed.
+
+    Parameters
+    ----------
+    patterns : list
+        patterns to start with (more are added when someone registers)
+    cache_size : int
+        number of topics whose matching patterns are cached
+    """
+
+    def __init__(self, patterns=(), cache_size=1024):
+        self._root = TopicNode()
+        self._match = functools.lru_cache(maxsize=cache_size)(self._resolve)
+        super().__init__(patterns)
+
+    @staticmethod
+    def _words(topic, wildcards):
+        words = topic.split(".")
+        for word in words:
+            if not word:
+                raise ValueError("empty word in topic {!r}".format(topic))
+            if word in ("*", "#"):
+                if not wildcards:
+                    raise ValueError("wildcard in topic {!r}".format(topic))
+            elif "*" in word or "#" in word:
+                raise ValueError("wildcards must be whole words, not {!r}".format(word))
+        return words
+
+    def add_newsletter(self, newsletter):
+        """Add a topic pattern, e.g. "tech.*", without subscribers."""
+        node = self._root
+        for word in self._words(newsletter, wildcards=True):
+            node = node.children.setdefault(word, TopicNode())
+        node.pattern = newsletter
+        super().add_newsletter(newsletter)
+        self._match.cache_clear()
+
+    def remove_newsletter(self, newsletter):
+        """Remove a topic pattern and its subscriptions."""
+        del self.subscriptions[newsletter]
+        path = [self._root]
+        for word in self._words(newsletter, wildcards=True):
+            path.append(path[-1].children[word])
+        path[-1].pattern = None
+        # prune the nodes that no pattern goes through any more
+        for parent, word in zip(reversed(path[:-1]), reversed(newsletter.split("."))):
+            child = parent.children[word]
+            if child.children or child.pattern is not None:
+                break
+            del parent.children[word]
+        self._match.cache_clear()
+
+    def register(self, newsletter, who, callback=None):
+        """Register a Subscriber to a topic pattern, e.g. "tech.#"."""
+        if newsletter not in self.subscriptions:
+            self.add_newsletter(newsletter)
+        super().register(newsletter, who, callback)
+
+    def unregister(self, newsletter, who):
+        super().unregister(newsletter, who)
+        if newsletter in self.subscriptions and not self.get_subscriptions(newsletter):
+            self.remove_newsletter(newsletter)
+
+    def _resolve(self, topic):
+        words = self._words(topic, wildcards=False)
+        patterns = list()
+
+        def walk(node, i):
+            if i == len(words):
+                if node.pattern is not None:
+                    patterns.append(node.pattern)
+                # "#" matches no words at all, too
+                child = node.children.get("#")
+                if child is not None:
+                    walk(child, i)
+                return
+            child = node.children.get(words[i])
+            if child is not None:
+                walk(child, i + 1)
+            child = node.children.get("*")
+            if child is not None:
+                walk(child, i + 1)
+            child = node.children.get("#")
+            if child is not None:
+                for j in range(i, len(words) + 1):
+                    walk(child, j)
+
+        walk(self._root, 0)
+        # a pattern with several "#" can match the same topic in several ways
+        return tuple(dict.fromkeys(patterns))
+
+    def matching_patterns(self, topic):
+        """Patterns that match a topic, e.g. ("tech.ai", "tech.*", "#")."""
+        return self._match(topic)
+
+    def dispatch(self, newsletter, message):
+        """Send a message to all subscribers of the patterns matching a topic.
+
+        A subscriber registered to several matching patterns receives the
+        message once, with the callback of the first of them.
 
         Parameters
         ----------
         newsletter : str
+            a topic, without wildcards
+        message : str
         """
-        self.subscriptions[newsletter] = dict()
+        callbacks = dict()
+        for pattern in self._match(newsletter):
+            for subscriber, callback in self.subscriptions[pattern].items():
+                callbacks.setdefault(subscriber, callback)
+        if not callbacks:
+            print(
+                "No subscribers for the {} newsletter. Nothing to send!".format(
+                    newsletter
+                )
+            )
+            return
+
+        for callback in callbacks.values():
+            callback(message)
+
+
+def _receive_in_worker(conn):
+    """Loop of a worker process of a ProcessPublisher.
+
+    The worker keeps a copy of its subscribers and of their callbacks, and
+    delivers to them the messages that the publisher sends on conn.
+    """
+    # subscriber key -> the copy of the subscriber in this worker
+    subscribers = dict()
+    # subscriber key -> {newsletter: callback}
+    callbacks = dict()
+    while True:
+        request = conn.recv()
+        if request is None:
+            return
+        kind = request[0]
+        if kind == "subscriber":
+            _, key, who = request
+            subscribers[key] = who
+        elif kind == "register":
+            _, key, newsletter, method, function = request
+            if method is not None:
+                # a method of the subscriber is bound to its only copy here
+                callback = getattr(subscribers[key], method)
+            else:
+                callback = function
+            callbacks.setdefault(key, dict())[newsletter] = callback
+        elif kind == "unregister":
+            _, key, newsletter = request
+            callbacks.get(key, {}).pop(newsletter, None)
+        elif kind == "forget":
+            subscribers.pop(request[1], None)
+            callbacks.pop(request[1], None)
+        else:
+            _, seq, newsletter, keys, payload, name, sizes = request
+            shm, views = None, list()
+            if name is not None:
+                shm = shared_memory.SharedMemory(name=name)
+                offset = 0
+                for size in sizes:
+                    views.append(shm.buf[offset : offset + size])
+                    offset += size
+            # the large buffers of the message are views on the shared memory
+            message = pickle.loads(payload, buffers=views)
+            delivered, errors = 0, 0
+            for key in keys:
+                callback = callbacks.get(key, {}).get(newsletter)
+                if callback is None:
+                    continue
+                try:
+                    callback(message)
+                    delivered += 1
+                except Exception:
+                    errors += 1
+            del message
+            if shm is not None:
+                try:
+                    for view in views:
+                        view.release()
+                    shm.close()
+                except BufferError:
+                    # a subscriber kept a reference to the shared memory; it
+                    # stays mapped until the worker exits
+                    pass
+            conn.send((seq, delivered, errors))
+
+
+def _forget_subscriber(publisher_ref, key):
+    # called when a Subscriber is garbage collected
+    publisher = publisher_ref()
+    if publisher is not None and not publisher._closed:
+        publisher._send(key, ("forget", key))
+
+
+class ProcessPublisher(Publisher):
+    """Publisher whose Subscribers receive messages in worker processes.
+
+    A CPU-heavy Subscriber holds the GIL while it receives a message, so
+    threads don't help. Here every Subscriber lives in one of n_workers
+    processes (a copy of it, sent when it registers), so the subscribers
+    receive in parallel on all the cores, each one its messages in order.
+
+    A message is pickled once, with protocol 5, however many workers it goes
+    to. Its large buffers (e.g. a pickle.PickleBuffer, or a numpy array) are
+    taken out of band and copied once into a block of shared memory; the
+    workers unpickle the message with views on that block, without copying
+    them. The block is released when every worker is done with the message,
+    so subscribers must copy what they want to keep of it.
+
+    Subscribers and callbacks must be picklable: a lambda can't be a callback
+    here, a function defined at module level or a method can. A Subscriber is
+    sent to its worker once, however many newsletters it registers to, and
+    the callbacks that are its own methods are bound to that copy, so it
+    keeps a single state in the worker.
+
+    If a worker process dies, the messages it was receiving are dropped, and
+    dispatch and join raise RuntimeError.
+
+    Parameters
+    ----------
+    newsletters : list
+    n_workers : int
+    min_shared : int
+        buffers of at least this many bytes go through shared memory, the
+        smaller ones are pickled with the rest of the message
+    """
+
+    def __init__(self, newsletters, n_workers=4, min_shared=64 * 1024):
+        super().__init__(newsletters)
+        self.min_shared = min_shared
+        self.delivered = 0
+        self.errors = 0
+        self.shared_bytes = 0
+        self._keys = weakref.WeakKeyDictionary()
+        self._next_key = itertools.count()
+        self._seq = itertools.count()
+        # seq -> [workers still receiving, shared memory or None]
+        self._pending = dict()
+        # why the publisher can't deliver any more (a worker died), or None
+        self._failure = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._send_locks = list()
+        self._connections = list()
+        self._processes = list()
+        # the workers share the resource tracker of this process, which then
+        # knows that the shared memory they attach to is ours to release
+        resource_tracker.ensure_running()
+        for _ in range(n_workers):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_receive_in_worker, args=(worker_conn,), daemon=True
+            )
+            process.start()
+            worker_conn.close()
+            self._connections.append(conn)
+            self._send_locks.append(threading.Lock())
+            self._processes.append(process)
+        # the workers reply when they are done with a message, and a thread
+        # reads the replies, so that a full pipe never blocks a worker
+        self._reader = threading.Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+
+    @property
+    def n_workers(self):
+        return len(self._processes)
+
+    @property
+    def pending(self):
+        """Number of messages that some worker is still receiving."""
+        with self._lock:
+            return len(self._pending)
+
+    def _worker_of(self, key):
+        return key % len(self._connections)
+
+    def _send(self, key, request):
+        i = self._worker_of(key)
+        with self._send_locks[i]:
+            self._connections[i].send(request)
+
+    def register(self, newsletter, who, callback=None):
+        """Register a Subscriber to this newsletter, in its worker process.
+
+        Parameters
+        ----------
+        newsletter : str
+        who : Subscriber
+            picklable
+        callback : method or function
+            picklable
+        """
+        if callback is None:
+            callback = getattr(who, "receive")
+        if inspect.ismethod(callback) and callback.__self__ is who:
+            method, function = callback.__name__, None
+            if getattr(who, method, None) != callback:
+                # e.g. a name-mangled method, that getattr can't find
+                method, function = None, callback
+        else:
+            method, function = None, callback
+        key = self._keys.get(who)
+        if key is None:
+            key = next(self._next_key)
+            self._send(key, ("subscriber", key, who))
+            self._keys[who] = key
+            weakref.finalize(who, _forget_subscriber, weakref.ref(self), key)
+        self._send(key, ("register", key, newsletter, method, function))
+        super().register(newsletter, who, callback)
+
+    def unregister(self, newsletter, who):
+        super().unregister(newsletter, who)
+        key = self._keys.get(who)
+        if key is not None:
+            self._send(key, ("unregister", key, newsletter))
+
+    def _serialize(self, message):
+        """Pickle a message once, its large buffers in a shared memory block.
+
+        Returns
+        -------
+        tuple
+            (pickled message, shared memory or None, sizes of the buffers in
+            the shared memory)
+        """
+        buffers = list()
+
+        def out_of_band(buffer):
+            # returning True pickles the buffer in band
+            if buffer.raw().nbytes < self.min_shared:
+                return True
+            buffers.append(buffer)
+            return False
+
+        payload = pickle.dumps(message, protocol=5, buffer_callback=out_of_band)
+        if not buffers:
+            return payload, None, []
+        sizes = [b.raw().nbytes for b in buffers]
+        shm = shared_memory.SharedMemory(create=True, size=sum(sizes))
+        offset = 0
+        for buffer, size in zip(buffers, sizes):
+            shm.buf[offset : offset + size] = buffer.raw()
+            offset += size
+        return payload, shm, sizes
+
+    def dispatch(self, newsletter, message):
+        """Send a message to all subscribers registered to this newsletter.
+
+        Returns as soon as the message is on its way to the workers; call
+        join() to wait until they have received it.
+
+        Parameters
+        ----------
+        newsletter : str
+        message : picklable object
+        """
+        self._raise_failure()
+        subscriptions = self.get_subscriptions(newsletter).items()
+        if len(subscriptions) == 0:
+            print(
+                "No subscribers for the {} newsletter. Nothing to send!".format(
+                    newsletter
+                )
+            )
+            return
+
+        keys_by_worker = dict()
+        for subscriber, _ in subscriptions:
+            key = self._keys[subscriber]
+            keys_by_worker.setdefault(self._worker_of(key), list()).append(key)
+
+        payload, shm, sizes = self._serialize(message)
+        seq = next(self._seq)
+        with self._lock:
+            self._pending[seq] = [set(keys_by_worker), shm]
+            if shm is not None:
+                self.shared_bytes += shm.size
+        name = None if shm is None else shm.name
+        for i, keys in keys_by_worker.items():
+            with self._send_locks[i]:
+                self._connections[i].send(
+                    ("message", seq, newsletter, keys, payload, name, sizes)
+                )
+
+    def _received(self, seq, worker):
+        # called with the lock held
+        pending = self._pending[seq]
+        pending[0].discard(worker)
+        if not pending[0]:
+            del self._pending[seq]
+            if pending[1] is not None:
+                pending[1].close()
+                pending[1].unlink()
+            self._done.notify_all()
+
+    def _read_replies(self):
+        workers = {conn: i for i, conn in enumerate(self._connections)}
+        while workers:
+            for conn in multiprocessing.connection.wait(list(workers)):
+                i = workers[conn]
+                try:
+                    seq, delivered, errors = conn.recv()
+                except EOFError:
+                    del workers[conn]
+                    if self._closed:
+                        continue
+                    with self._lock:
+                        if self._failure is None:
+                            self._failure = "worker process {} exited ({})".format(
+                                i, self._processes[i].exitcode
+                            )
+                        # nobody is going to receive what it had left
+                        for seq in [
+                            seq for seq, p in self._pending.items() if i in p[0]
+                        ]:
+                            self._received(seq, i)
+                        self._done.notify_all()
+                    continue
+                with self._lock:
+                    self.delivered += delivered
+                    self.errors += errors
+                    self._received(seq, i)
+
+    def _raise_failure(self):
+        if self._failure is not None:
+            raise RuntimeError(self._failure)
+
+    def join(self, timeout=None):
+        """Wait until the workers have received every message dispatched.
+
+        Returns
+        -------
+        bool
+            False if the timeout expired first
+
+        Raises
+        ------
+        RuntimeError
+            if a worker process died
+        """
+        with self._lock:
+            done = self._done.wait_for(lambda: not self._pending, timeout)
+        self._raise_failure()
+        return done
+
+    def close(self):
+        """Wait for the messages dispatched, then stop the worker processes."""
+        try:
+            self.join()
+        finally:
+            self._shut_down()
+
+    def _shut_down(self):
+        self._closed = True
+        for conn, lock in zip(self._connections, self._send_locks):
+            with lock:
+                try:
+                    conn.send(None)
+                except OSError:
+                    # the worker is gone already
+                    pass
+        for process in self._processes:
+            process.join()
+        # the reader stops when all the workers have closed their pipes
+        self._reader.join()
+        for conn in self._connections:
+            conn.close()
 
 
 def main():
@@ -123,5 +1214,107 @@ def main():
     pub.dispatch(newsletter="Fashion", message="Fashion Newsletter num 2")
 
 
+async def async_main():
+
+    pub = AsyncPublisher(newsletters=["Tech"], timeout=0.5)
+    tom = Subscriber("Tom")
+    sara = AsyncSubscriber("Sara")
+    pub.register(newsletter="Tech", who=tom)
+    pub.register(newsletter="Tech", who=sara)
+
+    async def sleep_through(message):
+        await asyncio.sleep(10)
+
+    john = Subscriber("John")
+    pub.register(newsletter="Tech", who=john, callback=sleep_through, timeout=0.1)
+
+    # John is too slow, but Tom and Sara get the message all the same...
+    failures = await pub.dispatch(newsletter="Tech", message="Tech Newsletter num 1")
+    for subscriber, error in failures.items():
+        print("{} did not receive it: {!r}".format(subscriber.name, error))
+    # ...and publish doesn't even wait for them
+    task = pub.publish(newsletter="Tech", message="Tech Newsletter num 2")
+    print("Published")
+    await task
+
+
+def threaded_main():
+
+    pub = ThreadedPublisher(newsletters=["Tech"], maxsize=2, policy="drop_oldest")
+    tom = Subscriber("Tom")
+    sara = Subscriber("Sara")
+    pub.register(newsletter="Tech", who=tom)
+
+    def read_slowly(message):
+        time.sleep(0.1)
+        print("Sara read: {}".format(message))
+
+    pub.register(newsletter="Tech", who=sara, callback=read_slowly)
+
+    # Tom keeps up, Sara's queue fills up and she misses the oldest messages
+    for i in range(1, 6):
+        pub.dispatch(newsletter="Tech", message="Tech Newsletter num {}".format(i))
+        time.sleep(0.01)
+    pub.close()
+    for subscriber, stats in pub.stats().items():
+        print("{}: {}".format(subscriber.name, stats))
+
+
+def batching_main():
+
+    # the latest price of every stock, at most 10 times a second
+    pub = BatchingPublisher(
+        newsletters=["Stocks"], max_batch=1000, max_delay=0.1, key=lambda m: m[0]
+    )
+    tom = BatchSubscriber("Tom")
+    pub.register(newsletter="Stocks", who=tom)
+    for price in range(100, 110):
+        pub.dispatch(newsletter="Stocks", message=("ACME", price))
+        pub.dispatch(newsletter="Stocks", message=("INITECH", price / 10))
+    time.sleep(0.2)
+    print("{} messages coalesced".format(pub.coalesced))
+    pub.close()
+
+
+def topic_main():
+
+    pub = TopicPublisher()
+    tom = Subscriber("Tom")
+    sara = Subscriber("Sara")
+    john = Subscriber("John")
+
+    pub.register(newsletter="tech.*", who=tom)
+    pub.register(newsletter="tech.#", who=sara)
+    pub.register(newsletter="*.ai.#", who=john)
+
+    pub.dispatch(newsletter="tech.ai", message="tech.ai num 1")
+    pub.dispatch(newsletter="tech.ai.llm", message="tech.ai.llm num 1")
+    pub.dispatch(newsletter="travel.ai", message="travel.ai num 1")
+    pub.dispatch(newsletter="travel", message="travel num 1")
+
+
+def process_main():
+
+    pub = ProcessPublisher(newsletters=["Images"], n_workers=2)
+    tom = Subscriber("Tom")
+    sara = Subscriber("Sara")
+    pub.register(newsletter="Images", who=tom)
+    pub.register(newsletter="Images", who=sara)
+
+    # a 1 MB image is pickled once and reaches both workers through shared
+    # memory, without being copied into the pipes
+    image = pickle.PickleBuffer(bytearray(1024 * 1024))
+    pub.dispatch(newsletter="Images", message=("image.raw", image))
+    pub.close()
+    print(
+        "Delivered {} messages, {} bytes shared".format(pub.delivered, pub.shared_bytes)
+    )
+
+
 if __name__ == "__main__":
     main()
+    threaded_main()
+    batching_main()
+    topic_main()
+    process_main()
+    asyncio.run(async_main())
@@ -1,3 +1,15 @@
+import asyncio
+import csv
+import gc
+import multiprocessing
+import json
+import os
+import pickle
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
 import unittest
 import sys
 from io import StringIO
@@ -18,11 +30,39 @@ from abstract_factory import (
 )
 from memento import Originator
 from null_object import NullObject
-from observer import Publisher, Subscriber
+from observer import (
+    AsyncPublisher,
+    AsyncSubscriber,
+    BatchingPublisher,
+    BatchSubscriber,
+    Publisher,
+    ProcessPublisher,
+    Subscriber,
+    ThreadedPublisher,
+    TopicPublisher,
+)
 from proxy import Proxy, Implementation
 from singleton import Singleton, Child, GrandChild
 from strategy import Strategy, execute_replacement1, execute_replacement2
 
+# the mvc modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mvc"))
+from async_controller import AsyncController, AsyncModel, ThreadLocalModel
+import mvc_exceptions as mvc_exc
+import mvc_mock_objects as mock
+import sqlite_backend
+from caching_model import CachingModel
+from checkpointer import Checkpointer
+from coalescing_model import AsyncCoalescingModel, CoalescingModel, SlowModel
+from change_feed import ChangeFeedModel, IncrementalView
+from replication import Replicator, replicate
+from model_view_controller import Controller, Model, ModelBasic, ModelSQLite, View
+from model_stats import LatencyHistogram
+from query_log import QueryLog
+from sharded_model import ShardedModelSQLite
+from single_writer import SingleWriter
+from write_behind_model import WriteBehindModel
+
 
 @contextmanager
 def captured_output():
@@ -230,6 +270,473 @@ class TestObserver(unittest.TestCase):
         with self.assertRaises(KeyError):
             self.pub.subscriptions["Videogames"]
 
+    def test_subscription_does_not_keep_subscriber_alive(self):
+        john = Subscriber("John")
+        self.pub.register(newsletter="Tech", who=john)
+        self.assertEqual(len(self.pub.get_subscriptions("Tech")), 2)
+        del john
+        gc.collect()
+        self.assertEqual(list(self.pub.get_subscriptions("Tech")), [self.s0])
+
+    def test_short_lived_subscribers_do_not_pile_up(self):
+        for i in range(1000):
+            self.pub.register("Fashion", Subscriber("Subscriber {}".format(i)))
+        gc.collect()
+        self.assertEqual(self.pub.get_subscriptions("Fashion"), {})
+
+    def test_subscription_goes_away_with_object_of_callback(self):
+        john = Subscriber("John")
+        callback_owner = Subscriber("Owner")
+        self.pub.register("Fashion", john, callback=callback_owner.receive)
+        self.assertIn(john, self.pub.get_subscriptions("Fashion"))
+        del callback_owner
+        gc.collect()
+        self.assertNotIn(john, self.pub.get_subscriptions("Fashion"))
+        self.assertEqual(len(self.pub.get_subscriptions("Fashion")), 0)
+        self.assertFalse(self.pub.get_subscriptions("Fashion"))
+
+    def test_len_does_not_look_at_every_callback(self):
+        subscribers = [Subscriber(str(i)) for i in range(100)]
+        for who in subscribers:
+            self.pub.register("Fashion", who)
+        subscriptions = self.pub.get_subscriptions("Fashion")
+        subscriptions.items = None  # len() must not need it
+        self.assertEqual(len(subscriptions), 100)
+
+    def test_function_callback_is_kept(self):
+        received = []
+        john = Subscriber("John")
+        self.pub.register("Fashion", john, callback=lambda m: received.append(m))
+        gc.collect()
+        self.pub.dispatch("Fashion", "Fashion num 1")
+        self.assertEqual(received, ["Fashion num 1"])
+
+
+class TestAsyncPublisher(unittest.TestCase):
+    def setUp(self):
+        self.pub = AsyncPublisher(["Tech"], timeout=1.0)
+        self.tom = Subscriber("Tom")
+        self.sara = AsyncSubscriber("Sara")
+        self.pub.register("Tech", self.tom)
+        self.pub.register("Tech", self.sara)
+
+    def test_dispatch_to_plain_and_coroutine_callbacks(self):
+        with captured_output() as (out, err):
+            failures = asyncio.run(self.pub.dispatch("Tech", "Tech num 1"))
+        self.assertEqual(failures, {})
+        self.assertEqual(
+            sorted(out.getvalue().strip().splitlines()),
+            ["Sara received: Tech num 1", "Tom received: Tech num 1"],
+        )
+
+    def test_slow_subscriber_times_out_alone(self):
+        async def sleep_through(message):
+            await asyncio.sleep(10)
+
+        john = Subscriber("John")
+        self.pub.register("Tech", john, callback=sleep_through, timeout=0.05)
+        t0 = time.monotonic()
+        with captured_output() as (out, err):
+            failures = asyncio.run(self.pub.dispatch("Tech", "Tech num 1"))
+        self.assertLess(time.monotonic() - t0, 1.0)
+        self.assertEqual(list(failures), [john])
+        self.assertIsInstance(failures[john], asyncio.TimeoutError)
+        self.assertIn("Tom received: Tech num 1", out.getvalue())
+        self.assertIn("Sara received: Tech num 1", out.getvalue())
+
+    def test_concurrency_limit(self):
+        pub = AsyncPublisher(["Tech"], max_concurrency=2)
+        running = []
+        peak = []
+
+        async def receive(message):
+            running.append(message)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(message)
+
+        # subscriptions don't keep their subscribers alive, we do
+        subscribers = [Subscriber(n) for n in ["Tom", "Sara", "John", "Ann", "Bob"]]
+        for who in subscribers:
+            pub.register("Tech", who, callback=receive)
+        asyncio.run(pub.dispatch("Tech", "Tech num 1"))
+        self.assertEqual(len(peak), 5)
+        self.assertEqual(max(peak), 2)
+
+    def test_dispatch_from_a_second_event_loop(self):
+        pub = AsyncPublisher(["Tech"], max_concurrency=1)
+        received = []
+
+        async def receive(message):
+            await asyncio.sleep(0.01)
+            received.append(message)
+
+        subscribers = [Subscriber(n) for n in ["Tom", "Sara", "John"]]
+        for who in subscribers:
+            pub.register("Tech", who, callback=receive)
+        # each asyncio.run has its own loop; both have to wait for a slot
+        for i in range(2):
+            failures = asyncio.run(pub.dispatch("Tech", "Tech num {}".format(i)))
+            self.assertEqual(failures, {})
+        self.assertEqual(len(received), 6)
+
+    def test_publish_does_not_wait_for_delivery(self):
+        received = []
+
+        async def slow_receive(message):
+            await asyncio.sleep(0.05)
+            received.append(message)
+
+        john = Subscriber("John")
+        self.pub.register("Tech", john, callback=slow_receive)
+
+        async def publish():
+            task = self.pub.publish("Tech", "Tech num 1")
+            self.assertEqual(received, [])
+            await task
+
+        with captured_output() as (out, err):
+            asyncio.run(publish())
+        self.assertEqual(received, ["Tech num 1"])
+
+
+class TestThreadedPublisher(unittest.TestCase):
+    def setUp(self):
+        self.received = dict()
+        self.subscribers = []
+        # the first message of a subscriber blocks until this is set
+        self.release = threading.Event()
+
+    def subscribe(self, pub, name, blocking=False):
+        who = Subscriber(name)
+        self.received[name] = []
+
+        def receive(message):
+            if blocking:
+                self.release.wait()
+            self.received[name].append(message)
+
+        pub.register("Tech", who, callback=receive)
+        self.subscribers.append(who)
+        return who
+
+    def test_order_is_preserved_per_subscriber(self):
+        pub = ThreadedPublisher(["Tech"], max_workers=4)
+        for name in ["Tom", "Sara", "John"]:
+            self.subscribe(pub, name)
+        for i in range(100):
+            pub.dispatch("Tech", i)
+        pub.close()
+        for name in ["Tom", "Sara", "John"]:
+            self.assertEqual(self.received[name], list(range(100)))
+
+    def test_subscribers_receive_in_parallel(self):
+        pub = ThreadedPublisher(["Tech"], max_workers=4)
+        subscribers = [Subscriber(n) for n in ["Tom", "Sara", "John", "Ann"]]
+        for who in subscribers:
+            pub.register("Tech", who, callback=lambda m: time.sleep(0.1))
+        t0 = time.monotonic()
+        pub.dispatch("Tech", "Tech num 1")
+        self.assertLess(time.monotonic() - t0, 0.05)
+        pub.close()
+        self.assertLess(time.monotonic() - t0, 0.3)
+
+    def test_drop_oldest(self):
+        pub = ThreadedPublisher(["Tech"], maxsize=2, policy="drop_oldest")
+        tom = self.subscribe(pub, "Tom", blocking=True)
+        pub.dispatch("Tech", 0)
+        # wait until the worker is stuck on the first message
+        while pub.queue_depths()[tom]:
+            time.sleep(0.001)
+        for i in range(1, 5):
+            pub.dispatch("Tech", i)
+        self.assertEqual(pub.queue_depths()[tom], 2)
+        self.release.set()
+        pub.close()
+        self.assertEqual(self.received["Tom"], [0, 3, 4])
+        self.assertEqual(pub.stats()[tom]["dropped"], 2)
+        self.assertEqual(pub.stats()[tom]["max_depth"], 2)
+
+    def test_drop_newest(self):
+        pub = ThreadedPublisher(["Tech"], maxsize=2, policy="drop_newest")
+        tom = self.subscribe(pub, "Tom", blocking=True)
+        pub.dispatch("Tech", 0)
+        while pub.queue_depths()[tom]:
+            time.sleep(0.001)
+        for i in range(1, 5):
+            pub.dispatch("Tech", i)
+        self.release.set()
+        pub.close()
+        self.assertEqual(self.received["Tom"], [0, 1, 2])
+        self.assertEqual(pub.stats()[tom]["delivered"], 3)
+
+    def test_block_waits_for_room(self):
+        pub = ThreadedPublisher(["Tech"], maxsize=1, policy="block")
+        self.subscribe(pub, "Tom", blocking=True)
+        dispatcher = threading.Thread(
+            target=lambda: [pub.dispatch("Tech", i) for i in range(3)]
+        )
+        dispatcher.start()
+        dispatcher.join(0.05)
+        self.assertTrue(dispatcher.is_alive())
+        self.release.set()
+        dispatcher.join()
+        pub.close()
+        self.assertEqual(self.received["Tom"], [0, 1, 2])
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            ThreadedPublisher(["Tech"], policy="drop_all")
+
+
+class TestBatchingPublisher(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.messages = []
+
+    def subscribe(self, pub):
+        self.tom = BatchSubscriber("Tom")
+        self.sara = Subscriber("Sara")
+        pub.register("Tech", self.tom, callback=self.batches.append, batch=True)
+        pub.register("Tech", self.sara, callback=self.messages.append)
+
+    def test_full_batch_is_delivered_right_away(self):
+        pub = BatchingPublisher(["Tech"], max_batch=3, max_delay=10)
+        self.subscribe(pub)
+        for i in range(7):
+            pub.dispatch("Tech", i)
+        self.assertEqual(self.batches, [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(self.messages, [0, 1, 2, 3, 4, 5])
+        pub.close()
+        self.assertEqual(self.batches, [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(self.messages, list(range(7)))
+
+    def test_batch_is_delivered_after_max_delay(self):
+        pub = BatchingPublisher(["Tech"], max_batch=100, max_delay=0.02)
+        self.subscribe(pub)
+        pub.dispatch("Tech", 0)
+        pub.dispatch("Tech", 1)
+        self.assertEqual(self.batches, [])
+        time.sleep(0.2)
+        self.assertEqual(self.batches, [[0, 1]])
+        self.assertEqual(self.messages, [0, 1])
+        pub.close()
+
+    def test_receive_batch_is_used_by_default(self):
+        pub = BatchingPublisher(["Tech"])
+        tom = BatchSubscriber("Tom")
+        sara = Subscriber("Sara")
+        pub.register("Tech", tom)
+        pub.register("Tech", sara)
+        self.assertEqual(pub.get_subscriptions("Tech")[tom], tom.receive_batch)
+        self.assertEqual(dict(pub.batch_subscriptions), {tom: {"Tech"}})
+        pub.close()
+
+    def test_coalesce_by_key(self):
+        pub = BatchingPublisher(["Tech"], max_delay=10, key=lambda m: m[0])
+        self.subscribe(pub)
+        for message in [("a", 1), ("b", 1), ("a", 2), ("a", 3), ("b", 2)]:
+            pub.dispatch("Tech", message)
+        pub.close()
+        self.assertEqual(self.batches, [[("a", 3), ("b", 2)]])
+        self.assertEqual(pub.coalesced, 3)
+
+    def test_stream_on_one_key_is_delivered_after_max_delay(self):
+        pub = BatchingPublisher(["Tech"], max_delay=0.05, key=lambda m: m[0])
+        self.subscribe(pub)
+        # each message replaces the only one in the batch
+        for i in range(30):
+            pub.dispatch("Tech", ("a", i))
+            time.sleep(0.01)
+        self.assertGreater(len(self.batches), 0)
+        pub.close()
+
+    def test_failing_subscriber_does_not_stop_the_others(self):
+        def fail(message):
+            raise ValueError(message)
+
+        pub = BatchingPublisher(["Tech"], max_batch=100, max_delay=0.02)
+        john = Subscriber("John")
+        pub.register("Tech", john, callback=fail)
+        self.subscribe(pub)
+        pub.dispatch("Tech", 0)
+        pub.dispatch("Tech", 1)
+        time.sleep(0.2)
+        self.assertEqual(self.batches, [[0, 1]])
+        self.assertEqual(self.messages, [0, 1])
+        self.assertEqual(pub.errors, 2)
+        # the timer thread is still delivering
+        pub.dispatch("Tech", 2)
+        time.sleep(0.2)
+        self.assertEqual(self.batches, [[0, 1], [2]])
+        pub.close()
+
+
+class TestTopicPublisher(unittest.TestCase):
+    def setUp(self):
+        self.pub = TopicPublisher()
+        self.tom = Subscriber("Tom")
+        self.sara = Subscriber("Sara")
+        self.john = Subscriber("John")
+        self.pub.register("tech.*", self.tom)
+        self.pub.register("tech.#", self.sara)
+        self.pub.register("*.ai.#", self.john)
+
+    def test_star_matches_exactly_one_word(self):
+        self.assertEqual(
+            self.pub.matching_patterns("tech.ai"), ("tech.*", "tech.#", "*.ai.#")
+        )
+        self.assertNotIn("tech.*", self.pub.matching_patterns("tech"))
+        self.assertNotIn("tech.*", self.pub.matching_patterns("tech.ai.llm"))
+
+    def test_hash_matches_zero_or_more_words(self):
+        self.assertEqual(self.pub.matching_patterns("tech"), ("tech.#",))
+        self.assertEqual(
+            self.pub.matching_patterns("tech.ai.llm"), ("tech.#", "*.ai.#")
+        )
+        self.assertEqual(self.pub.matching_patterns("travel.ai"), ("*.ai.#",))
+        self.assertEqual(self.pub.matching_patterns("travel"), ())
+
+    def test_subscriber_receives_once(self):
+        with captured_output() as (out, err):
+            self.pub.dispatch("tech.ai", "tech.ai num 1")
+        self.assertEqual(
+            out.getvalue().strip().splitlines(),
+            [
+                "Tom received: tech.ai num 1",
+                "Sara received: tech.ai num 1",
+                "John received: tech.ai num 1",
+            ],
+        )
+        self.pub.register("tech.ai", self.tom)
+        with captured_output() as (out, err):
+            self.pub.dispatch("tech.ai", "tech.ai num 2")
+        self.assertEqual(out.getvalue().count("Tom received"), 1)
+
+    def test_cache_is_invalidated_by_new_patterns(self):
+        self.assertEqual(self.pub.matching_patterns("travel"), ())
+        ann = Subscriber("Ann")
+        self.pub.register("travel", ann)
+        self.assertEqual(self.pub.matching_patterns("travel"), ("travel",))
+        self.pub.unregister("travel", ann)
+        self.assertEqual(self.pub.matching_patterns("travel"), ())
+        self.assertNotIn("travel", self.pub.subscriptions)
+
+    def test_wildcards_are_not_allowed_in_topics(self):
+        with self.assertRaises(ValueError):
+            self.pub.dispatch("tech.*", "tech num 1")
+        with self.assertRaises(ValueError):
+            self.pub.register("tech.a*", self.tom)
+
+
+class FileSubscriber(Subscriber):
+    """Subscriber that writes what it receives to a file, from any process."""
+
+    def __init__(self, name, path):
+        super().__init__(name)
+        self.path = path
+
+    def receive(self, message):
+        if isinstance(message, tuple):
+            # (text, buffer): write the size and the first bytes of the buffer
+            text, buffer = message
+            buffer = memoryview(buffer)
+            message = "{} {} {}".format(text, buffer.nbytes, bytes(buffer[:3]))
+        with open(self.path, "a") as f:
+            f.write("{} received: {}\n".format(self.name, message))
+
+
+class CountingSubscriber(FileSubscriber):
+    """FileSubscriber that numbers the messages it receives."""
+
+    def __init__(self, name, path):
+        super().__init__(name, path)
+        self.count = 0
+
+    def receive(self, message):
+        self.count += 1
+        super().receive("{} {}".format(self.count, message))
+
+
+def exit_worker(message):
+    os._exit(1)
+
+
+class TestProcessPublisher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "received.txt")
+        self.pub = ProcessPublisher(["Tech", "Travel"], n_workers=2, min_shared=1024)
+        self.tom = FileSubscriber("Tom", self.path)
+        self.sara = FileSubscriber("Sara", self.path)
+        self.pub.register("Tech", self.tom)
+        self.pub.register("Tech", self.sara)
+
+    def tearDown(self):
+        self.pub.close()
+        self.tmp.cleanup()
+
+    def received(self, name):
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        prefix = "{} received: ".format(name)
+        return [x[len(prefix) :] for x in lines if x.startswith(prefix)]
+
+    def test_messages_are_received_in_order(self):
+        for i in range(20):
+            self.pub.dispatch("Tech", "Tech num {}".format(i))
+        self.assertTrue(self.pub.join(timeout=10))
+        expected = ["Tech num {}".format(i) for i in range(20)]
+        self.assertEqual(self.received("Tom"), expected)
+        self.assertEqual(self.received("Sara"), expected)
+        self.assertEqual(self.pub.delivered, 40)
+
+    def test_large_buffers_go_through_shared_memory(self):
+        image = bytearray(b"abc" * 100000)
+        self.pub.dispatch("Tech", ("image", pickle.PickleBuffer(image)))
+        self.pub.dispatch("Tech", ("icon", pickle.PickleBuffer(bytearray(b"xyz"))))
+        self.assertTrue(self.pub.join(timeout=10))
+        self.assertEqual(self.received("Tom"), ["image 300000 b'abc'", "icon 3 b'xyz'"])
+        self.assertEqual(self.received("Sara"), self.received("Tom"))
+        # only the large buffer was shared, once for both workers
+        self.assertEqual(self.pub.shared_bytes, 300000)
+        self.assertEqual(self.pub.pending, 0)
+
+    def test_unregistered_subscriber_does_not_receive(self):
+        self.pub.unregister("Tech", self.sara)
+        self.pub.dispatch("Tech", "Tech num 1")
+        self.assertTrue(self.pub.join(timeout=10))
+        self.assertEqual(self.received("Tom"), ["Tech num 1"])
+        self.assertEqual(self.received("Sara"), [])
+
+    def test_callback_must_be_picklable(self):
+        with self.assertRaises((pickle.PicklingError, AttributeError)):
+            self.pub.register("Tech", self.tom, callback=lambda m: None)
+
+    def test_subscriber_has_one_copy_in_its_worker(self):
+        john = CountingSubscriber("John", self.path)
+        self.pub.register("Tech", john)
+        self.pub.register("Travel", john)
+        self.pub.dispatch("Tech", "Tech num 1")
+        self.pub.dispatch("Travel", "Travel num 1")
+        self.assertTrue(self.pub.join(timeout=10))
+        self.assertEqual(self.received("John"), ["1 Tech num 1", "2 Travel num 1"])
+
+
+class TestProcessPublisherFailure(unittest.TestCase):
+    def test_dead_worker_makes_join_raise(self):
+        pub = ProcessPublisher(["Tech"], n_workers=1)
+        tom = Subscriber("Tom")
+        pub.register("Tech", tom, callback=exit_worker)
+        pub.dispatch("Tech", "Tech num 1")
+        with self.assertRaises(RuntimeError):
+            pub.join(timeout=10)
+        self.assertEqual(pub.pending, 0)
+        with self.assertRaises(RuntimeError):
+            pub.dispatch("Tech", "Tech num 2")
+        with self.assertRaises(RuntimeError):
+            pub.close()
+
 
 class TestProxy(unittest.TestCase):
     def test_load_real_or_cached_object(self):
@@ -285,5 +792,955 @@ class TestStrategy(unittest.TestCase):
         )
 
 
+def sqlite_model(items, search_index=False):
+    with captured_output():
+        conn = sqlite_backend.connect_to_db(check_same_thread=False)
+        return ModelSQLite(items, connection=conn, search_index=search_index)
+
+
+def names(items):
+    return sorted(x["name"] for x in items)
+
+
+def price_and_quantity(item):
+    return item["price"], item["quantity"]
+
+
+class CountingSink(StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+class TestView(unittest.TestCase):
+    def test_a_list_is_one_write(self):
+        sink = CountingSink()
+        items = [
+            {"name": "item{}".format(i), "price": 1.0, "quantity": i}
+            for i in range(100)
+        ]
+        View(sink).show_number_point_list("product", items)
+        self.assertEqual(sink.writes, 1)
+        self.assertIn("100. {'name': 'item99'", sink.getvalue())
+
+    def test_default_sink_is_the_current_stdout(self):
+        view = View()
+        with captured_output() as (out, _):
+            view.show_item("product", "bread", {"price": 0.5})
+        self.assertIn("we have some BREAD", out.getvalue())
+
+    def test_path_sink_is_appended_to_and_closed(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "view.log")
+        for name in ("bread", "milk"):
+            view = View(path)
+            view.display_item_deletion(name)
+            view.close()
+        with open(path) as f:
+            text = f.read()
+        self.assertIn("bread", text)
+        self.assertIn("milk", text)
+
+    def test_stream_sink_is_not_closed(self):
+        sink = StringIO()
+        view = View(sink)
+        view.display_item_deletion("bread")
+        view.close()
+        self.assertFalse(sink.closed)
+
+
+class TestLazyBackends(unittest.TestCase):
+    def loaded_modules(self, code):
+        # a fresh interpreter: this one has imported the backends already
+        code = "import sys\n{}\nprint(' '.join(sorted(sys.modules)))".format(code)
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), "mvc"),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.split()
+
+    def test_model_basic_doesnt_import_the_databases(self):
+        modules = self.loaded_modules(
+            "import model_view_controller as mvc\n"
+            "import mvc_mock_objects as mock\n"
+            "mvc.ModelBasic(mock.items())"
+        )
+        self.assertNotIn("sqlite3", modules)
+        self.assertNotIn("dataset", modules)
+
+    def test_backend_is_imported_when_used(self):
+        modules = self.loaded_modules(
+            "import model_view_controller as mvc\n" "mvc.sqlite_backend.connect_to_db"
+        )
+        self.assertIn("sqlite3", modules)
+        self.assertNotIn("dataset", modules)
+
+
+class TestModelStats(unittest.TestCase):
+    def setUp(self):
+        self.model = sqlite_model(mock.items())
+        self.model.enable_stats()
+
+    def test_calls_and_errors_are_counted(self):
+        self.model.read_item("bread")
+        with self.assertRaises(mvc_exc.ItemNotStored):
+            self.model.read_item("beer")
+        self.model.read_items()
+        stats = self.model.stats()
+        self.assertEqual(stats["read_item"]["calls"], 2)
+        self.assertEqual(stats["read_item"]["errors"], {"ItemNotStored": 1})
+        self.assertEqual(stats["read_item"]["latency"]["count"], 2)
+        self.assertEqual(stats["read_items"]["calls"], 1)
+        self.assertNotIn("create_item", stats)
+
+    def test_stats_json(self):
+        self.model.update_item("milk", price=1.2, quantity=20)
+        stats = json.loads(self.model.stats_json())
+        self.assertEqual(stats["update_item"]["calls"], 1)
+
+    def test_disable_stats_removes_the_wrappers(self):
+        self.model.disable_stats()
+        self.assertNotIn("read_item", vars(self.model))
+        self.assertEqual(self.model.read_item("bread")["price"], 0.5)
+
+    def test_latency_buckets(self):
+        h = LatencyHistogram()
+        for seconds in (0.000001, 0.000003, 0.001):
+            h.record(seconds)
+        # 1 us -> bucket 2, 3 us -> bucket 4, 1000 us -> bucket 1024
+        self.assertEqual(h.as_dict()["buckets"], {"2": 1, "4": 1, "1024": 1})
+        self.assertEqual(h.percentile(50), 4)
+        self.assertEqual(h.percentile(99), 1024)
+
+
+@ddt
+class TestModelBatches(unittest.TestCase):
+    def model(self, backend):
+        if backend == "basic":
+            return ModelBasic(mock.items())
+        return sqlite_model(mock.items())
+
+    @data("basic", "sqlite")
+    def test_create_items_is_all_or_nothing(self, backend):
+        model = self.model(backend)
+        beer = {"name": "beer", "price": 3.0, "quantity": 15}
+        milk = {"name": "milk", "price": 1.2, "quantity": 8}
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            model.create_items([beer, milk])
+        self.assertEqual(names(model.read_items()), ["bread", "milk", "wine"])
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            model.create_items([beer, beer])
+        self.assertEqual(names(model.read_items()), ["bread", "milk", "wine"])
+        model.create_items([beer])
+        self.assertEqual(price_and_quantity(model.read_item("beer")), (3.0, 15))
+
+    @data("basic", "sqlite")
+    def test_rejected_batch_publishes_no_change(self, backend):
+        model = ChangeFeedModel(self.model(backend))
+        milk = {"name": "milk", "price": 1.2, "quantity": 8}
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            model.create_items([milk])
+        self.assertEqual(model.changes_since(0), (0, []))
+
+    @data("basic", "sqlite")
+    def test_controller_rejects_duplicates_in_a_batch(self, backend):
+        model = self.model(backend)
+        c = Controller(model, View())
+        beer = {"name": "beer", "price": 3.0, "quantity": 15}
+        with self.assertRaises(AssertionError):
+            c.insert_items([beer, beer])
+        self.assertEqual(names(model.read_items()), ["bread", "milk", "wine"])
+
+    @data("basic", "sqlite")
+    def test_update_items_is_all_or_nothing(self, backend):
+        model = self.model(backend)
+        bread = {"name": "bread", "price": 0.8, "quantity": 15}
+        beer = {"name": "beer", "price": 3.0, "quantity": 15}
+        with self.assertRaises(mvc_exc.ItemNotStored):
+            model.update_items([bread, beer])
+        self.assertEqual(price_and_quantity(model.read_item("bread")), (0.5, 20))
+        model.update_items([bread])
+        self.assertEqual(price_and_quantity(model.read_item("bread")), (0.8, 15))
+
+    @data("basic", "sqlite")
+    def test_delete_items_is_all_or_nothing(self, backend):
+        model = self.model(backend)
+        with self.assertRaises(mvc_exc.ItemNotStored):
+            model.delete_items(["bread", "beer"])
+        self.assertEqual(names(model.read_items()), ["bread", "milk", "wine"])
+        model.delete_items(["bread", "milk", "bread"])
+        self.assertEqual(names(model.read_items()), ["wine"])
+
+    @data("basic", "sqlite")
+    def test_read_many(self, backend):
+        model = self.model(backend)
+        found, missing = model.read_many(["wine", "beer", "bread", "wine"])
+        self.assertEqual([x["name"] for x in found], ["wine", "bread"])
+        self.assertEqual(price_and_quantity(found[0]), (10.0, 5))
+        self.assertEqual(missing, ["beer"])
+        self.assertEqual(model.read_many([]), ([], []))
+
+    @data("basic", "sqlite")
+    def test_read_many_more_names_than_a_query_takes(self, backend):
+        model = self.model(backend)
+        model.create_items(
+            [
+                {"name": "item{}".format(i), "price": 1.0, "quantity": i}
+                for i in range(1200)
+            ]
+        )
+        wanted = ["item{}".format(i) for i in range(1199, -1, -2)] + ["beer"]
+        found, missing = model.read_many(wanted)
+        self.assertEqual([x["name"] for x in found], wanted[:-1])
+        self.assertEqual(missing, ["beer"])
+
+    @data("basic", "sqlite")
+    def test_aggregate(self, backend):
+        model = self.model(backend)
+        expected = {"count": 3, "quantity": 35, "stock_value": 70.0, "low_stock": 1}
+        self.assertEqual(model.aggregate(low_stock=10), expected)
+        # the backend computes the same as a scan of read_items()
+        self.assertEqual(Model.aggregate(model, low_stock=10), expected)
+        self.assertNotIn("low_stock", model.aggregate())
+        model.create_item("beer", price=3.0, quantity=0)
+        self.assertEqual(model.count(), 4)
+        self.assertEqual(model.count(low_stock=10), 2)
+
+    @data("basic", "sqlite")
+    def test_aggregate_of_no_items(self, backend):
+        model = self.model(backend)
+        model.delete_items(["bread", "milk", "wine"])
+        self.assertEqual(
+            model.aggregate(low_stock=10),
+            {"count": 0, "quantity": 0, "stock_value": 0.0, "low_stock": 0},
+        )
+        self.assertEqual(model.count(low_stock=10), 0)
+
+
+@ddt
+class TestExport(unittest.TestCase):
+    def controller(self, backend, sink):
+        model = (
+            ModelBasic(mock.items())
+            if backend == "basic"
+            else sqlite_model(mock.items())
+        )
+        model.create_items(
+            [
+                {"name": "beer, lager", "price": 3.0, "quantity": 15},
+                {"name": "pie", "price": 4.0, "quantity": 2},
+            ]
+        )
+        return Controller(model, View(sink))
+
+    def expected(self):
+        return [
+            ("bread", 0.5, 20),
+            ("milk", 1.0, 10),
+            ("wine", 10.0, 5),
+            ("beer, lager", 3.0, 15),
+            ("pie", 4.0, 2),
+        ]
+
+    @data("basic", "sqlite")
+    def test_jsonl(self, backend):
+        sink = CountingSink()
+        self.controller(backend, sink).show_items(output="jsonl", chunk_size=2)
+        items = [json.loads(line) for line in sink.getvalue().splitlines()]
+        # no "id" of the sqlite rows
+        self.assertEqual({tuple(x) for x in items}, {("name", "price", "quantity")})
+        self.assertEqual(
+            sorted((x["name"], x["price"], x["quantity"]) for x in items),
+            sorted(self.expected()),
+        )
+        # one write per chunk of items
+        self.assertEqual(sink.writes, 3)
+
+    @data("basic", "sqlite")
+    def test_csv(self, backend):
+        sink = CountingSink()
+        self.controller(backend, sink).show_items(output="csv", chunk_size=2)
+        rows = list(csv.DictReader(StringIO(sink.getvalue())))
+        self.assertEqual(
+            sorted((x["name"], float(x["price"]), int(x["quantity"])) for x in rows),
+            sorted(self.expected()),
+        )
+        self.assertTrue(sink.getvalue().startswith("name,price,quantity\n"))
+        # the header, then one write per chunk of items
+        self.assertEqual(sink.writes, 4)
+
+    def test_unknown_output(self):
+        with self.assertRaises(ValueError):
+            self.controller("sqlite", StringIO()).show_items(output="xml")
+
+
+class RacingModel(Model):
+    """Model wrapper where another client writes while an item is read."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.writer = None
+
+    @property
+    def item_type(self):
+        return self.model.item_type
+
+    def read_item(self, name):
+        item = self.model.read_item(name)
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.update_item(name, 9.0, 9)
+        return item
+
+    def read_items(self):
+        return self.model.read_items()
+
+    def read_many(self, names):
+        items = self.model.read_many(names)
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.update_item(names[0], 9.0, 9)
+        return items
+
+    def update_item(self, name, price, quantity):
+        self.model.update_item(name, price, quantity)
+
+    def update_items(self, items):
+        self.model.update_items(items)
+
+
+class TestCachingModel(unittest.TestCase):
+    def setUp(self):
+        self.backend = RacingModel(ModelBasic(mock.items()))
+        self.model = CachingModel(self.backend)
+
+    def test_write_invalidates_cached_items(self):
+        self.model.read_item("bread")
+        self.model.read_items()
+        self.assertEqual(self.model.read_item("bread")["price"], 0.5)
+        self.assertEqual(self.model.hits, 1)
+        self.model.update_items([{"name": "bread", "price": 0.8, "quantity": 15}])
+        self.assertEqual(self.model.read_item("bread")["price"], 0.8)
+        self.assertIn(0.8, [x["price"] for x in self.model.read_items()])
+        self.assertEqual(self.model.hits, 1)
+
+    def test_read_overlapping_a_write_is_not_cached(self):
+        self.backend.writer = self.model
+        self.assertEqual(self.model.read_item("bread")["price"], 0.5)
+        self.assertEqual(self.model.read_item("bread")["price"], 9.0)
+
+    def test_read_many_overlapping_a_write_is_not_cached(self):
+        self.backend.writer = self.model
+        found, _ = self.model.read_many(["milk", "wine"])
+        self.assertEqual(found[0]["price"], 1.0)
+        found, _ = self.model.read_many(["milk", "wine"])
+        self.assertEqual(found[0]["price"], 9.0)
+        # the other item was cached as usual
+        self.assertEqual(self.model.hits, 1)
+
+
+class FailingModel(Model):
+    """Model wrapper whose update_items fails until fail is set to False."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.fail = True
+
+    @property
+    def item_type(self):
+        return self.model.item_type
+
+    def read_item(self, name):
+        return self.model.read_item(name)
+
+    def update_items(self, items):
+        if self.fail:
+            raise RuntimeError("database is down")
+        self.model.update_items(items)
+
+
+class SlowRejectingModel(Model):
+    """Model wrapper whose create_items takes a while, then fails."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.creating = threading.Event()
+
+    @property
+    def item_type(self):
+        return self.model.item_type
+
+    def read_item(self, name):
+        return self.model.read_item(name)
+
+    def create_items(self, items):
+        self.creating.set()
+        time.sleep(0.1)
+        raise mvc_exc.ItemAlreadyStored("{} already stored!".format(items))
+
+    def update_items(self, items):
+        self.model.update_items(items)
+
+
+class TestWriteBehindModel(unittest.TestCase):
+    def setUp(self):
+        self.backend = ModelBasic(mock.items())
+
+    def test_flush_writes_queued_writes_to_the_backend(self):
+        model = WriteBehindModel(self.backend, max_lag=10)
+        model.create_item("beer", 3.0, 15)
+        model.update_item("milk", 1.2, 20)
+        model.delete_item("wine")
+        self.assertEqual(model.pending, 3)
+        self.assertEqual(names(self.backend.read_items()), ["bread", "milk", "wine"])
+        self.assertEqual(names(model.read_items()), ["beer", "bread", "milk"])
+        model.flush()
+        self.assertEqual(model.pending, 0)
+        self.assertEqual(names(self.backend.read_items()), ["beer", "bread", "milk"])
+        self.assertEqual(self.backend.read_item("milk")["price"], 1.2)
+        model.close()
+
+    def test_rejected_batch_is_raised_by_next_flush(self):
+        model = WriteBehindModel(self.backend, max_lag=0.01)
+        model.create_item("beer", 3.0, 15)
+        # another client stores the same item before the write is flushed
+        self.backend.create_item("beer", 2.0, 5)
+        time.sleep(0.2)
+        self.assertEqual(len(model.errors), 1)
+        self.assertEqual(model.read_item("beer")["price"], 2.0)
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            model.flush()
+        # it is raised once
+        model.flush()
+        model.close()
+
+    def test_flush_thread_survives_backend_errors(self):
+        backend = FailingModel(self.backend)
+        model = WriteBehindModel(backend, max_lag=0.01)
+        model.update_item("milk", 1.2, 20)
+        time.sleep(0.2)
+        self.assertEqual(model.pending, 0)
+        self.assertIsInstance(model.errors[0][2], RuntimeError)
+        backend.fail = False
+        model.update_item("milk", 1.5, 20)
+        time.sleep(0.2)
+        self.assertEqual(self.backend.read_item("milk")["price"], 1.5)
+        with self.assertRaises(RuntimeError):
+            model.close()
+
+    def test_rejected_batch_with_a_concurrent_writer(self):
+        backend = SlowRejectingModel(self.backend)
+        model = WriteBehindModel(backend, max_lag=10)
+        model.create_item("beer", 3.0, 15)
+        flusher = threading.Thread(target=model._flush, daemon=True)
+        flusher.start()
+        backend.creating.wait()
+        # waits for the backend while the batch is being rejected
+        writer = threading.Thread(
+            target=model.update_item, args=("bread", 0.8, 15), daemon=True
+        )
+        writer.start()
+        flusher.join(timeout=5)
+        writer.join(timeout=5)
+        self.assertFalse(flusher.is_alive() or writer.is_alive())
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            model.close()
+        self.assertEqual(self.backend.read_item("bread")["price"], 0.8)
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.items = mock.items() + [
+            {"name": "dark chocolate", "price": 2.0, "quantity": 10},
+            {"name": "milk chocolate", "price": 1.8, "quantity": 10},
+            {"name": "chocolate_chip cookie", "price": 3.0, "quantity": 10},
+            {"name": "red wine", "price": 8.0, "quantity": 10},
+            {"name": "wine vinegar", "price": 2.5, "quantity": 10},
+        ]
+
+    def test_basic_and_fts5_find_the_same_items(self):
+        basic = ModelBasic([dict(x) for x in self.items])
+        fts5 = sqlite_model(self.items, search_index=True)
+        scan = sqlite_model(self.items)
+        queries = ["choc", "chocolate", "milk", "milk choc", "w", "wine", "red w"]
+        queries += ["chip", "CHOC", "dark milk", "cake", "", "!"]
+        for query in queries:
+            with self.subTest(query=query):
+                expected = names(scan.search(query, limit=100))
+                self.assertEqual(names(basic.search(query, limit=100)), expected)
+                self.assertEqual(names(fts5.search(query, limit=100)), expected)
+        basic.delete_items(["milk chocolate"])
+        basic.update_items([{"name": "dark chocolate", "price": 1.0, "quantity": 1}])
+        self.assertEqual(basic.search("choc"), basic.search("choc", limit=100))
+        self.assertEqual([x["price"] for x in basic.search("chocolate")], [3.0, 1.0])
+
+
+class TestShardedModel(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with captured_output():
+            self.model = ShardedModelSQLite(
+                mock.items(), n_shards=3, db=os.path.join(tmp.name, "items")
+            )
+        self.addCleanup(self.model.close)
+
+    def test_items_are_routed_to_their_shard(self):
+        self.model.create_items(
+            [
+                {"name": "item{}".format(i), "price": 1.0, "quantity": i}
+                for i in range(20)
+            ]
+        )
+        for i, shard in enumerate(self.model._shards):
+            for x in shard.read_items():
+                self.assertEqual(self.model.shard_of(x["name"]), i)
+        self.assertEqual(self.model.read_item("item7")["quantity"], 7)
+        self.assertEqual(self.model.count(), 23)
+
+    def test_read_items_is_ordered_by_name(self):
+        self.model.create_item("apple", price=1.0, quantity=3)
+        items = self.model.read_items()
+        self.assertEqual([x["name"] for x in items], names(items))
+
+    def test_read_many_across_shards(self):
+        found, missing = self.model.read_many(["wine", "beer", "bread", "wine"])
+        self.assertEqual([x["name"] for x in found], ["wine", "bread"])
+        self.assertEqual(missing, ["beer"])
+
+    def test_search_is_ordered_by_name(self):
+        self.model.create_items(
+            [
+                {"name": "dark choc {}".format(i), "price": 2.0, "quantity": 1}
+                for i in range(9)
+            ]
+        )
+        results = self.model.search("dark choc", limit=4)
+        self.assertEqual(len(results), 4)
+        self.assertEqual([x["name"] for x in results], names(results))
+        self.assertEqual(len(self.model.search("choc", limit=20)), 9)
+
+    def test_rejected_batch_doesnt_overwrite(self):
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            self.model.create_items(
+                [
+                    {"name": "beer", "price": 3.0, "quantity": 15},
+                    {"name": "bread", "price": 1.0, "quantity": 1},
+                ]
+            )
+        self.assertEqual(self.model.read_item("bread")["price"], 0.5)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "snapshot.db")
+        self.model = sqlite_model(mock.items())
+
+    def restore(self, **kwargs):
+        with captured_output():
+            connection = sqlite_backend.restore_from_file(self.path, **kwargs)
+            return ModelSQLite([], connection=connection)
+
+    def test_snapshot_and_restore(self):
+        progress = list()
+        result = self.model.snapshot(
+            self.path, pages_per_step=1, progress=lambda *args: progress.append(args)
+        )
+        self.assertEqual(result["steps"], result["pages"])
+        self.assertEqual(progress[-1], (result["pages"], result["pages"]))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        replica = self.restore()
+        self.assertEqual(replica.read_items(), self.model.read_items())
+
+    def test_restored_replica_is_read_only(self):
+        self.model.snapshot(self.path)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.restore().create_item("beer", price=3.0, quantity=15)
+        self.restore(read_only=False).create_item("beer", price=3.0, quantity=15)
+
+    def test_snapshot_after_a_duplicate_insert(self):
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            self.model.create_item("bread", price=1.0, quantity=1)
+        # an INSERT left open would make the backup wait forever
+        t = threading.Thread(target=self.model.snapshot, args=(self.path,), daemon=True)
+        t.start()
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(names(self.restore().read_items()), ["bread", "milk", "wine"])
+
+
+class TestCheckpointer(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "checkpoint.db")
+
+    def model(self, checkpointer, items=()):
+        with captured_output():
+            return ModelSQLite(list(items), connection=checkpointer.connection)
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_checkpoint_after_max_changes(self):
+        checkpointer = Checkpointer(self.path, interval=60, max_changes=3, poll=0.01)
+        self.addCleanup(checkpointer.close)
+        model = self.model(checkpointer, mock.items())
+        self.wait_for(lambda: checkpointer.checkpoints == 1)
+        self.assertEqual(checkpointer.pending, 0)
+        model.update_item("milk", price=1.2, quantity=20)
+        time.sleep(0.1)
+        self.assertEqual(checkpointer.checkpoints, 1)
+        self.assertEqual(checkpointer.pending, 1)
+
+    def test_checkpoint_after_interval(self):
+        checkpointer = Checkpointer(
+            self.path, interval=0.1, max_changes=1000, poll=0.01
+        )
+        self.addCleanup(checkpointer.close)
+        self.model(checkpointer).create_item("beer", price=3.0, quantity=15)
+        self.wait_for(lambda: checkpointer.checkpoints == 1)
+        self.assertFalse(checkpointer.checkpoint())
+
+    def test_restart_from_the_last_checkpoint(self):
+        checkpointer = Checkpointer(self.path, interval=60)
+        self.assertFalse(checkpointer.restored)
+        model = self.model(checkpointer, mock.items())
+        model.delete_item("wine")
+        # close takes a last checkpoint
+        checkpointer.close()
+        checkpointer = Checkpointer(self.path, interval=60)
+        self.addCleanup(checkpointer.close)
+        self.assertTrue(checkpointer.restored)
+        self.assertEqual(
+            names(self.model(checkpointer).read_items()), ["bread", "milk"]
+        )
+
+
+def insert_worker(model, names):
+    for name in names:
+        model.create_item(name, price=1.0, quantity=10)
+
+
+class TestSingleWriter(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.writer = SingleWriter(os.path.join(tmp.name, "items"), n_clients=3)
+        self.addCleanup(self.writer.close)
+        self.model = self.writer.client(0)
+        with captured_output():
+            self.model.create_items(mock.items())
+
+    def test_failed_write_is_rolled_back_alone(self):
+        other = self.writer.client(1)
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            other.create_items(
+                [{"name": "beer", "price": 3.0, "quantity": 15}] + mock.items()
+            )
+        self.model.update_item("milk", price=1.2, quantity=20)
+        with captured_output():
+            items = self.model.read_items()
+        self.assertEqual(names(items), ["bread", "milk", "wine"])
+        self.assertEqual(price_and_quantity(other.read_item("milk")), (1.2, 20))
+
+    def test_writes_from_several_processes(self):
+        batches = [["item{}_{}".format(i, j) for j in range(20)] for i in (1, 2)]
+        processes = [
+            multiprocessing.Process(
+                target=insert_worker, args=(self.writer.client(i), batch)
+            )
+            for i, batch in zip((1, 2), batches)
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join(10)
+            self.assertEqual(p.exitcode, 0)
+        with captured_output():
+            self.assertEqual(self.model.count(), 43)
+
+
+class SlowReadsModel(Model):
+    """Model wrapper whose read_item takes delay seconds."""
+
+    def __init__(self, model, delay):
+        super().__init__()
+        self.model = model
+        self.delay = delay
+
+    @property
+    def item_type(self):
+        return self.model.item_type
+
+    def read_item(self, name):
+        time.sleep(self.delay)
+        return self.model.read_item(name)
+
+    def update_item(self, name, price, quantity):
+        self.model.update_item(name, price, quantity)
+
+
+class TestCoalescingModel(unittest.TestCase):
+    def setUp(self):
+        self.backend = sqlite_model(mock.items())
+        self.backend.enable_stats()
+        self.model = CoalescingModel(SlowReadsModel(self.backend, delay=0.2))
+
+    def read_calls(self):
+        return self.backend.stats()["read_item"]["calls"]
+
+    def read_concurrently(self, name, n):
+        barrier = threading.Barrier(n)
+        results = [None] * n
+
+        def read(i):
+            barrier.wait()
+            try:
+                results[i] = self.model.read_item(name)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=read, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_concurrent_reads_are_one_read(self):
+        results = self.read_concurrently("bread", 5)
+        self.assertEqual([price_and_quantity(x) for x in results], [(0.5, 20)] * 5)
+        self.assertEqual(self.read_calls(), 1)
+        self.assertEqual(self.model.coalesced, 4)
+        self.assertEqual(self.model.in_flight, 0)
+
+    def test_concurrent_readers_share_the_error(self):
+        results = self.read_concurrently("beer", 3)
+        self.assertTrue(all(isinstance(x, mvc_exc.ItemNotStored) for x in results))
+        self.assertEqual(self.read_calls(), 1)
+
+    def test_read_after_a_write_is_not_coalesced(self):
+        reader = threading.Thread(target=self.model.read_item, args=("bread",))
+        reader.start()
+        time.sleep(0.05)
+        self.model.update_item("bread", price=0.8, quantity=15)
+        # the read in flight may have started before the write
+        self.assertEqual(price_and_quantity(self.model.read_item("bread")), (0.8, 15))
+        reader.join()
+        self.assertEqual(self.read_calls(), 2)
+
+    def test_async_concurrent_reads_are_one_read(self):
+        model = AsyncCoalescingModel(AsyncModel(SlowModel(self.backend, delay=0.1)))
+
+        async def run():
+            return await asyncio.gather(*[model.read_item("bread") for _ in range(10)])
+
+        items = asyncio.run(run())
+        model.close()
+        self.assertEqual([x["price"] for x in items], [0.5] * 10)
+        self.assertEqual(self.read_calls(), 1)
+        self.assertEqual(model.coalesced, 9)
+
+
+class TestQueryLog(unittest.TestCase):
+    def test_empty_executemany_is_not_explained(self):
+        log = QueryLog(explain_all=True)
+        with captured_output():
+            conn = sqlite_backend.connect_to_db(query_log=log)
+        sqlite_backend.create_table(conn, "items")
+        sqlite_backend.update_many(conn, [], table_name="items")
+        stats = [s for k, s in log.statements().items() if k.startswith("UPDATE")]
+        self.assertEqual(stats[0]["calls"], 1)
+        self.assertIsNone(stats[0]["plan"])
+        conn.close()
+
+
+class TestAsyncController(unittest.TestCase):
+    def setUp(self):
+        self.out = StringIO()
+        self.model = AsyncModel(ModelBasic(mock.items()))
+        self.c = AsyncController(self.model, View(self.out), max_concurrency=2)
+
+    def tearDown(self):
+        self.c.close()
+        self.model.close()
+
+    def test_concurrent_requests(self):
+        async def run():
+            await asyncio.gather(
+                self.c.show_item("bread"),
+                self.c.insert_item("beer", price=3.0, quantity=15),
+                self.c.delete_item("fish"),
+            )
+
+        asyncio.run(run())
+        out = self.out.getvalue()
+        self.assertIn("we have some BREAD", out)
+        self.assertIn("just added some BEER", out)
+        self.assertIn("We don't have any FISH", out)
+        self.assertEqual(self.model.model.read_item("beer")["price"], 3.0)
+
+    def test_requests_from_a_second_event_loop(self):
+        async def run():
+            await asyncio.gather(*[self.c.show_item("bread") for _ in range(5)])
+
+        # each asyncio.run has its own loop; both have to wait for a slot
+        asyncio.run(run())
+        asyncio.run(run())
+        self.assertEqual(self.out.getvalue().count("'name': 'bread'"), 10)
+
+    def test_thread_local_models_run_in_parallel(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "items")
+        with captured_output():
+            ModelSQLite(mock.items(), connection=sqlite_backend.connect_to_db(path))
+
+        def slow_model():
+            connection = sqlite_backend.connect_to_db(path)
+            return SlowModel(ModelSQLite([], connection=connection), delay=0.2)
+
+        model = AsyncModel(ThreadLocalModel(slow_model))
+
+        async def run():
+            return await asyncio.gather(*[model.read_item("bread") for _ in range(4)])
+
+        t0 = time.monotonic()
+        with captured_output():
+            items = asyncio.run(run())
+        # one after the other, they would take 0.8 s
+        self.assertLess(time.monotonic() - t0, 0.6)
+        self.assertEqual([x["price"] for x in items], [0.5] * 4)
+        model.close()
+
+
+class TestChangeFeed(unittest.TestCase):
+    def setUp(self):
+        self.model = ChangeFeedModel(sqlite_model(mock.items()), max_changes=3)
+
+    def test_changes_since(self):
+        self.model.create_item("beer", price=3.0, quantity=15)
+        self.model.update_item("milk", price=1.5, quantity=10)
+        version, changes = self.model.changes_since(1)
+        self.assertEqual(version, 2)
+        self.assertEqual(
+            [(c.version, c.kind, c.name) for c in changes], [(2, "updated", "milk")]
+        )
+        self.assertEqual(changes[0].item["price"], 1.5)
+        self.assertEqual(self.model.changes_since(2), (2, []))
+
+    def test_discarded_changes_are_not_available(self):
+        for i in range(4):
+            self.model.update_item("milk", price=1.0, quantity=i)
+        with self.assertRaises(mvc_exc.ChangesNotAvailable):
+            self.model.changes_since(0)
+        with self.assertRaises(mvc_exc.ChangesNotAvailable):
+            self.model.changes_since(5)
+        self.assertEqual(len(self.model.changes_since(1)[1]), 3)
+
+    def test_failed_write_is_not_published(self):
+        with self.assertRaises(mvc_exc.ItemAlreadyStored):
+            self.model.create_item("bread", price=1.0, quantity=1)
+        self.assertEqual(self.model.version, 0)
+
+    def test_name_deleted_twice_is_one_change(self):
+        self.model.delete_items(["milk", "wine", "milk"])
+        version, changes = self.model.changes_since(0)
+        self.assertEqual(version, 2)
+        self.assertEqual([c.name for c in changes], ["milk", "wine"])
+
+    def test_incremental_view_renders_only_changes(self):
+        out = StringIO()
+        view = IncrementalView(out)
+        c = Controller(self.model, view)
+        version = c.show_changes()
+        self.model.update_item("milk", price=1.5, quantity=10)
+        self.model.delete_item("wine")
+        out.truncate(0)
+        out.seek(0)
+        self.assertEqual(c.show_changes(version), 2)
+        self.assertIn("milk", out.getvalue())
+        self.assertNotIn("bread", out.getvalue())
+        out.truncate(0)
+        out.seek(0)
+        view.show_cached_list(self.model.item_type)
+        self.assertIn("'price': 1.5", out.getvalue())
+        self.assertIn("bread", out.getvalue())
+        self.assertNotIn("wine", out.getvalue())
+
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_file = os.path.join(tmp.name, "state.json")
+        # not ModelBasic: all its instances share one list of items
+        self.backend = sqlite_model(mock.items())
+        self.source = ChangeFeedModel(self.backend)
+        self.target = sqlite_model([])
+
+    def assertInSync(self):
+        def by_name(model):
+            return {x["name"]: price_and_quantity(x) for x in model.read_items()}
+
+        self.assertEqual(by_name(self.target), by_name(self.source))
+
+    def test_full_copy_then_incremental(self):
+        status = replicate(self.source, self.target, state_file=self.state_file)
+        self.assertTrue(status.full_copy)
+        self.source.update_item("bread", price=1.0, quantity=5)
+        self.source.delete_item("milk")
+        status = replicate(self.source, self.target, state_file=self.state_file)
+        self.assertFalse(status.full_copy)
+        self.assertEqual((status.updated, status.deleted), (1, 1))
+        self.assertInSync()
+
+    def test_restarted_source_is_copied_again(self):
+        replicate(self.source, self.target, state_file=self.state_file)
+        for i in range(3):
+            self.source.create_item("item{}".format(i), price=1.0, quantity=i)
+        replicate(self.source, self.target, state_file=self.state_file)
+        # same items, but a new history: versions count from 0 again
+        self.source = ChangeFeedModel(self.backend)
+        for i in range(5):
+            self.source.update_item("item0", price=2.0, quantity=i)
+        self.source.delete_item("item2")
+        status = replicate(self.source, self.target, state_file=self.state_file)
+        self.assertTrue(status.full_copy)
+        self.assertEqual(status.epoch, self.source.epoch)
+        self.assertInSync()
+
+    def test_replicator_resumes_from_the_state_file(self):
+        Replicator(self.source, self.target, state_file=self.state_file).sync()
+        self.source.create_item("beer", price=3.0, quantity=15)
+        status = Replicator(self.source, self.target, state_file=self.state_file).sync()
+        self.assertFalse(status.full_copy)
+        self.assertEqual(status.created, 1)
+        self.source = ChangeFeedModel(self.backend)
+        self.source.create_item("cider", price=4.0, quantity=2)
+        self.source.delete_item("beer")
+        replicator = Replicator(self.source, self.target, state_file=self.state_file)
+        self.assertEqual(replicator.lag, 2)
+        self.assertTrue(replicator.sync().full_copy)
+        self.assertInSync()
+
+
 if __name__ == "__main__":
     unittest.main()